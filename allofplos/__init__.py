@@ -15,6 +15,18 @@ newarticledir = os.path.join(ALLOFPLOS_DIR_PATH, 'new_plos_articles')
 # List of uncorrected proof articles to check for updates
 uncorrected_proofs_text_list = os.path.join(ALLOFPLOS_DIR_PATH, 'uncorrected_proofs_list.txt')
 
+# Uncorrected proofs with their check history, for scheduling VOR update checks (see `allofplos.corpus.proofs`)
+uncorrected_proofs_state = os.path.join(ALLOFPLOS_DIR_PATH, 'uncorrected_proofs.json')
+
+# HTTP validators (ETag, Last-Modified, content hash) of remote article files, for conditional requests
+xml_validators_cache = os.path.join(ALLOFPLOS_DIR_PATH, 'xml_validators.json')
+
+# Persistent cache of article property values (see `allofplos.field_cache`)
+field_cache_path = os.path.join(ALLOFPLOS_DIR_PATH, 'field_cache.db')
+
+# Sorted snapshot of the DOIs of every article indexed by Solr (see `allofplos.corpus.snapshot`)
+solr_dois_snapshot = os.path.join(ALLOFPLOS_DIR_PATH, 'solr_dois.json.gz')
+
 def get_corpus_dir():
     """If you want to set the corpus directory, assign the desired path to 
     ``os.environ['PLOS_CORPUS']``.
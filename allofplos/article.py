@@ -1,5 +1,8 @@
 import datetime
+import functools
 import os
+from collections import namedtuple
+from io import BytesIO
 import re
 import subprocess
 
@@ -11,16 +14,232 @@ from . import get_corpus_dir
 from .transformations import (filename_to_doi, _get_base_page, LANDING_PAGE_SUFFIX,
                               URL_SUFFIX, plos_page_dict, doi_url, doi_to_url, doi_to_path)
 from .plos_regex import validate_doi
+from .plos_xpath import XPATHS, get_xpath
 from .elements import (parse_article_date, get_contrib_info,
                        Journal, License, match_contribs_to_dicts)
-from .utils import dedent
+from .packed import is_packed, open_packed
+from .utils import dedent, memoized_property
+
+
+def parse_front(source):
+    """Parse an article XML file only up to the end of its <front> element.
+
+    Uses `lxml.etree.iterparse` and stops reading as soon as `</front>` is reached.
+    Anything after <front> that the parser already started building is removed.
+    If the file has no <front> element, the whole file is parsed.
+    :param source: filename or file-like object of the article XML
+    :returns: element tree with the root <article> element and its <front>
+    :rtype: {lxml.etree._ElementTree-class}
+    """
+    context = et.iterparse(source, events=('end',), tag='front')
+    for _, front in context:
+        root = front.getparent()
+        while front.getnext() is not None:
+            root.remove(front.getnext())
+        return front.getroottree()
+    return context.root.getroottree()
+
+
+# fields that `Article.extract()` gets in one pass over the article's front matter
+EXTRACT_FIELDS = ('doi', 'filename', 'journal', 'title', 'abstract', 'type_', 'plostype', 'dtd',
+                  'proof', 'dates', 'pubdate', 'revdate', 'counts', 'related_dois', 'amendment',
+                  'taxonomy', 'word_count')
+
+
+@functools.lru_cache(maxsize=None)
+def _record_type(fields):
+    """Namedtuple class for the records returned by `Article.extract()` for these fields.
+
+    Created once per tuple of fields. The class isn't importable by name, so records are
+    pickled as their fields and values (e.g., to send them between `Corpus.map()` processes).
+    """
+    record_type = namedtuple('ArticleRecord', fields)
+    record_type.__reduce__ = lambda record: (_make_record, (record._fields, tuple(record)))
+    return record_type
+
+
+def _make_record(fields, values):
+    return _record_type(fields)(*values)
+
+
+def _title_text(title_elements):
+    """Plain-text article title from the <article-title> elements, whitespace collapsed."""
+    title_text = et.tostring(title_elements[0], encoding='unicode', method='text', pretty_print=True)
+    return " ".join(title_text.split())
+
+
+def _abstract_text(abstract_elements):
+    """Plain-text abstract from the attribute-less <abstract> elements, or None if there are none."""
+    if not abstract_elements:
+        return None
+    assert len(abstract_elements) == 1
+    abstract_text = et.tostring(abstract_elements[0][0], encoding='unicode', method='text')
+    # clean up text: rem white space, new line marks, blank lines
+    abstract_text = abstract_text.strip().replace('  ', '')
+    return os.linesep.join([s for s in abstract_text.splitlines() if s])
+
+
+def _plos_article_type(article_categories):
+    """PLOS article type from the 'heading' subject group of the <article-categories> element."""
+    subject_list = article_categories.getchildren()
+    for i, subject in enumerate(subject_list):
+        if subject.get('subj-group-type') == "heading":
+            subject_instance = subject_list[i][0]
+            s = ''
+            for text in subject_instance.itertext():
+                s = s + text
+                plos_article_type = s
+    return plos_article_type
+
+
+def _subject_dict(article_categories):
+    """Subject groups of the <article-categories> element, mapped to tuples of their subjects."""
+    subjs_dict = {}
+    for subj in article_categories.getchildren():
+        try:
+            sbjindex = subj.values()[0].strip()
+            if sbjindex in subjs_dict:
+                subjs_dict[sbjindex].append(tuple(e.text for e in subj.iter('subject')))
+            else:
+                subjs_dict[sbjindex] = [tuple(e.text for e in subj.iter('subject'))]
+        except IndexError:
+            if 'No subject' in subjs_dict:
+                subjs_dict['No subject'].append(tuple(e.text for e in
+                                             subj.iter('subject')))
+            else:
+                subjs_dict['No subject'] = [tuple(e.text for e in
+                                             subj.iter('subject'))]
+    return subjs_dict
+
+
+def _dtd_version(article_element, doi):
+    """Document Type Definition from the dtd-version attribute of the root <article> element."""
+    try:
+        dtd = article_element.attrib['dtd-version']
+        if str(dtd) == '3.0':
+            dtd = 'NLM 3.0'
+        elif dtd == '1.1d3':
+            dtd = 'JATS 1.1d3'
+    except KeyError:
+        print('Error parsing DTD from', doi)
+        dtd = 'N/A'
+    return dtd
+
+
+def _proof_status(meta_values):
+    """Proof status from the custom <meta-value> elements of the front matter."""
+    proof = ''
+    for result in meta_values:
+        if result.text == 'uncorrected-proof':
+            proof = 'uncorrected_proof'
+        elif result.text == 'vor-update-to-uncorrected-proof':
+            proof = 'vor_update'
+    return proof
+
+
+def _article_dates(pub_dates, histories, custom_metas, proof, doi):
+    """Dictionary of date types mapped to datetime objects. See `Article.get_dates()`.
+
+    :param pub_dates: <pub-date> elements
+    :param histories: <history> elements
+    :param custom_metas: <custom-meta> elements, for the date of a VOR update
+    :param proof: proof status of the article
+    :param doi: DOI of the article, for error messages
+    """
+    dates = {}
+    # first location is where pubdate and date added to collection are
+    for element in pub_dates:
+        pub_type = element.get('pub-type')
+        try:
+            date = parse_article_date(element)
+        except ValueError:
+            print('Error getting pubdates for {}'.format(doi))
+            date = ''
+        dates[pub_type] = date
+
+    # second location is where historical dates are, including submission and acceptance
+    for element in histories:
+        for part in element:
+            date_type = part.get('date-type')
+            try:
+                date = parse_article_date(part)
+            except ValueError:
+                print('Error getting history dates for {}'.format(doi))
+                date = ''
+            dates[date_type] = date
+
+    # third location is for vor updates when it's updated (see `Article.proof`)
+    rev_date = ''
+    if proof == 'vor_update':
+        for result in custom_metas:
+            if XPATHS['meta_name'](result)[0].text == 'Publication Update':
+                rev_date_string = XPATHS['meta_value'](result)[0].text
+                rev_date = datetime.datetime.strptime(rev_date_string, '%Y-%m-%d')
+                break
+    dates['updated'] = rev_date
+    return dates
+
+
+def _related_article_dict(related_article_elements):
+    """Related DOIs from the <related-article> elements, by related-article-type."""
+    related_article_dict = {}
+    for elem in related_article_elements:
+        related_doi = elem.attrib
+        related_article = related_doi['{http://www.w3.org/1999/xlink}href']
+        related_article = related_article.lstrip('info:doi/')
+        if not related_article_dict.get(elem.attrib['related-article-type'], None):
+            # begin building the list of DOIs with that related-article-type
+            related_article_dict[elem.attrib['related-article-type']] = [related_article]
+        else:
+            # there is more than one article with the same related-article-type
+            related_article_dict[elem.attrib['related-article-type']].append(related_article)
+    return related_article_dict
+
+
+def _related_doi_list(related_doi_dict, type_, doi):
+    """Flatten related DOIs to a list. See `Article.related_dois`."""
+    doi_list = []
+    if type_ in ['correction', 'retraction', 'expression-of-concern']:
+        # only use certain keys if an amendment article
+        if type_ == 'correction':
+            attrib_name = 'corrected-article'
+        elif type_ == 'retraction':
+            attrib_name = 'retracted-article'
+        elif type_ == 'expression-of-concern':
+            attrib_name = 'object-of-concern'
+        for k, v in related_doi_dict.items():
+            if k == attrib_name:
+                doi_list = v
+                break
+        if not doi_list:
+            doi_list = sum(related_doi_dict.values(), [])
+            print('{} has incorrect related_doi field attribute'.format(doi))
+
+    else:
+        # flatten all dict values if not an amendment article
+        for k, v in related_doi_dict.items():
+            doi_list.extend(v)
+    return doi_list
+
+
+def _count_dict(count_elements):
+    """Counts from the <counts> elements of the front matter, by tag (e.g., 'fig-count')."""
+    counts = {}
+    for count_element in count_elements:
+        for count_item in count_element:
+            count = count_item.get('count')
+            count_type = count_item.tag
+            counts[count_type] = int(count)
+    if len(counts) > 3:  # this shouldn't happen
+        print(counts)
+    return counts
 
 
 class Article:
     """The primary object of a PLOS article, initialized by a valid PLOS DOI.
 
     """
-    def __init__(self, doi, directory=None):
+    def __init__(self, doi, directory=None, front_only=False, memoize=True, field_cache=None):
         """Creation of an article object.
 
         Usage:
@@ -36,9 +255,21 @@ class Article:
         :type doi: str
         :param directory: where the local article XML file is located, defaults to None
         :type directory: str, optional
+        :param front_only: only parse the <front> of the article XML until a property needs
+        <body> or <back>, defaults to False. See `front_tree`.
+        :type front_only: bool, optional
+        :param memoize: store the value of each metadata property after it is first computed,
+        defaults to True. See `reset_memoized_attrs()`.
+        :type memoize: bool, optional
+        :param field_cache: persistent store of property values to read them from before
+        parsing the XML, and to store them in, defaults to None. See `allofplos.field_cache`.
+        :type field_cache: FieldCache, optional
         """
+        self.memoize = memoize
+        self.field_cache = field_cache
         self.doi = doi
         self.directory = directory if directory else get_corpus_dir()
+        self.front_only = front_only
         self.reset_memoized_attrs()
         self._editor = None
     
@@ -55,10 +286,10 @@ class Article:
         :param exclude_refs: remove references from the article tree (eases print viewing)
         """
         parser = et.XMLParser(remove_blank_text=True)
-        tree = et.parse(self.filename, parser)
+        tree = et.parse(self._xml_source(), parser)
         if exclude_refs:
             root = tree.getroot()
-            back = tree.xpath('./back')
+            back = XPATHS['back'](tree)
             if back:
                 root.remove(back[0])
         local_xml = et.tostring(tree,
@@ -109,10 +340,28 @@ class Article:
         For article attributes that are memoized and specific to that particular article
         (including the XML tree and whether the xml file is in the local directory),
         reset them when creating a new article object.
+        This includes the values of every metadata property (e.g., `title` and `dates`),
+        which are stored in `self._cache` unless `self.memoize` is False. With a
+        `self.field_cache`, values are also looked up in and saved to that persistent cache.
         """
         self._tree = None
+        self._front_tree = None
         self._local = None
-        self._contributors = None
+        if self.field_cache is None:
+            self._cache = {}
+        else:
+            self._cache = self.field_cache.fields(self)
+
+    def release_tree(self):
+        """Free the parsed XML of the article, and reset its memoized attributes.
+
+        Clears the root element, so the memory of the whole tree is released right away
+        even if something still refers to the tree or one of its elements.
+        """
+        for tree in (self._tree, self._front_tree):
+            if tree is not None:
+                tree.getroot().clear()
+        self.reset_memoized_attrs()
 
     @property
     def doi(self):
@@ -210,25 +459,125 @@ class Article:
 
         Defaults to reading the element location for uncorrected proofs/versions of record
         The basis of every method and property looking for particular metadata fields
-        :param article_root: the xml file for a single article
-        :param tag_path_elements: xpath location in the XML tree of the article file
+        Uses the precompiled XPath of a name in `plos_xpath.xpath_paths`; other locations are
+        compiled on first use and cached (see `plos_xpath.get_xpath()`).
+        :param tag_path_elements: name of a precompiled XPath (e.g., 'title'), XPath location
+        string, or sequence of tags to join into one (e.g., ('/', 'article', 'front')),
+        defaults to 'proof'
         :param remote: whether using the remote XML in self.remote_tree (defaults to False)
         :return: list of elements in the article with that xpath location
         """
         if tag_path_elements is None:
-            tag_path_elements = ('/',
-                                 'article',
-                                 'front',
-                                 'article-meta',
-                                 'custom-meta-group',
-                                 'custom-meta',
-                                 'meta-value')
-        tag_location = '/'.join(tag_path_elements)
+            tag_path_elements = 'proof'
+        elif not isinstance(tag_path_elements, str):
+            tag_path_elements = '/'.join(tag_path_elements)
         if remote:
             root = self.remote_tree.getroot()
         else:
             root = self.root
-        return root.xpath(tag_location)
+        return get_xpath(tag_path_elements)(root)
+
+    def extract(self, fields=EXTRACT_FIELDS):
+        """Get several fields of the article at once, walking its front matter only once.
+
+        Each field has the same value as the article attribute of that name, but instead of
+        one XPath query from the root per attribute (and per attribute they depend on), the
+        children of <article-meta> are sorted by tag in a single pass and each field is
+        computed from those elements. Fields not in `EXTRACT_FIELDS` are read from the attribute.
+        The XML is only parsed if a field isn't already memoized (see `memoize`) or in the
+        `field_cache`, which is used even if `memoize` is False.
+        Usage: `article.extract(['title', 'pubdate', 'counts']).pubdate`
+        :param fields: names of the fields to get, defaults to `EXTRACT_FIELDS`
+        :return: namedtuple of the values of `fields`, in that order
+        """
+        fields = tuple(fields)
+        if self.memoize:
+            # shares the cache of the memoized properties, which have the same values
+            values = self._cache
+        elif self.field_cache is not None:
+            # still read from and stored in the persistent cache, but not kept on the article
+            values = self.field_cache.fields(self)
+        else:
+            values = {}
+        elements = {}
+
+        def front_elements(tag):
+            """Children of <article-meta> with this tag, sorted out on first use."""
+            if not elements:
+                elements.update((name, []) for name in ('title-group', 'abstract',
+                                                        'article-categories', 'pub-date', 'history',
+                                                        'custom-meta-group', 'counts',
+                                                        'related-article'))
+                article_meta = XPATHS['article_meta'](self.root)
+                for element in (article_meta[0] if article_meta else ()):
+                    if element.tag in elements:
+                        elements[element.tag].append(element)
+                # same as the abstract XPath in `self.abstract`
+                elements['abstract'] = [element for element in elements['abstract']
+                                        if not element.attrib]
+                elements['custom-meta'] = [custom_meta for group in elements['custom-meta-group']
+                                           for custom_meta in group.findall('custom-meta')]
+            return elements[tag]
+
+        def journal():
+            if 'annotation' not in self.doi:
+                return Journal.doi_to_journal(self.doi)
+            return str(Journal(XPATHS['journal_meta'](self.root)[0]))
+
+        def abstract():
+            abstract_text = _abstract_text(front_elements('abstract'))
+            if abstract_text is None:
+                if value('type_') == 'research-article' and value('plostype') == 'Research Article':
+                    print('No abstract found for research article {}'.format(self.doi))
+                abstract_text = ''
+            return abstract_text
+
+        getters = {
+            'doi': lambda: self.doi,
+            'filename': lambda: self.filename,
+            'journal': journal,
+            'title': lambda: _title_text([title for group in front_elements('title-group')
+                                          for title in group.findall('article-title')]),
+            'abstract': abstract,
+            'type_': lambda: self.root.attrib['article-type'],
+            'plostype': lambda: _plos_article_type(front_elements('article-categories')[0]),
+            'dtd': lambda: _dtd_version(self.root, self.doi),
+            'proof': lambda: _proof_status([meta_value for custom_meta in front_elements('custom-meta')
+                                            for meta_value in custom_meta.findall('meta-value')]),
+            'dates': lambda: _article_dates(front_elements('pub-date'), front_elements('history'),
+                                            front_elements('custom-meta'), value('proof'), self.doi),
+            'pubdate': lambda: value('dates')['epub'],
+            'revdate': lambda: value('dates')['updated'],
+            'counts': lambda: self._add_body_counts(_count_dict(front_elements('counts'))),
+            'related_dois': lambda: _related_doi_list(_related_article_dict(front_elements('related-article')),
+                                                      value('type_'), self.doi),
+            'amendment': lambda: value('type_') in ['correction', 'retraction', 'expression-of-concern'],
+            'taxonomy': lambda: _subject_dict(front_elements('article-categories')[0]),
+            'word_count': lambda: self.word_count,
+        }
+
+        def value(field):
+            try:
+                return values[field]
+            except KeyError:
+                getter = getters.get(field)
+                values[field] = getter() if getter else getattr(self, field)
+                return values[field]
+
+        return _record_type(fields)(*(value(field) for field in fields))
+
+    @memoized_property
+    def dates(self):
+        """All of an article's dates, including publication date (pubdate), submission date.
+
+        See `get_dates()` for a copy that can be modified, or for dates as strings.
+        :return: dict of date types mapped to datetime objects for that article
+        :rtype: {dict}
+        """
+        pub_dates = self.get_element_xpath('pub_dates')
+        histories = self.get_element_xpath('history')
+        custom_metas = self.get_element_xpath('custom_meta')
+        return _article_dates(pub_dates, histories, custom_metas, self.proof, self.doi)
 
     def get_dates(self, string_=False, string_format='%Y-%m-%d'):
         """For an individual article, get all of its dates, including publication date (pubdate), submission date.
@@ -239,58 +588,7 @@ class Article:
         :return: dict of date types mapped to datetime objects for that article
         :rtype: {dict}
         """
-        dates = {}
-        # first location is where pubdate and date added to collection are
-        tag_path_1 = ["/",
-                      "article",
-                      "front",
-                      "article-meta",
-                      "pub-date"]
-        element_list_1 = self.get_element_xpath(tag_path_elements=tag_path_1)
-        for element in element_list_1:
-            pub_type = element.get('pub-type')
-            try:
-                date = parse_article_date(element)
-            except ValueError:
-                print('Error getting pubdates for {}'.format(self.doi))
-                date = ''
-            dates[pub_type] = date
-
-        # second location is where historical dates are, including submission and acceptance
-        tag_path_2 = ["/",
-                      "article",
-                      "front",
-                      "article-meta",
-                      "history"]
-        element_list_2 = self.get_element_xpath(tag_path_elements=tag_path_2)
-        for element in element_list_2:
-            for part in element:
-                date_type = part.get('date-type')
-                try:
-                    date = parse_article_date(part)
-                except ValueError:
-                    print('Error getting history dates for {}'.format(self.doi))
-                    date = ''
-                dates[date_type] = date
-
-        # third location is for vor updates when it's updated (see `proof(self)`)
-        rev_date = ''
-        if self.proof == 'vor_update':
-            tag_path = ('/',
-                        'article',
-                        'front',
-                        'article-meta',
-                        'custom-meta-group',
-                        'custom-meta')
-            xpath_results = self.get_element_xpath(tag_path_elements=tag_path)
-            for result in xpath_results:
-                if result.xpath('./meta-name')[0].text == 'Publication Update':
-                    rev_date_string = result.xpath('./meta-value')[0].text
-                    rev_date = datetime.datetime.strptime(rev_date_string, '%Y-%m-%d')
-                    break
-                else:
-                    pass
-        dates['updated'] = rev_date
+        dates = dict(self.dates)
 
         if string_:
             # can return dates as strings instead of datetime objects if desired
@@ -308,7 +606,7 @@ class Article:
         :return: if dates are in right order or not
         :rtype: bool
         """
-        dates = self.get_dates()
+        dates = self.dates
         if dates.get('received', '') and dates.get('accepted', ''):
             if dates['received'] <= dates['accepted'] <= dates['epub']:
                 order_correct = True
@@ -329,20 +627,20 @@ class Article:
 
         return order_correct
 
-    @property
+    @memoized_property
     def volume(self):
         """Volume of the article."""
-        return int(self.root.xpath('/article/front/article-meta/volume')[0].text)
+        return int(self.get_element_xpath('volume')[0].text)
 
-    @property
+    @memoized_property
     def issue(self):
         """Issue of the article."""
-        return int(self.root.xpath('/article/front/article-meta/issue')[0].text)
+        return int(self.get_element_xpath('issue')[0].text)
 
-    @property
+    @memoized_property
     def elocation(self):
         """Elocation ID of the article."""
-        return self.root.xpath('/article/front/article-meta/elocation-id')[0].text
+        return self.get_element_xpath('elocation')[0].text
 
     def get_aff_dict(self):
         """For a given PLOS article, get list of contributor-affiliated institutions.
@@ -353,11 +651,7 @@ class Article:
         :returns: Dictionary of footnote ids to institution information
         :rtype: {dict}
         """
-        tags_to_aff = ["/",
-                       "article",
-                       "front",
-                       "article-meta"]
-        article_aff_elements = self.get_element_xpath(tag_path_elements=tags_to_aff)
+        article_aff_elements = self.get_element_xpath('article_meta')
         aff_dict = {}
         aff_elements = [el
                         for aff_element in article_aff_elements
@@ -387,12 +681,7 @@ class Article:
         :returns: Dictionary of footnote ids to institution information
         :rtype: {dict}
         """
-        tags_to_fn = ["/",
-                      "article",
-                      "front",
-                      "article-meta",
-                      "author-notes"]
-        article_fn_elements = self.get_element_xpath(tag_path_elements=tags_to_fn)
+        article_fn_elements = self.get_element_xpath('author_notes')
         fn_dict = {}
         fn_elements = [el
                        for fn_element in article_fn_elements
@@ -423,13 +712,8 @@ class Article:
         :return: dictionary of rid or author initials mapped to list of email address(es)
         :rtype: {dict}
         """
-        tag_path = ["/",
-                    "article",
-                    "front",
-                    "article-meta",
-                    "author-notes"]
         try:
-            author_notes_element = self.get_element_xpath(tag_path_elements=tag_path)[0]
+            author_notes_element = self.get_element_xpath('author_notes')[0]
         except IndexError:
             # no emails found
             return {}
@@ -521,13 +805,8 @@ class Article:
         if self.type_ in ['correction', 'retraction', 'expression-of-concern']:
             # these article types don't have proper 'authors'
             return {}
-        tag_path = ["/",
-                    "article",
-                    "front",
-                    "article-meta",
-                    "author-notes"]
         try:
-            author_notes_element = self.get_element_xpath(tag_path_elements=tag_path)[0]
+            author_notes_element = self.get_element_xpath('author_notes')[0]
         except IndexError:
             return {}
         author_contributions = {}
@@ -578,6 +857,15 @@ class Article:
 
     def get_contributors_info(self):
         """Get and organize information about each contributor for an article.
+
+        Same as `self.contributors`.
+        :returns: dictionary of metadata for each <contrib> element
+        :rtype: list of dicts
+        """
+        return self.contributors
+
+    def _get_contributors_info(self):
+        """Get and organize information about each contributor for an article.
         This includes both authors and editors of the article.
         This function both creates article-level dictionaries of contributor information,
         as well as parses individual <contrib> elements. It reconciles the dicts together
@@ -602,13 +890,7 @@ class Article:
         credit_dict = self.get_contributions_dict()
 
         # get list of contributor elements (one per contributor)
-        tag_path = ["/",
-                    "article",
-                    "front",
-                    "article-meta",
-                    "contrib-group",
-                    "contrib"]
-        contrib_list = self.get_element_xpath(tag_path_elements=tag_path)
+        contrib_list = self.get_element_xpath('contribs')
         contrib_dict_list = []
 
         error_printed = False
@@ -739,28 +1021,8 @@ class Article:
         :return: dictionary of related DOIs
         :rtype: dict
         """
-        related_article_elements = self.get_element_xpath(tag_path_elements=["/",
-                                                                             "article",
-                                                                             "front",
-                                                                             "article-meta",
-                                                                             "related-article"])
-        related_article_dict = {}
-
-        if related_article_elements:
-            for elem in related_article_elements:
-                related_doi = elem.attrib
-                related_article = related_doi['{http://www.w3.org/1999/xlink}href']
-                related_article = related_article.lstrip('info:doi/')
-                if not related_article_dict.get(elem.attrib['related-article-type'], None):
-                    # begin building the list of DOIs with that related-article-type
-                    related_article_dict[elem.attrib['related-article-type']] = [related_article]
-                else:
-                    # there is more than one article with the same related-article-type
-                    related_article_dict[elem.attrib['related-article-type']].append(related_article)
-        else:
-            # no related articles exist
-            pass
-        return related_article_dict
+        related_article_elements = self.get_element_xpath('related_articles')
+        return _related_article_dict(related_article_elements)
 
     def check_if_link_works(self):
         """See if a link is valid (i.e., returns a '200' to the HTML request).
@@ -820,8 +1082,10 @@ class Article:
         """
         if self._tree is None:
             if self.local:
-                local_element_tree = et.parse(self.filename)
+                local_element_tree = et.parse(self._xml_source())
                 self._tree = local_element_tree
+                # the full tree supersedes any partial tree parsed before
+                self._front_tree = None
             else:
                 print("Local article file not found: {}".format(self.filename))
                 return None
@@ -829,10 +1093,36 @@ class Article:
             pass
         return self._tree
 
+    @property
+    def front_tree(self):
+        """The element tree of an article's local XML file, parsed only up to the end of <front>.
+
+        Stops reading the file at `</front>`, so <body> and <back> (usually most of the file)
+        are never parsed. The root <article> element keeps its attributes, so article-level
+        XPaths (e.g., for `type_` and `dtd`) still work. If the full tree has already been
+        parsed, returns that instead.
+        After accessing front_tree for the first time, it stores as an attribute
+        :returns: article's element tree, containing only <front>
+        :rtype: {lxml.etree._ElementTree-class} or None
+        """
+        if self._tree is not None:
+            return self._tree
+        if self._front_tree is None:
+            if self.local:
+                self._front_tree = parse_front(self._xml_source())
+            else:
+                print("Local article file not found: {}".format(self.filename))
+                return None
+        return self._front_tree
+
     @property
     def root(self):
         """Get the root (base) element of an article.
+
+        If `self.front_only` is True, this is the root of `self.front_tree`.
         """
+        if self.front_only:
+            return self.front_tree.getroot()
         return self.tree.getroot()
 
     def get_page(self, page_type='article'):
@@ -865,37 +1155,19 @@ class Article:
         """
         return self.get_page(page_type='assetXMLFile')
 
-    @property
+    @memoized_property
     def taxonomy(self):
         """Taxonomy information. For a complete list of subject areas see
         https://github.com/PLOS/plos-thesaurus
         """
-        tag_path_elements = ('/',
-                             'article',
-                             'front',
-                             'article-meta',
-                             'article-categories')
-        e_list = self.get_element_xpath(tag_path_elements=tag_path_elements)
-        subjs_dict = {}
-        for subj in e_list[0].getchildren():
-            try:
-                sbjindex = subj.values()[0].strip()
-                if sbjindex in subjs_dict:
-                    subjs_dict[sbjindex].append(tuple(e.text for e in subj.iter('subject')))
-                else:
-                    subjs_dict[sbjindex] = [tuple(e.text for e in subj.iter('subject'))]
-            except IndexError:
-                if 'No subject' in subjs_dict:
-                    subjs_dict['No subject'].append(tuple(e.text for e in
-                                                 subj.iter('subject')))
-                else:
-                    subjs_dict['No subject'] = [tuple(e.text for e in
-                                                 subj.iter('subject'))]
-        return subjs_dict
+        e_list = self.get_element_xpath('article_categories')
+        return _subject_dict(e_list[0])
 
     @property
     def filename(self):
         """The path on the local file system to a given article's XML file
+
+        For an article in a packed corpus, the path it would have if the container were a directory.
         """
         if 'annotation' in self.doi:
             article_path = os.path.join(self.directory, 'plos.correction.' + self.doi.split('/')[-1] + '.xml')
@@ -903,6 +1175,17 @@ class Article:
             article_path = os.path.join(self.directory, self.doi.lstrip('10.1371/') + '.xml')
         return article_path
 
+    @property
+    def packed(self):
+        """Whether the article's directory is a packed corpus file. See `allofplos.packed`."""
+        return is_packed(self.directory)
+
+    def _xml_source(self):
+        """What to parse the local XML from: the article file, or its bytes from a packed corpus."""
+        if self.packed:
+            return BytesIO(open_packed(self.directory).read(self.doi))
+        return self.filename
+
     @property
     def local(self):
         """Boolean of whether the article is stored locally or not.
@@ -910,12 +1193,15 @@ class Article:
         Stored as attribute after first access
         """
         if self._local is None:
-            self._local = os.path.isfile(self.filename)
+            if self.packed:
+                self._local = self.doi in open_packed(self.directory)
+            else:
+                self._local = os.path.isfile(self.filename)
         else:
             pass
         return self._local
 
-    @property
+    @memoized_property
     def proof(self):
         """
         For a single article in a directory, check whether it is an 'uncorrected proof' or a
@@ -923,14 +1209,7 @@ class Article:
         :return: proof status if it exists
         :rtype: str
         """
-        xpath_results = self.get_element_xpath()
-        proof = ''
-        for result in xpath_results:
-            if result.text == 'uncorrected-proof':
-                proof = 'uncorrected_proof'
-            elif result.text == 'vor-update-to-uncorrected-proof':
-                proof = 'vor_update'
-        return proof
+        return _proof_status(self.get_element_xpath())
 
     @property
     def remote_proof(self):
@@ -939,14 +1218,7 @@ class Article:
         'VOR update' to the uncorrected proof, or neither.
         :return: proof status if it exists; otherwise, None
         """
-        xpath_results = self.get_element_xpath(remote=True)
-        proof = ''
-        for result in xpath_results:
-            if result.text == 'uncorrected-proof':
-                proof = 'uncorrected_proof'
-            elif result.text == 'vor-update-to-uncorrected-proof':
-                proof = 'vor_update'
-        return proof
+        return _proof_status(self.get_element_xpath(remote=True))
 
     @property
     def remote_tree(self):
@@ -958,7 +1230,7 @@ class Article:
         """
         return et.parse(self.url)
 
-    @property
+    @memoized_property
     def journal(self):
         """Journal that an article was published in.
         Can be PLOS Biology, Medicine, Neglected Tropical Diseases, Pathogens,
@@ -969,27 +1241,20 @@ class Article:
         if 'annotation' not in self.doi:
             journal = Journal.doi_to_journal(self.doi)
         else:
-            journal_meta = self.root.xpath('/article/front/journal-meta')[0]
+            journal_meta = self.get_element_xpath('journal_meta')[0]
             journal = str(Journal(journal_meta))
         return journal
 
-    @property
+    @memoized_property
     def title(self):
         """For an individual PLOS article, get its title.
 
         :return: string of article title at specified xpath location
         """
-        title = self.get_element_xpath(tag_path_elements=["/",
-                                                          "article",
-                                                          "front",
-                                                          "article-meta",
-                                                          "title-group",
-                                                          "article-title"])
-        title_text = et.tostring(title[0], encoding='unicode', method='text', pretty_print=True)
-        title_cleaned = " ".join(title_text.split())
-        return title_cleaned
+        title = self.get_element_xpath('title')
+        return _title_text(title)
 
-    @property
+    @memoized_property
     def rich_title(self):
         """For an individual PLOS article, get its title with HTML formatting.
 
@@ -1007,7 +1272,7 @@ class Article:
         """
         root = self.root
         objectify.deannotate(root, cleanup_namespaces=True, xsi_nil=True)
-        art_title = root.xpath("/article/front/article-meta/title-group/article-title")
+        art_title = XPATHS['title'](root)
         art_title = art_title[0]
         try:
             text = art_title.text
@@ -1033,8 +1298,7 @@ class Article:
         :returns: article publication date
         :rtype: {datetime.datetime}
         """
-        dates = self.get_dates()
-        return dates['epub']
+        return self.dates['epub']
 
     @property
     def revdate(self):
@@ -1043,31 +1307,25 @@ class Article:
         :returns: article revision date
         :rtype: {datetime.datetime}
         """
-        dates = self.get_dates()
-        return dates['updated']
+        return self.dates['updated']
 
-    @property
+    @memoized_property
     def license(self):
         """Return dictionary of CC license information from the license field."""
-        permissions = self.root.xpath('/article/front/article-meta/permissions')[0]
+        permissions = self.get_element_xpath('permissions')[0]
         return dict(License(permissions, self.doi))
 
-    @property
+    @memoized_property
     def contributors(self):
         """ List of contributors to an article.
 
         Including authors and editors
-        Stores as attribute after first access
         :returns: list of dictionaries for each contributor
         :rtype: {list}
         """
-        if self._contributors is None:
-            self._contributors = self.get_contributors_info()
-        else:
-            pass
-        return self._contributors
+        return self._get_contributors_info()
 
-    @property
+    @memoized_property
     def authors(self):
         """List of authors of an article. Including contributing and corresponding.
 
@@ -1076,14 +1334,14 @@ class Article:
         contributors = self.contributors
         return [contrib for contrib in contributors if contrib.get('contrib_type', None) == 'author']
 
-    @property
+    @memoized_property
     def corr_author(self):
         """List of corresponding authors of an article.
         """
         contributors = self.contributors
         return [contrib for contrib in contributors if contrib.get('author_type', None) == 'corresponding']
 
-    @property
+    @memoized_property
     def editor(self):
         """The editor on the article.
 
@@ -1092,7 +1350,7 @@ class Article:
         contributors = self.contributors
         return [contrib for contrib in contributors if contrib.get('contrib_type', None) == 'editor']
 
-    @property
+    @memoized_property
     def emails(self):
         """List of emails of corresponding author(s).
         Unlike get_corr_author_emails() dict, it does not differentiate by author.
@@ -1113,59 +1371,35 @@ class Article:
         """
         return '; '.join(self.emails)
 
-    @property
+    @memoized_property
     def type_(self):
         """For an article file, get its JATS article type.
 
         Used primarily to find Correction (and thereby corrected) articles
         :return: JATS article_type at that xpath location
         """
-        type_element_list = self.get_element_xpath(tag_path_elements=["/",
-                                                                      "article"])
+        type_element_list = self.get_element_xpath('article')
         return type_element_list[0].attrib['article-type']
 
-    @property
+    @memoized_property
     def plostype(self):
         """For an article file, get its PLOS article type.
 
         This format is less standardized than the JATS article type (self.type_)
         :return: PLOS article_type at that xpath location
         """
-        article_categories = self.get_element_xpath(tag_path_elements=["/",
-                                                                       "article",
-                                                                       "front",
-                                                                       "article-meta",
-                                                                       "article-categories"])
-        subject_list = article_categories[0].getchildren()
-
-        for i, subject in enumerate(subject_list):
-            if subject.get('subj-group-type') == "heading":
-                subject_instance = subject_list[i][0]
-                s = ''
-                for text in subject_instance.itertext():
-                    s = s + text
-                    plos_article_type = s
-        return plos_article_type
+        article_categories = self.get_element_xpath('article_categories')
+        return _plos_article_type(article_categories[0])
 
-    @property
+    @memoized_property
     def dtd(self):
         """Document Type Definition for an article.
         For more information on these DTD tagsets, see https://jats.nlm.nih.gov/1.1d3/ and https://dtd.nlm.nih.gov/3.0/
         """
-        dtd = self.get_element_xpath(tag_path_elements=["/",
-                                                        "article"])
-        try:
-            dtd = dtd[0].attrib['dtd-version']
-            if str(dtd) == '3.0':
-                dtd = 'NLM 3.0'
-            elif dtd == '1.1d3':
-                dtd = 'JATS 1.1d3'
-        except KeyError:
-            print('Error parsing DTD from', self.doi)
-            dtd = 'N/A'
-        return dtd
+        article_element = self.get_element_xpath('article')
+        return _dtd_version(article_element[0], self.doi)
 
-    @property
+    @memoized_property
     def abstract(self):
         """For an individual PLOS article, get the string of the abstract content.
 
@@ -1174,29 +1408,15 @@ class Article:
         Info about the article abstract: http://journals.plos.org/plosone/s/submission-guidelines#loc-abstract
         :return: plain-text string of content in abstract
         """
-        abstract_list = self.get_element_xpath(tag_path_elements=["/",
-                                                                  "article",
-                                                                  "front",
-                                                                  "article-meta",
-                                                                  "abstract[count(@*)=0]"])
-        if abstract_list:
-                abstract = abstract_list[0]
-                assert len(abstract_list) == 1
-
-                abstract_text = et.tostring(abstract[0], encoding='unicode', method='text')
-        else:
+        abstract_list = self.get_element_xpath('abstract')
+        abstract_text = _abstract_text(abstract_list)
+        if abstract_text is None:
             if self.type_ == 'research-article' and self.plostype == 'Research Article':
                 print('No abstract found for research article {}'.format(self.doi))
-
             abstract_text = ''
-
-        # clean up text: rem white space, new line marks, blank lines
-        abstract_text = abstract_text.strip().replace('  ', '')
-        abstract_text = os.linesep.join([s for s in abstract_text.splitlines() if s])
-
         return abstract_text
 
-    @property
+    @memoized_property
     def amendment(self):
         """Whether the JATS article type is a correction, retraction, or expression of concern.
 
@@ -1211,7 +1431,7 @@ class Article:
         else:
             return False
 
-    @property
+    @memoized_property
     def related_dois(self):
         """PLOS DOIs related to current article.
 
@@ -1221,33 +1441,9 @@ class Article:
         :returns: list of related DOIs
         :rtype: list
         """
-        doi_list = []
-        related_doi_dict = self.get_related_dois()
-        if self.amendment:
-            # only use certain keys if an amendment article
-            if self.type_ == 'correction':
-                attrib_name = 'corrected-article'
-            elif self.type_ == 'retraction':
-                attrib_name = 'retracted-article'
-            elif self.type_ == 'expression-of-concern':
-                attrib_name = 'object-of-concern'
-            for k, v in related_doi_dict.items():
-                if k == attrib_name:
-                    doi_list = v
-                    break
-            if not doi_list:
-                doi_list = sum(related_doi_dict.values(), [])
-                print('{} has incorrect related_doi field attribute'.format(self.doi))
+        return _related_doi_list(self.get_related_dois(), self.type_, self.doi)
 
-        else:
-            # flatten all dict values if not an amendment article
-            if related_doi_dict:
-                for k, v in related_doi_dict.items():
-                    doi_list.extend(v)
-
-        return doi_list
-
-    @property
+    @memoized_property
     def correction(self):
         """Get the DOIs of all corrections type articles that correct the current article.
 
@@ -1266,7 +1462,7 @@ class Article:
                 break
         return correction_doi
 
-    @property
+    @memoized_property
     def counts(self):
         """For a single article, return a dictionary of the several counts functions that are available.
 
@@ -1274,36 +1470,25 @@ class Article:
         For articles without the figure and table counts fields, calculates those values using XPath.
         :return: counts dictionary of number of figures, pages, and tables in the article
         """
-        counts = {}
-
-        tag_path = ["/",
-                    "article",
-                    "front",
-                    "article-meta",
-                    "counts"]
-        count_element_list = self.get_element_xpath(tag_path_elements=tag_path)
-        for count_element in count_element_list:
-            for count_item in count_element:
-                count = count_item.get('count')
-                count_type = count_item.tag
-                counts[count_type] = int(count)
-        if len(counts) > 3:  # this shouldn't happen
-            print(counts)
+        counts = _count_dict(self.get_element_xpath('counts'))
+        return self._add_body_counts(counts)
+
+    def _add_body_counts(self, counts):
+        """Count the figures and tables missing from `counts` in the article body."""
+        # figures and tables are in <body>, so count them in the full tree
         if 'fig-count' not in counts:
-            counts['fig-count'] = len(self.root.xpath('.//fig'))
+            counts['fig-count'] = len(XPATHS['figures'](self.tree.getroot()))
         if 'table-count' not in counts:
-            counts['table-count'] = len(self.root.xpath('.//table-wrap'))
+            counts['table-count'] = len(XPATHS['tables'](self.tree.getroot()))
         return counts
 
-    @property
+    @memoized_property
     def word_count(self):
         """For an article, get how many words are in the body.
 
         :return: count of words in the body of the PLOS article
         """
-        body_element = self.get_element_xpath(tag_path_elements=["/",
-                                                                 "article",
-                                                                 "body"])
+        body_element = XPATHS['body'](self.tree.getroot())
         try:
             body_text = et.tostring(body_element[0], encoding='unicode', method='text')
             body_word_count = len(body_text.split(" "))
@@ -1323,7 +1508,7 @@ class Article:
         self.doi = filename_to_doi(value)
 
     @classmethod
-    def from_filename(cls, filename):
+    def from_filename(cls, filename, front_only=False):
         """Initiate an article object using a local XML file.
 
         Will set `self.directory` if the full file path is available. If not, it will
@@ -1331,8 +1516,63 @@ class Article:
         for instantiating an Article object when the file is not in the default corpus
         directory, or when changing directories.
         """
-        if os.path.isfile(filename):
+        if os.path.isfile(filename) or is_packed(os.path.dirname(filename)):
             directory = os.path.dirname(filename)
         else:
             directory = None
-        return cls(filename_to_doi(filename), directory=directory)
+        return cls(filename_to_doi(filename), directory=directory, front_only=front_only)
+
+
+class ArticleRef:
+    """Lightweight reference to an article in a corpus, for holding very many of them.
+
+    Stores only the DOI and the corpus it's in, without a per-instance `__dict__`, and
+    skips DOI validation (DOIs in a corpus index are already valid). The `Article` object,
+    and so the parsed tree, is only created when an article attribute is first accessed;
+    every attribute of `Article` is available on the reference.
+    Used by `Corpus` generators (e.g., `Corpus.article_generator`).
+    """
+    __slots__ = ('doi', 'corpus', '_article')
+
+    def __init__(self, doi, corpus):
+        """
+        :param doi: DOI of the article
+        :param corpus: `Corpus` of the article
+        """
+        self.doi = doi
+        self.corpus = corpus
+        self._article = None
+
+    @property
+    def directory(self):
+        return self.corpus.directory
+
+    @property
+    def article(self):
+        """The referenced `Article`, created on first access."""
+        if self._article is None:
+            self._article = self.corpus._article(self.doi)
+        return self._article
+
+    def release(self):
+        """Drop the `Article` object and its parsed tree, keeping only the reference."""
+        if self._article is not None:
+            self._article.release_tree()
+        self._article = None
+
+    def __getattr__(self, name):
+        if name.startswith('__') or name in ArticleRef.__slots__:
+            raise AttributeError(name)
+        return getattr(self.article, name)
+
+    def __eq__(self, other):
+        return self.doi == other.doi and self.directory == other.directory
+
+    def __hash__(self):
+        return hash((self.doi, self.directory))
+
+    def __repr__(self):
+        return "ArticleRef({!r}, directory={!r})".format(self.doi, self.directory)
+
+    def __str__(self):
+        return str(self.article)
@@ -1,3 +1,4 @@
 from .corpus import Corpus
+from .index import CorpusIndex
 
 from .plos_corpus import *
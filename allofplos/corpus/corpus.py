@@ -1,23 +1,65 @@
+import functools
+import multiprocessing
 import os
+import queue
+import time
 
 from random import Random
-from collections import OrderedDict
+from collections import OrderedDict, deque
 from itertools import islice
 
+from tqdm import tqdm
+
 from .. import get_corpus_dir, Article
-from ..transformations import filename_to_doi, doi_to_path
+from ..article import ArticleRef, EXTRACT_FIELDS
+from ..packed import is_packed, open_packed
+from ..transformations import doi_to_path
+from .index import CorpusIndex
+
+# default of `Corpus.reduce(initial=...)`, so None can be a starting value
+_MISSING = object()
+
+
+def _map_chunk(func, dois, directory, front_only=False, field_cache=None):
+    """Run `func` on the Article of each DOI in a chunk. Used by `Corpus.map()`.
+
+    Articles are created inside the worker process, so only DOIs and results are
+    passed between processes.
+    :return: tuple of the worker's process ID, seconds spent on the chunk, and list of results
+    """
+    start = time.time()
+    results = [func(Article(doi, directory=directory, front_only=front_only, field_cache=field_cache))
+               for doi in dois]
+    if field_cache is not None:
+        # pool workers exit without running atexit handlers
+        field_cache.commit()
+    return os.getpid(), time.time() - start, results
 
 
 class Corpus:
     """A collection of PLOS articles."""
 
-    def __init__(self, directory=None, extension='.xml', seed=None):
-        """Creation of an article corpus class."""
+    def __init__(self, directory=None, extension='.xml', seed=None, persist_index=True,
+                 field_cache=None):
+        """Creation of an article corpus class.
+
+        :param directory: directory of article XML files, or a packed corpus file (see
+        `allofplos.packed`), defaults to get_corpus_dir()
+        :param extension: extension of the article files, defaults to '.xml'
+        :param seed: seed for the random article & DOI generators
+        :param persist_index: whether to store the file index next to the corpus directory,
+        defaults to True. See `CorpusIndex`.
+        :param field_cache: persistent cache of property values for the corpus articles,
+        defaults to None. See `allofplos.field_cache`.
+        """
         if directory is None:
             directory = get_corpus_dir()
         self.directory = directory
         self.extension = extension
         self.random = Random(seed)
+        self.persist_index = persist_index
+        self._index = None
+        self.field_cache = field_cache
 
     def __repr__(self):
         """Value of a corpus object when you call it directly on the command line.
@@ -30,19 +72,22 @@ class Corpus:
         return out
     
     def __len__(self):
-        return len(self.dois)
+        return len(self.index)
     
     def __iter__(self):
         return (article for article in self.random_article_generator)
     
     def __getitem__(self, key):
-        
+        """Article(s) of the corpus, by position or DOI.
+
+        An int or a DOI returns an `Article`; a slice returns a generator of `Article`s.
+        (For many articles, `article_generator` yields lightweight `ArticleRef`s instead.)
+        """
         if isinstance(key, int):
-            return Article(self.dois[key], directory=self.directory)
+            return self._article(self.index.dois[key])
         elif isinstance(key, slice):
-            return (Article(doi, directory=self.directory) 
-                    for doi in self.dois[key])
-        elif key not in self.dois:
+            return (self._article(doi) for doi in self.index.dois[key])
+        elif key not in self.index:
             path= doi_to_path(key, directory=self.directory)
             raise IndexError(("You attempted get {doi} from "
                               "the corpus at \n{directory}. \n"
@@ -54,28 +99,50 @@ class Corpus:
                                       )
                             )
         else:
-            return Article(key, directory=self.directory)
+            return self._article(key)
+
+    def _article(self, doi):
+        return Article(doi, directory=self.directory, field_cache=self.field_cache)
 
     def __contains__(self, value):
         is_in = False
-        if isinstance(value, Article):
-            is_in = value.doi in self.dois and value.directory == self.directory
+        index = self.index
+        if isinstance(value, (Article, ArticleRef)):
+            is_in = value.doi in index and value.directory == self.directory
         elif isinstance(value, str):
-            doi_in = value in self.dois
-            file_in = value in self.files
-            filepath_in = value in self.filepaths
+            doi_in = value in index
+            file_in = value in index.file_set
+            filepath_in = (os.path.basename(value) in index.file_set and
+                           os.path.join(self.directory, os.path.basename(value)) == value)
             is_in = doi_in or file_in or filepath_in
         return is_in
-        
+
+    @property
+    def index(self):
+        """The `CorpusIndex` of files and DOIs in the corpus directory.
+
+        For a packed corpus, the `PackedCorpus` container itself.
+        Loaded once per corpus object, and refreshed if the directory has changed.
+        """
+        if self._index is None:
+            if is_packed(self.directory):
+                self._index = open_packed(self.directory)
+            else:
+                self._index = CorpusIndex(self.directory,
+                                          extension=self.extension,
+                                          persist=self.persist_index)
+        else:
+            self._index.refresh()
+        return self._index
+
     @property
     def iter_file_doi(self):
         """Generator that returns filename, doi tuples for every file in the corpus.
 
         Used to generate both DOI and file generators for the corpus.
         """
-        return ((file_, filename_to_doi(file_))
-                for file_ in sorted(os.listdir(self.directory))
-                if file_.endswith(self.extension) and 'DS_Store' not in file_)
+        index = self.index
+        return zip(index.files, index.dois)
 
     @property
     def file_doi(self):
@@ -106,13 +173,13 @@ class Corpus:
     def files(self):
         """List of article XML files in the corpus directory."""
 
-        return list(self.iter_files)
+        return list(self.index.files)
 
     @property
     def dois(self):
         """List of DOIs of the articles in the corpus directory."""
 
-        return list(self.iter_dois)
+        return list(self.index.dois)
 
     @property
     def filepaths(self):
@@ -121,15 +188,13 @@ class Corpus:
 
     @property
     def article_generator(self):
-        """iterator of articles"""
-        return (Article(doi, directory=self.directory) 
-                for doi in self.iter_dois)
+        """iterator of articles, as `ArticleRef`s that parse each article on first use"""
+        return (ArticleRef(doi, self) for doi in self.iter_dois)
 
     @property
     def random_article_generator(self):
-        """iterator over random articles"""
-        return (Article(doi, directory=self.directory) 
-                for doi in self.iter_random_dois)
+        """iterator over random articles, as `ArticleRef`s that parse each article on first use"""
+        return (ArticleRef(doi, self) for doi in self.iter_random_dois)
 
     @property
     def random_article(self):
@@ -165,3 +230,139 @@ class Corpus:
         """
 
         return list(islice(self.iter_random_dois, count))
+
+    def iter_records(self, fields=EXTRACT_FIELDS, dois=None, front_only=None):
+        """
+        Generator of `Article.extract(fields)` records for every article in the corpus.
+
+        For scanning corpora of any size in constant memory: a single Article object is
+        reused for every DOI, with `memoize=False`, and each article's tree is freed (see
+        `Article.release_tree()`) as soon as its record is extracted, before the record is
+        yielded. Peak memory is then one parsed article plus the records the caller keeps;
+        records are namedtuples, which have no per-instance `__dict__`. Values are still read
+        from and stored in the corpus `field_cache`, if it has one.
+        See `benchmarks/iter_records_benchmark.py`.
+
+        :param fields: names of the fields in each record, defaults to `EXTRACT_FIELDS`
+        :param dois: DOIs of the articles, defaults to every DOI in the corpus
+        :param front_only: only parse the <front> of articles, defaults to True unless
+        `fields` includes 'word_count' or 'counts', which are usually in the article body
+        :return: generator of namedtuples of the `fields` of each article
+        """
+        if front_only is None:
+            front_only = not {'word_count', 'counts'} & set(fields)
+        if dois is None:
+            dois = self.iter_dois
+        article = None
+        for doi in dois:
+            if article is None:
+                article = Article(doi, directory=self.directory, front_only=front_only,
+                                  memoize=False, field_cache=self.field_cache)
+            else:
+                article.doi = doi
+            record = article.extract(fields)
+            article.release_tree()
+            yield record
+
+    def map(self, func, processes=None, chunksize=100, ordered=False, dois=None,
+            front_only=False, max_pending=None, progress=True):
+        """
+        Generator of `func(article)` for every article in the corpus, run in a process pool.
+
+        DOIs are sharded into chunks that are sent to worker processes, which create
+        the Article objects themselves. Results are yielded as soon as each chunk is done.
+        At most `max_pending` chunks are sent out at a time, so memory stays bounded even
+        if the results are consumed slowly.
+        Per-worker throughput is stored in `self.map_stats` (process ID mapped to the number
+        of articles and seconds spent), and printed at the end if `progress` is True.
+
+        :param func: function that takes an Article; must be picklable (i.e. defined at
+        the top level of a module) if processes is not 1
+        :param processes: number of worker processes, defaults to os.cpu_count().
+        If 1, runs in the current process without a pool.
+        :param chunksize: number of DOIs sent to a worker at a time, defaults to 100
+        :param ordered: whether to yield results in the same order as the DOIs, defaults to False
+        :param dois: DOIs to run on, defaults to all DOIs in the corpus
+        :param front_only: create the Article objects with `front_only=True`, defaults to False
+        :param max_pending: maximum number of chunks in flight, defaults to 2 * processes
+        :param progress: whether to show a progress bar and worker throughput, defaults to True
+        :return: generator of results of `func`
+        """
+        if dois is None:
+            dois = self.dois
+        if processes is None:
+            processes = os.cpu_count() or 1
+        if max_pending is None:
+            max_pending = 2 * processes
+        chunks = (dois[i:i+chunksize] for i in range(0, len(dois), chunksize))
+        self.map_stats = {}
+        pbar = tqdm(total=len(dois), disable=None if progress else True)
+
+        def record(pid, elapsed, results):
+            stats = self.map_stats.setdefault(pid, {'articles': 0, 'seconds': 0.})
+            stats['articles'] += len(results)
+            stats['seconds'] += elapsed
+            pbar.update(len(results))
+            return results
+
+        try:
+            if processes == 1:
+                for chunk in chunks:
+                    yield from record(*_map_chunk(func, chunk, self.directory, front_only,
+                                                  self.field_cache))
+            else:
+                with multiprocessing.Pool(processes) as pool:
+                    yield from self._map_pool(pool, func, chunks, ordered, front_only,
+                                              max_pending, record)
+        finally:
+            pbar.close()
+        if progress:
+            for pid, stats in sorted(self.map_stats.items()):
+                print("Worker {}: {} articles in {:.1f}s ({:.1f} articles/s)"
+                      .format(pid, stats['articles'], stats['seconds'],
+                              stats['articles'] / (stats['seconds'] or 1)))
+
+    def _map_pool(self, pool, func, chunks, ordered, front_only, max_pending, record):
+        """Submit chunks to the pool, keeping at most `max_pending` in flight."""
+        chunks = iter(chunks)
+        args = lambda chunk: (func, chunk, self.directory, front_only, self.field_cache)
+        if ordered:
+            pending = deque(pool.apply_async(_map_chunk, args(chunk))
+                            for chunk in islice(chunks, max_pending))
+            while pending:
+                result = pending.popleft().get()
+                for chunk in islice(chunks, 1):
+                    pending.append(pool.apply_async(_map_chunk, args(chunk)))
+                yield from record(*result)
+        else:
+            done = queue.Queue()
+            in_flight = 0
+            for chunk in islice(chunks, max_pending):
+                pool.apply_async(_map_chunk, args(chunk), callback=done.put, error_callback=done.put)
+                in_flight += 1
+            while in_flight:
+                result = done.get()
+                in_flight -= 1
+                if isinstance(result, BaseException):
+                    raise result
+                for chunk in islice(chunks, 1):
+                    pool.apply_async(_map_chunk, args(chunk), callback=done.put, error_callback=done.put)
+                    in_flight += 1
+                yield from record(*result)
+
+    def reduce(self, func, reducer, initial=_MISSING, **kwargs):
+        """
+        Combine the results of `self.map(func)` into a single value with `reducer`.
+
+        Example, counting the number of authors in the corpus:
+        `corpus.reduce(count_authors, operator.add, 0, processes=8)`
+        :param func: function that takes an Article, as in `map()`
+        :param reducer: function of two arguments, as in `functools.reduce()`
+        :param initial: starting value for the reduction, defaults to none (the first result)
+        :param kwargs: keyword arguments passed to `map()`
+        :return: reduced value
+        """
+        results = self.map(func, **kwargs)
+        if initial is _MISSING:
+            return functools.reduce(reducer, results)
+        return functools.reduce(reducer, results, initial)
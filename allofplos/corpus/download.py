@@ -0,0 +1,353 @@
+"""
+Helpers for downloading PLOS article files concurrently.
+
+All downloads share one `requests.Session`, so connections to the journal site are
+pooled and kept alive between requests. Failed requests (connection errors and
+429/5xx responses) are retried with exponential backoff, and a single `RateLimiter`
+caps the number of requests per second across every download thread.
+
+Articles that are already local can be revalidated with conditional requests: the
+ETag and Last-Modified headers of each remote file are kept in a `ValidatorCache`,
+so unchanged articles cost a 304 response instead of a full download.
+
+Multi-step updates can be pipelined with `Stage`s: thread pools connected by bounded
+queues, so each article moves on to the next step as soon as it's ready.
+"""
+
+import hashlib
+import json
+import os
+import queue
+import re
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import requests
+from requests.adapters import HTTPAdapter
+from tqdm import tqdm
+from urllib3.util.retry import Retry
+
+from .. import xml_validators_cache
+from ..transformations import doi_to_path, doi_to_url
+
+DEFAULT_WORKERS = 8
+# maximum requests per second to the journal site, across all download threads
+DEFAULT_RATE_LIMIT = 8
+CHUNK_SIZE = 65536
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+# bytes of an article requested at a time when reading its publication stage
+PROOF_PREFIX_BYTES = 32768
+
+_META_VALUE = re.compile(rb'<meta-value>\s*([^<]*?)\s*</meta-value>')
+# the publication stage is in the <custom-meta-group> of the <article-meta>
+_CUSTOM_META_END = re.compile(rb'</custom-meta-group>|</article-meta>')
+
+
+def make_session(pool_size=DEFAULT_WORKERS, retries=5, backoff_factor=0.5):
+    """Create a requests session with connection pooling and retries.
+
+    Retries connection errors and 429/5xx responses, waiting
+    `backoff_factor * 2 ** (retry number - 1)` seconds between attempts
+    (or as long as a Retry-After header asks).
+    :param pool_size: number of connections kept alive per host, defaults to DEFAULT_WORKERS
+    :param retries: number of times to retry a request, defaults to 5
+    :param backoff_factor: base for the exponential backoff, in seconds, defaults to 0.5
+    :return: requests.Session
+    """
+    session = requests.Session()
+    retry = Retry(total=retries,
+                  backoff_factor=backoff_factor,
+                  status_forcelist=RETRY_STATUSES,
+                  raise_on_status=False)
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+class Stage:
+    """Pool of threads running a function on each item put in a bounded queue.
+
+    Chain stages by calling the next stage's `put()` from the function. `put()` blocks
+    while the queue is full, so a fast stage can't run far ahead of a slow one.
+    Exceptions raised by the function are collected in `errors`, by item.
+    Usage:
+        stage = Stage(func, workers=8)
+        for item in items:
+            stage.put(item)
+        stage.join()
+    """
+    _stop = object()
+
+    def __init__(self, func, workers=1, maxsize=None, name=None):
+        """
+        :param func: function called with each item
+        :param workers: number of threads, defaults to 1
+        :param maxsize: maximum number of items waiting in the queue, defaults to 2 * workers
+        :param name: name of the threads, defaults to the name of `func`
+        """
+        self.func = func
+        self.queue = queue.Queue(maxsize or 2 * workers)
+        self.errors = {}
+        name = name or func.__name__
+        self.threads = [threading.Thread(target=self._run, name='{}-{}'.format(name, i), daemon=True)
+                        for i in range(workers)]
+        for thread in self.threads:
+            thread.start()
+
+    def put(self, item):
+        """Add an item to the queue, waiting for room if it's full."""
+        self.queue.put(item)
+
+    def join(self):
+        """Wait until every item put so far has been processed, then stop the threads."""
+        for _ in self.threads:
+            self.queue.put(self._stop)
+        for thread in self.threads:
+            thread.join()
+
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            if item is self._stop:
+                return
+            try:
+                self.func(item)
+            except Exception as e:
+                self.errors[item] = e
+
+
+class RateLimiter:
+    """Thread-safe limit on how many requests per second are started."""
+
+    def __init__(self, rate=DEFAULT_RATE_LIMIT):
+        """
+        :param rate: maximum requests per second; None or 0 for no limit
+        """
+        self.interval = 1 / rate if rate else 0
+        self._next_time = 0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        """Block until another request is allowed to start."""
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            start_time = max(self._next_time, now)
+            self._next_time = start_time + self.interval
+        time.sleep(start_time - now)
+
+
+def write_atomically(chunks, path):
+    """Write an iterable of byte chunks to a temporary file, then move it to path.
+
+    An interrupted download never leaves a partial file at path.
+    :param chunks: iterable of bytes
+    :param path: file to write
+    :return: number of bytes written
+    """
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), suffix='.part')
+    size = 0
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            for chunk in chunks:
+                if chunk:  # filter out keep-alive new chunks
+                    f.write(chunk)
+                    size += len(chunk)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+    return size
+
+
+def download_file(url, path, session=None, rate_limiter=None, timeout=60):
+    """Stream the body of a URL straight to a local file.
+
+    :param url: URL to download
+    :param path: local file to write
+    :param session: requests session, defaults to a new one from `make_session()`
+    :param rate_limiter: RateLimiter shared between threads, defaults to None (no limit)
+    :param timeout: seconds to wait for the server, defaults to 60
+    :return: number of bytes written
+    """
+    if session is None:
+        session = make_session()
+    if rate_limiter is not None:
+        rate_limiter.wait()
+    with session.get(url, stream=True, timeout=timeout) as response:
+        response.raise_for_status()
+        return write_atomically(response.iter_content(CHUNK_SIZE), path)
+
+
+def download_articles(dois, directory, workers=DEFAULT_WORKERS, rate_limit=DEFAULT_RATE_LIMIT,
+                      session=None, url_func=doi_to_url):
+    """Download the XML files of a list of articles concurrently.
+
+    :param dois: iterable of DOIs of the articles to download
+    :param directory: directory to write the article files to
+    :param workers: number of download threads, defaults to DEFAULT_WORKERS
+    :param rate_limit: maximum requests per second across all threads, defaults to DEFAULT_RATE_LIMIT
+    :param session: requests session, defaults to a new one from `make_session()`
+    :param url_func: function transforming a DOI to its XML URL, defaults to `doi_to_url`
+    :return: tuple of list of downloaded DOIs, and dict of DOIs that failed mapped to their errors
+    """
+    if session is None:
+        session = make_session(pool_size=workers)
+    rate_limiter = RateLimiter(rate_limit)
+    downloaded = []
+    failed = {}
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(download_file,
+                                   url_func(doi),
+                                   doi_to_path(doi, directory=directory),
+                                   session=session,
+                                   rate_limiter=rate_limiter): doi
+                   for doi in dois}
+        for future in tqdm(as_completed(futures), total=len(futures), disable=None):
+            doi = futures[future]
+            try:
+                future.result()
+                downloaded.append(doi)
+            except (requests.RequestException, OSError) as e:
+                failed[doi] = e
+    for doi, error in sorted(failed.items()):
+        print('Error downloading {}: {}'.format(doi, error))
+    return downloaded, failed
+
+
+def remote_proof_status(url, session=None, rate_limiter=None, chunk_size=PROOF_PREFIX_BYTES, timeout=60):
+    """Proof status of a remote article, read from the start of its XML file.
+
+    Requests the file in ranges of `chunk_size` bytes until the end of its custom metadata,
+    so the rest of the article isn't downloaded.
+    :param url: URL of the article XML file
+    :param session: requests session, defaults to a new one from `make_session()`
+    :param rate_limiter: RateLimiter shared between threads, defaults to None (no limit)
+    :param chunk_size: bytes requested at a time, defaults to PROOF_PREFIX_BYTES
+    :param timeout: seconds to wait for the server, defaults to 60
+    :return: 'uncorrected_proof', 'vor_update', or '' (see `Article.proof`)
+    """
+    if session is None:
+        session = make_session()
+    prefix = b''
+    while True:
+        if rate_limiter is not None:
+            rate_limiter.wait()
+        headers = {'Range': 'bytes={}-{}'.format(len(prefix), len(prefix) + chunk_size - 1)}
+        response = session.get(url, headers=headers, timeout=timeout)
+        if response.status_code == 416:
+            # the file ended at the previous range
+            break
+        response.raise_for_status()
+        if response.status_code == 206:
+            prefix += response.content
+        else:
+            # the whole file, if the server doesn't support ranges
+            prefix = response.content
+        end = _CUSTOM_META_END.search(prefix)
+        if end is not None:
+            prefix = prefix[:end.start()]
+            break
+        if response.status_code != 206 or len(response.content) < chunk_size:
+            break
+    proof = ''
+    for value in _META_VALUE.findall(prefix):
+        if value == b'uncorrected-proof':
+            proof = 'uncorrected_proof'
+        elif value == b'vor-update-to-uncorrected-proof':
+            proof = 'vor_update'
+    return proof
+
+
+def content_hash(content):
+    """SHA-1 hex digest of bytes."""
+    return hashlib.sha1(content).hexdigest()
+
+
+def file_hash(path):
+    """SHA-1 hex digest of a file's contents."""
+    sha1 = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            sha1.update(chunk)
+    return sha1.hexdigest()
+
+
+class ValidatorCache:
+    """Sidecar file of HTTP validators for remote article files, keyed by DOI.
+
+    Each entry has the 'etag' and 'last_modified' headers of the last full response
+    for an article, the 'sha1' of that response's body, and optionally the 'matches'
+    hash of a local file known to be the same XML as the remote one.
+    """
+
+    def __init__(self, path=xml_validators_cache):
+        """
+        :param path: location of the cache file, defaults to `xml_validators_cache`
+        """
+        self.path = path
+        self.entries = {}
+        self.changed = False
+        self.load()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, doi):
+        """The validators for a DOI, or an empty dict if there are none."""
+        return self.entries.get(doi, {})
+
+    def set(self, doi, entry):
+        if self.entries.get(doi) != entry:
+            self.entries[doi] = entry
+            self.changed = True
+
+    def load(self):
+        try:
+            with open(self.path, encoding='utf8') as f:
+                self.entries = json.load(f)
+        except (OSError, ValueError):
+            self.entries = {}
+        self.changed = False
+
+    def save(self):
+        """Write the cache file atomically, if any entries changed."""
+        if not self.changed:
+            return
+        content = json.dumps(self.entries, separators=(',', ':')).encode('utf8')
+        write_atomically([content], self.path)
+        self.changed = False
+
+
+def revalidate(url, entry, session=None, rate_limiter=None, timeout=60):
+    """Conditionally request a URL, using the validators of a previous response.
+
+    :param url: URL to request
+    :param entry: validators from `ValidatorCache.get()`; if empty, the request is unconditional
+    :param session: requests session, defaults to a new one from `make_session()`
+    :param rate_limiter: RateLimiter shared between threads, defaults to None (no limit)
+    :param timeout: seconds to wait for the server, defaults to 60
+    :return: tuple of the response body (None if not modified since `entry`) and the new validators
+    """
+    if session is None:
+        session = make_session()
+    headers = {}
+    if entry.get('etag'):
+        headers['If-None-Match'] = entry['etag']
+    if entry.get('last_modified'):
+        headers['If-Modified-Since'] = entry['last_modified']
+    if rate_limiter is not None:
+        rate_limiter.wait()
+    response = session.get(url, headers=headers, timeout=timeout)
+    if response.status_code == 304:
+        return None, entry
+    response.raise_for_status()
+    new_entry = {'etag': response.headers.get('ETag'),
+                 'last_modified': response.headers.get('Last-Modified'),
+                 'sha1': content_hash(response.content),
+                 }
+    return response.content, new_entry
@@ -1,12 +1,19 @@
 import datetime
+import functools
+import hashlib
+import json
+import multiprocessing
 import os
 import tarfile
+import zlib
 from zipfile import ZipFile, BadZipFile
 
 import requests
 from tqdm import tqdm
 
 from .. import get_corpus_dir
+from ..packed import get_packed_path, pack_zip
+from .download import make_session, write_atomically, CHUNK_SIZE
 
 # Variables needed
 ZIP_ID = '0B_JDnoghFeEKLTlJT09IckMwOFk'
@@ -18,51 +25,173 @@ min_files_for_valid_corpus = 200000
 TEST_ZIP_ID = '12VomS72LdTI3aYn4cphYAShv13turbX3'
 LOCAL_TEST_ZIP = 'sample_corpus.zip'
 GDRIVE_URL = "https://docs.google.com/uc?export=download"
+# download progress and checksum of a file, stored next to it
+MANIFEST_SUFFIX = '.download.json'
+# number of zip members each extraction worker handles at a time
+UNZIP_CHUNKSIZE = 1000
+
+
+def get_manifest_path(file_path):
+    """Location of the JSON download manifest kept alongside a downloaded file."""
+    return file_path + MANIFEST_SUFFIX
+
+
+def read_manifest(file_path):
+    """The download manifest of a file, or an empty dict if there isn't a valid one."""
+    try:
+        with open(get_manifest_path(file_path), encoding='utf8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def write_manifest(file_path, manifest):
+    write_atomically([json.dumps(manifest).encode('utf8')], get_manifest_path(file_path))
+
+
+def stream_hash(path, sha256=None):
+    """SHA-256 of a file, read in chunks.
+
+    :param path: file to hash
+    :param sha256: hashlib object to update, defaults to a new one
+    :return: the updated hashlib object
+    """
+    if sha256 is None:
+        sha256 = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            sha256.update(chunk)
+    return sha256
+
+
+def verify_download(file_path):
+    """Check a previously downloaded file is complete and intact.
+
+    Files with a manifest are checked against its size and SHA-256. Zip files without a
+    manifest (from older versions) are checked by reading the zip's central directory.
+    :param file_path: path to the downloaded file
+    :return: bool
+    """
+    manifest = read_manifest(file_path)
+    if manifest.get('sha256'):
+        return (os.path.getsize(file_path) == manifest['size'] and
+                stream_hash(file_path).hexdigest() == manifest['sha256'])
+    if os.path.splitext(file_path)[1].lower() == '.zip':
+        try:
+            ZipFile(file_path).close()
+        except BadZipFile:
+            return False
+    return True
+
+
+def resumable_download(url, file_path, params=None, file_size=None, session=None, attempts=5):
+    """Download a file with HTTP Range requests, resuming any earlier partial download.
+
+    Data is written to `file_path + '.part'`, and the manifest records the validators
+    (ETag/Last-Modified) of the remote file so a partial download is only resumed if the
+    remote file is unchanged. The SHA-256 of the file is computed while it streams, and is
+    stored in the manifest once the download is complete.
+    :param url: URL of the file
+    :param file_path: where the file is to be saved
+    :param params: query parameters for the request
+    :param file_size: expected size of the file, for the progress bar if the server doesn't send it
+    :param session: requests session, defaults to a new one from `make_session()`
+    :param attempts: number of times to resume after the connection drops, defaults to 5
+    :return: None
+    """
+    if session is None:
+        session = make_session()
+    part_path = file_path + '.part'
+    manifest = read_manifest(file_path)
+    if manifest.get('sha256') or not os.path.isfile(part_path):
+        manifest = {}
+    for attempt in range(attempts):
+        offset = os.path.getsize(part_path) if manifest and os.path.isfile(part_path) else 0
+        headers = {}
+        if offset:
+            headers['Range'] = 'bytes={}-'.format(offset)
+            validator = manifest.get('etag') or manifest.get('last_modified')
+            if validator:
+                headers['If-Range'] = validator
+        with session.get(url, params=params, headers=headers, stream=True, timeout=60) as response:
+            if response.status_code == 416:
+                if offset == manifest.get('size'):
+                    # the partial file is already complete
+                    break
+                # the partial file doesn't fit the remote file; start over
+                manifest = {}
+                continue
+            response.raise_for_status()
+            if response.status_code != 206:
+                # the server sent the whole file
+                offset = 0
+                length = response.headers.get('Content-Length')
+                manifest = {'url': url,
+                            'etag': response.headers.get('ETag'),
+                            'last_modified': response.headers.get('Last-Modified'),
+                            'size': int(length) if length else file_size,
+                            }
+                write_manifest(file_path, manifest)
+            sha256 = stream_hash(part_path) if offset else hashlib.sha256()
+            try:
+                with open(part_path, 'ab' if offset else 'wb') as f, \
+                     tqdm(total=manifest['size'], initial=offset, unit='B', unit_scale=True,
+                          disable=None) as pbar:
+                    for chunk in response.iter_content(CHUNK_SIZE):
+                        if chunk:  # filter out keep-alive new chunks
+                            f.write(chunk)
+                            sha256.update(chunk)
+                            pbar.update(len(chunk))
+            except (requests.ConnectionError, requests.exceptions.ChunkedEncodingError) as e:
+                print("Download interrupted ({}), resuming...".format(e))
+                continue
+        break
+    else:
+        raise IOError("Download of {} still incomplete after {} attempts.".format(url, attempts))
+    if offset and response.status_code == 416:
+        sha256 = stream_hash(part_path)
+    size = os.path.getsize(part_path)
+    if manifest['size'] is not None and size != manifest['size']:
+        raise IOError("Downloaded {} bytes of {}, expected {}.".format(size, url, manifest['size']))
+    os.replace(part_path, file_path)
+    manifest.update(size=size, sha256=sha256.hexdigest())
+    write_manifest(file_path, manifest)
 
 
 def download_file_from_google_drive(id, filename, directory=None,
-                                    file_size=None):
+                                    file_size=None, url=GDRIVE_URL, session=None):
     """
     General method for downloading from Google Drive.
     Doesn't require using API or having credentials
+    Interrupted downloads are resumed rather than restarted; see `resumable_download`
     :param id: Google Drive id for file (constant even if filename change)
     :param filename: name of the zip file
     :param directory: directory where to download the zip file, defaults to get_corpus_dir
     :param file_size: size of the file being downloaded
-    :return: None
+    :param url: URL of the Google Drive download endpoint, defaults to GDRIVE_URL
+    :param session: requests session to use, defaults to a new one with retries
+    :return: path to the downloaded file
     """
     if directory is None:
         directory = get_corpus_dir()
 
     file_path = os.path.join(directory, filename)
-    extension = os.path.splitext(file_path)[1]
 
-    # check for existing incomplete zip download. Delete if invalid zip.
-    if os.path.isfile(file_path) and extension.lower() == '.zip':
-        try:
-            zip_file = ZipFile(file_path)
-            if zip_file.testzip():
-                os.remove(file_path)
-                print("Deleted corrupted previous zip download.")
-            else:
-                pass
-        except BadZipFile as e:
-            os.remove(file_path)
-            print("Deleted invalid previous zip download.")
-
-    else:
-        pass
+    # check for existing invalid download. Delete if invalid.
+    if os.path.isfile(file_path) and not verify_download(file_path):
+        os.remove(file_path)
+        print("Deleted invalid previous download.")
 
     if not os.path.isfile(file_path):
-        session = requests.Session()
-
-        response = session.get(GDRIVE_URL, params={'id': id}, stream=True)
-        token = get_confirm_token(response)
-
+        if session is None:
+            session = make_session()
+        params = {'id': id}
+        # large files need a confirmation token before Google Drive serves them
+        with session.get(url, params=params, stream=True) as response:
+            token = get_confirm_token(response)
         if token:
-            params = {'id': id, 'confirm': token}
-            response = session.get(GDRIVE_URL, params=params, stream=True)
-        save_response_content(response, file_path, file_size=file_size)
+            params['confirm'] = token
+        resumable_download(url, file_path, params=params, file_size=file_size, session=session)
     return file_path
 
 
@@ -79,34 +208,6 @@ def get_confirm_token(response):
     return None
 
 
-def save_response_content(response, download_path, file_size=None):
-    """
-    Saves the downloaded file parts from Google Drive to local file
-    Includes progress bar for download %
-    :param response: session-based google query
-    :param download_path: path to local zip file
-    :param file_size: size of the file being downloaded
-    :return: None
-    """
-    CHUNK_SIZE = 32768
-    # for downloading zip file
-    if os.path.basename(download_path) == LOCAL_ZIP:
-        with open(download_path, "wb") as f:
-            size = file_size
-            pieces = round(size / CHUNK_SIZE)
-            with tqdm(total=pieces) as pbar:
-                for chunk in response.iter_content(CHUNK_SIZE):
-                    pbar.update(1)
-                    if chunk:  # filter out keep-alive new chunks
-                        f.write(chunk)
-    # for downloading zip metadata text file
-    else:
-        with open(download_path, "wb") as f:
-            for chunk in response.iter_content(CHUNK_SIZE):
-                if chunk:  # filter out keep-alive new chunks
-                    f.write(chunk)
-
-
 def get_zip_metadata(method='initial'):
     """
     Gets metadata txt file from Google Drive, that has info about zip file
@@ -125,31 +226,133 @@ def get_zip_metadata(method='initial'):
     return zip_date, zip_size, metadata_path
 
 
+def member_is_extracted(info, extract_directory):
+    """Whether a zip member already exists on disk with the same size and CRC.
+
+    :param info: ZipInfo of the member
+    :param extract_directory: directory the zip file is extracted to
+    :return: bool
+    """
+    path = os.path.join(extract_directory, info.filename)
+    try:
+        if os.path.getsize(path) != info.file_size:
+            return False
+        crc = 0
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(65536), b''):
+                crc = zlib.crc32(chunk, crc)
+    except OSError:
+        return False
+    return crc == info.CRC
+
+
+# zip file opened separately by each extraction worker process
+_worker_zip = None
+
+
+def _open_worker_zip(file_path):
+    global _worker_zip
+    _worker_zip = ZipFile(file_path, "r")
+
+
+def _extract_members(names, extract_directory, skip_existing=True):
+    """Extract zip members in a worker process, using its own ZipFile handle.
+
+    :return: tuple of the number of members extracted and skipped
+    """
+    extracted = skipped = 0
+    for name in names:
+        info = _worker_zip.getinfo(name)
+        if skip_existing and not info.is_dir() and member_is_extracted(info, extract_directory):
+            skipped += 1
+            continue
+        _worker_zip.extract(info, path=extract_directory)
+        extracted += 1
+    return extracted, skipped
+
+
+def extract_zip(file_path, extract_directory, processes=None, skip_existing=True,
+                chunksize=UNZIP_CHUNKSIZE):
+    """Extract a zip file, splitting its members across worker processes.
+
+    Members are handed out in chunks in the order they're stored in the zip file, and each
+    worker process reads them through its own ZipFile handle.
+    :param file_path: path to the zip file
+    :param extract_directory: directory where the members are extracted to
+    :param processes: number of worker processes, defaults to the number of CPUs; 1 extracts in this process
+    :param skip_existing: don't extract members already on disk with the same size and CRC, defaults to True
+    :param chunksize: number of members per task sent to a worker, defaults to UNZIP_CHUNKSIZE
+    :return: tuple of the number of members extracted and skipped
+    """
+    with ZipFile(file_path, "r") as zip_ref:
+        infos = sorted(zip_ref.infolist(), key=lambda info: info.header_offset)
+    # create directories up front so that workers don't race to make them
+    for dirname in {os.path.dirname(info.filename) for info in infos}:
+        os.makedirs(os.path.join(extract_directory, dirname), exist_ok=True)
+    names = [info.filename for info in infos]
+    chunks = [names[i:i+chunksize] for i in range(0, len(names), chunksize)]
+    extracted = skipped = 0
+    with tqdm(total=len(names), disable=None) as pbar:
+        if processes == 1:
+            _open_worker_zip(file_path)
+            results = (_extract_members(chunk, extract_directory, skip_existing) for chunk in chunks)
+        else:
+            pool = multiprocessing.Pool(processes, initializer=_open_worker_zip, initargs=(file_path,))
+            extract_chunk = functools.partial(_extract_members, extract_directory=extract_directory,
+                                              skip_existing=skip_existing)
+            results = pool.imap_unordered(extract_chunk, chunks)
+        try:
+            for chunk_extracted, chunk_skipped in results:
+                extracted += chunk_extracted
+                skipped += chunk_skipped
+                pbar.update(chunk_extracted + chunk_skipped)
+        finally:
+            if processes == 1:
+                _worker_zip.close()
+            else:
+                pool.close()
+                pool.join()
+    return extracted, skipped
+
+
 def unzip_articles(file_path,
                    extract_directory=None,
                    filetype='zip',
-                   delete_file=True
+                   delete_file=True,
+                   processes=None,
+                   skip_existing=True,
+                   packed=False
                    ):
     """
     Unzips zip file of all of PLOS article XML to specified directory
+    Zip files are extracted in parallel; see `extract_zip`
+    With `packed`, the articles go straight into a packed corpus file instead (see `allofplos.packed`)
     :param file_path: path to file to be extracted
     :param extract_directory: directory where articles are copied to
     :param filetype: whether a 'zip' or 'tar' file (tarball), which use different decompression libraries
     :param delete_file: whether to delete the compressed archive after extracting articles
+    :param processes: number of processes extracting a zip file, defaults to the number of CPUs
+    :param skip_existing: don't re-extract articles already on disk with the same size and CRC
+    :param packed: extract a zip file into `get_packed_path(extract_directory)`, defaults to False
     :return: None
     """
     if extract_directory is None:
         extract_directory = get_corpus_dir()
 
-    os.makedirs(extract_directory, exist_ok=True)
-
-    if filetype == 'zip':
-        with ZipFile(file_path, "r") as zip_ref:
-            tqdm.write("Extracting zip file...")
-            for article in tqdm(zip_ref.namelist()):
-                zip_ref.extract(article, path=extract_directory)
-            tqdm.write("Extraction complete.")
+    if packed and filetype == 'zip':
+        packed_path = get_packed_path(extract_directory)
+        tqdm.write("Packing zip file into {}...".format(packed_path))
+        added, skipped = pack_zip(file_path, packed_path)
+        tqdm.write("Packing complete: {} articles added, {} already up to date.".format(added, skipped))
+    elif filetype == 'zip':
+        os.makedirs(extract_directory, exist_ok=True)
+        tqdm.write("Extracting zip file...")
+        extracted, skipped = extract_zip(file_path, extract_directory, processes=processes,
+                                         skip_existing=skip_existing)
+        tqdm.write("Extraction complete: {} files extracted, {} already up to date."
+                   .format(extracted, skipped))
     elif filetype == 'tar':
+        os.makedirs(extract_directory, exist_ok=True)
         tar = tarfile.open(file_path)
         print("Extracting tar file...")
         tar.extractall(path=extract_directory)
@@ -158,3 +361,5 @@ def unzip_articles(file_path,
 
     if delete_file:
         os.remove(file_path)
+        if os.path.isfile(get_manifest_path(file_path)):
+            os.remove(get_manifest_path(file_path))
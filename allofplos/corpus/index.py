@@ -0,0 +1,195 @@
+"""
+A persistent index of the article files in a corpus directory.
+
+Listing and validating every file of a 250k-article directory is slow, so the
+list of files, DOIs, and basic file information is stored in a JSON file next
+to the corpus directory (e.g. `allofplos_xml.index.json` for `allofplos_xml/`).
+The index is refreshed incrementally: when the directory's inode and mtime are
+unchanged, the stored index is used as-is; otherwise only new files are stat-ed
+and removed files are dropped.
+"""
+
+import datetime
+import json
+import os
+import tempfile
+
+from ..article import Article
+from ..elements import Journal
+from ..transformations import filename_to_doi
+
+INDEX_VERSION = 1
+INDEX_SUFFIX = '.index.json'
+
+# column order of each row in the index file
+FIELDS = ('filename', 'doi', 'size', 'mtime', 'journal', 'pubdate')
+
+
+def get_index_path(directory):
+    """The location of the index file for a corpus directory.
+
+    Stored alongside the directory rather than inside it, so that writing the
+    index doesn't change the directory's own mtime.
+    :param directory: corpus directory
+    :return: path to the index file
+    """
+    return os.path.abspath(directory) + INDEX_SUFFIX
+
+
+class CorpusIndex:
+    """Persistent, incrementally refreshed listing of a corpus directory."""
+
+    def __init__(self, directory, extension='.xml', persist=True):
+        """Load the index for a directory, refreshing it if the directory has changed.
+
+        :param directory: corpus directory of article XML files
+        :param extension: extension of article files, defaults to '.xml'
+        :param persist: whether to read and write the index file, defaults to True
+        """
+        self.directory = directory
+        self.extension = extension
+        self.persist = persist
+        self.path = get_index_path(directory)
+        self._dir_key = None
+        self._rows = {}
+        self._set_rows({})
+        if persist:
+            self.load()
+        self.refresh()
+
+    def __len__(self):
+        return len(self.dois)
+
+    def __contains__(self, doi):
+        return doi in self.doi_files
+
+    def _set_rows(self, rows):
+        """Store the rows (filename -> row dict) and rebuild the lookup structures."""
+        self._rows = rows
+        self.files = sorted(rows)
+        self.dois = [rows[f]['doi'] for f in self.files]
+        self.doi_files = dict(zip(self.dois, self.files))
+        self.file_set = frozenset(self.files)
+
+    def _get_dir_key(self):
+        stat = os.stat(self.directory)
+        return [stat.st_ino, stat.st_mtime_ns]
+
+    def rows(self):
+        """Generator of the index rows (dicts with `FIELDS` as keys), sorted by filename."""
+        return (self._rows[f] for f in self.files)
+
+    def get(self, filename):
+        """The index row for a filename, or None if it isn't in the corpus."""
+        return self._rows.get(os.path.basename(filename))
+
+    def load(self):
+        """Read the index file, if there is a valid one for this directory."""
+        try:
+            with open(self.path, encoding='utf8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return False
+        if data.get('version') != INDEX_VERSION or data.get('extension') != self.extension:
+            return False
+        rows = {row[0]: dict(zip(FIELDS, row)) for row in data['files']}
+        self._set_rows(rows)
+        self._dir_key = data['directory']
+        return True
+
+    def save(self):
+        """Write the index file atomically. Silently skipped if it can't be written."""
+        if not self.persist:
+            return False
+        data = {'version': INDEX_VERSION,
+                'extension': self.extension,
+                'directory': self._dir_key,
+                'files': [[row[field] for field in FIELDS] for row in self.rows()],
+                }
+        index_dir = os.path.dirname(self.path)
+        try:
+            fd, tmp_path = tempfile.mkstemp(dir=index_dir, prefix='.', suffix=INDEX_SUFFIX)
+        except OSError:
+            return False
+        try:
+            with os.fdopen(fd, 'w', encoding='utf8') as f:
+                json.dump(data, f, separators=(',', ':'))
+            os.replace(tmp_path, self.path)
+        except OSError:
+            os.remove(tmp_path)
+            return False
+        return True
+
+    def refresh(self, full=False):
+        """Bring the index up to date with the corpus directory.
+
+        Only lists the directory if its inode or mtime changed since the last refresh.
+        New files are stat-ed and added, removed files are dropped. Files changed in place
+        don't change the directory mtime; use `full=True` to re-stat every file.
+        :param full: re-list the directory and re-stat every file, defaults to False
+        :return: whether the index changed
+        """
+        dir_key = self._get_dir_key()
+        if dir_key == self._dir_key and not full:
+            return False
+        old_rows = self._rows
+        rows = {}
+        changed = False
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                name = entry.name
+                if not name.endswith(self.extension) or 'DS_Store' in name:
+                    continue
+                row = old_rows.get(name)
+                if row is None or full:
+                    stat = entry.stat()
+                    if row is None or row['size'] != stat.st_size or row['mtime'] != stat.st_mtime_ns:
+                        doi = filename_to_doi(name)
+                        row = {'filename': name,
+                               'doi': doi,
+                               'size': stat.st_size,
+                               'mtime': stat.st_mtime_ns,
+                               'journal': Journal.doi_to_journal(doi),
+                               'pubdate': None,
+                               }
+                        changed = True
+                rows[name] = row
+        changed = changed or len(rows) != len(old_rows)
+        if changed:
+            self._set_rows(rows)
+        if changed or dir_key != self._dir_key:
+            self._dir_key = dir_key
+            self.save()
+        return changed
+
+    def _read_pubdate(self, row):
+        article = Article(row['doi'], directory=self.directory, front_only=True)
+        pubdate = article.pubdate
+        row['pubdate'] = pubdate.strftime('%Y-%m-%d') if pubdate else ''
+
+    def update_pubdates(self):
+        """Fill in the publication dates missing from the index, and save it.
+
+        Pubdates need the article XML to be parsed (front matter only), so they are
+        not read when files are first indexed.
+        """
+        missing = [row for row in self.rows() if row['pubdate'] is None]
+        for row in missing:
+            self._read_pubdate(row)
+        if missing:
+            self.save()
+
+    def pubdate(self, doi):
+        """The publication date of an article in the index.
+
+        Read from the article XML and stored in the index if it's missing.
+        :param doi: DOI of an article in the corpus
+        :rtype: {datetime.datetime} or None
+        """
+        row = self._rows[self.doi_files[doi]]
+        if row['pubdate'] is None:
+            self._read_pubdate(row)
+            self.save()
+        if not row['pubdate']:
+            return None
+        return datetime.datetime.strptime(row['pubdate'], '%Y-%m-%d')
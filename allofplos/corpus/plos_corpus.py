@@ -25,9 +25,12 @@ import gzip
 import logging
 import os
 import shutil
-import time
 import tarfile
+import threading
+import warnings
 import zipfile
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from io import BytesIO
 
 import lxml.etree as et
 import requests
@@ -38,8 +41,15 @@ from .. import get_corpus_dir, newarticledir, uncorrected_proofs_text_list
 from ..plos_regex import validate_doi
 from ..transformations import (BASE_URL_API, filename_to_doi, doi_to_path, doi_to_url)
 from ..article import Article
+from .download import (download_articles, download_file, file_hash, make_session, remote_proof_status,
+                       revalidate, write_atomically, RateLimiter, Stage, ValidatorCache, DEFAULT_RATE_LIMIT,
+                       DEFAULT_WORKERS)
 from .gdrive import (download_file_from_google_drive, get_zip_metadata, unzip_articles,
                      ZIP_ID, LOCAL_ZIP, LOCAL_TEST_ZIP, TEST_ZIP_ID, min_files_for_valid_corpus)
+from .corpus import Corpus
+from .snapshot import DoiSnapshot, sorted_difference
+from .proofs import ProofStore, DEFAULT_MAX_CHECKS, VOR_OVERDUE_DAYS
+from .solr import publication_date_params, SolrClient
 
 help_str = "This program downloads a zip file with all PLOS articles and checks for updates"
 
@@ -87,53 +97,31 @@ def extract_filenames(directory, extension='.xml'):
     return filenames
 
 
-def search_solr_records(days_ago=14, start=0, rows=1000, start_date=None, end_date=None, item='id'):
+def search_solr_records(days_ago=14, start=0, rows=1000, start_date=None, end_date=None, item='id',
+                        cursor=False, client=None):
     """
     Queries the solr database for a list of articles based on the date of publication
     function defaults to querying by DOI (i.e., 'id')
     TODO (on hold): if Solr XSLT is changed, query by revision_date instead of publication_date.
     Then would be used in separate query to figure out updated articles to download
     for full list of potential queries, see http://api.plos.org/solr/search-fields/
+    Pages of results are fetched concurrently; see `SolrClient`.
     :param days_ago: A int value with the length of the queried date range, default is two weeks
     :param start: An int value indicating the first row of results to return
-    :param rows: An int value indicating how many rows of results to return (from 0)
+    :param rows: An int value indicating how many rows of results to return per page
     :param start_date: datetime object of earliest date in the queried range (defaults to None)
     :param end_date: datetime object of latest date in the queried range (defaults to now)
     :param item: Items to return/display. 'Id', the default, is the article DOI.
+    :param cursor: page through results with a cursor mark, for deep paging (defaults to False)
+    :param client: SolrClient to query with, defaults to a new one
     :return: A list of DOIs for articles published in this time period; by default, from the last two weeks
     """
-    if end_date is None:
-        end_date = datetime.datetime.now()
-    solr_search_results = []
-    if start_date is None:
-        earlier = datetime.timedelta(days=days_ago)
-        start_date = end_date - earlier
-    START_DATE = start_date.strftime("%Y-%m-%d")
-    END_DATE = end_date.strftime("%Y-%m-%d")
-    howmanyarticles_url_base = [BASE_URL_API,
-                                '?q=*:*&fq=doc_type:full+-doi:image&fl=id,',
-                                item,
-                                '&wt=json&indent=true&sort=%20id%20asc&fq=publication_date:[',
-                                START_DATE,
-                                'T00:00:00Z+TO+',
-                                END_DATE,
-                                'T23:59:59Z]'
-                                ]
-    howmanyarticles_url = ''.join(howmanyarticles_url_base) + '&rows=1000'
-    # if include_uncorrected is False:
-    num_results = requests.get(howmanyarticles_url).json()["response"]["numFound"]
-
-    # Create solr_search_results & paginate through results
-    solr_search_results = []
-    while(start < num_results):
-        query_url = ''.join(howmanyarticles_url_base) + '&start=' + str(start) + '&rows=' + str(rows)
-        article_search = requests.get(query_url).json()
-        solr_partial_results = [x[item] for x in article_search["response"]["docs"]]
-        solr_search_results.extend(solr_partial_results)
-        start = start + rows
-        if start + rows > num_results:
-            rows = num_results - start
-    print("URL for solr query:", howmanyarticles_url)
+    if client is None:
+        client = SolrClient()
+    params = _publication_date_params(days_ago, start_date, end_date, item)
+    pages = dict(client.iter_pages(params, rows=rows, start=start, cursor=cursor))
+    solr_search_results = [doc[item] for offset in sorted(pages) for doc in pages[offset]]
+    print("URL for solr query:", requests.Request('GET', client.url, params=params).prepare().url)
 
     if solr_search_results:
         print("{0} results returned from this search."
@@ -143,38 +131,70 @@ def search_solr_records(days_ago=14, start=0, rows=1000, start_date=None, end_da
     return solr_search_results
 
 
-def get_all_solr_dois():
+def iter_solr_records(days_ago=14, start_date=None, end_date=None, item='id', cursor=False, client=None,
+                      rows=1000):
+    """
+    Generator version of `search_solr_records`, yielding each result as soon as its page arrives
+    Results aren't in order, unless `cursor` is True.
+    :param days_ago: A int value with the length of the queried date range, default is two weeks
+    :param start_date: datetime object of earliest date in the queried range (defaults to None)
+    :param end_date: datetime object of latest date in the queried range (defaults to now)
+    :param item: Items to return/display. 'Id', the default, is the article DOI.
+    :param cursor: page through results with a cursor mark, for deep paging (defaults to False)
+    :param client: SolrClient to query with, defaults to a new one
+    :param rows: An int value indicating how many rows of results to request per page
+    """
+    if client is None:
+        client = SolrClient()
+    params = _publication_date_params(days_ago, start_date, end_date, item)
+    for doc in client.iter_docs(params, rows=rows, cursor=cursor):
+        yield doc[item]
+
+
+def _publication_date_params(days_ago, start_date, end_date, item):
+    if end_date is None:
+        end_date = datetime.datetime.now()
+    if start_date is None:
+        start_date = end_date - datetime.timedelta(days=days_ago)
+    return publication_date_params(start_date, end_date, item)
+
+
+def get_all_solr_dois(client=None):
     """
     Get every article published by PLOS, up to 500,000, as indexed by Solr on api.plos.org.
-    URL includes regex to exclude sub-DOIs and image DOIs.
+    Query uses regex to exclude sub-DOIs and image DOIs.
+    To avoid fetching the full list every time, see `DoiSnapshot`.
+    :param client: SolrClient to query with, defaults to a new one
     :return: list of DOIs for all PLOS articles
     """
-    solr_magic_url = ('http://api.plos.org/terms?terms.fl=id&terms.limit=500000&wt=json&indent=true&terms.regex='
-                      '10%5C.1371%5C/(journal%5C.p%5Ba-zA-Z%5D%7B3%7D%5C.%5B%5Cd%5D%7B7%7D$%7Cannotation%5C/'
-                      '%5Ba-zA-Z0-9%5D%7B8%7D-%5Ba-zA-Z0-9%5D%7B4%7D-%5Ba-zA-Z0-9%5D%7B4%7D-%5Ba-zA-Z0-9%5D'
-                      '%7B4%7D-%5Ba-zA-Z0-9%5D%7B12%7D$)')
-    results = requests.get(solr_magic_url).json()
-    solr_dois = [id for id in results['terms']['id'] if isinstance(id, str)]
-
-    return solr_dois
+    if client is None:
+        client = SolrClient()
+    return client.all_dois()
 
 
-def get_dois_needed_list(comparison_list=None, directory=None):
+def get_dois_needed_list(comparison_list=None, directory=None, client=None, snapshot=None):
     """
-    Takes result of query from get_all_solr_dois and compares to local article directory.
-    :param comparison_list: Defaults to creating a full list of local article files.
-    :param directory: An int value indicating the first row of results to return
-    :return: A list of DOIs for articles that are not in the local article directory.
+    Takes the list of DOIs indexed by Solr and compares to local article directory.
+    :param comparison_list: DOIs to compare against, defaults to the refreshed local `DoiSnapshot` of Solr DOIs
+    :param directory: Directory containing the article files, defaults to get_corpus_dir()
+    :param client: SolrClient to refresh the snapshot with, defaults to a new one
+    :param snapshot: DoiSnapshot to refresh and compare against, defaults to the one in `solr_dois_snapshot`
+    :return: A sorted list of DOIs for articles that are not in the local article directory.
     """
     if comparison_list is None:
-        comparison_list = get_all_solr_dois()
+        if snapshot is None:
+            snapshot = DoiSnapshot()
+        snapshot.refresh(client=client)
+        comparison_list = snapshot.dois
+    else:
+        comparison_list = sorted(comparison_list)
     if directory is None:
         directory = get_corpus_dir()
 
-    # Transform local files to DOIs
-    local_article_list = [filename_to_doi(article) for article in listdir_nohidden(directory, '.xml')]
+    # DOIs of local files, from the corpus index
+    local_article_list = sorted(Corpus(directory).dois)
 
-    dois_needed_list = list(set(comparison_list) - set(local_article_list))
+    dois_needed_list = sorted_difference(comparison_list, local_article_list)
     if dois_needed_list:
         print(len(dois_needed_list), "new articles to download.")
     else:
@@ -200,13 +220,20 @@ def copytree(source, destination, symlinks=False, ignore=None):
             shutil.copy2(s, d)
 
 
-def repo_download(dois, tempdir, ignore_existing=True):
+def repo_download(dois, tempdir, ignore_existing=True, workers=DEFAULT_WORKERS,
+                  rate_limit=DEFAULT_RATE_LIMIT, session=None, url_func=doi_to_url):
     """
     Downloads a list of articles by DOI from PLOS's journal pages to a temporary directory
     Use in conjunction with get_dois_needed_list
+    Articles are downloaded concurrently over a pooled connection and written to disk as-is.
     :param dois: Iterable with DOIs for articles to obtain
     :param tempdir: Temporary directory where files are copied to
     :param ignore_existing: Don't re-download to tempdir if already downloaded
+    :param workers: number of download threads, defaults to DEFAULT_WORKERS
+    :param rate_limit: maximum requests per second across all threads, defaults to DEFAULT_RATE_LIMIT
+    :param session: requests session to reuse, defaults to a new pooled session
+    :param url_func: function transforming a DOI to its XML URL, defaults to `doi_to_url`
+    :return: list of DOIs that could not be downloaded
     """
     # make temporary directory, if needed
     try:
@@ -218,18 +245,12 @@ def repo_download(dois, tempdir, ignore_existing=True):
         existing_articles = [filename_to_doi(f) for f in listdir_nohidden(tempdir)]
         dois = set(dois) - set(existing_articles)
 
-    for doi in tqdm(sorted(dois), disable=None):
-        url = doi_to_url(doi)
-        articleXML = et.parse(url)
-        article_path = doi_to_path(doi, directory=tempdir)
-        # create new local XML files
-        if ignore_existing is False or ignore_existing and os.path.isfile(article_path) is False:
-            with open(article_path, 'w', encoding='utf8') as f:
-                f.write(et.tostring(articleXML, method='xml', encoding='unicode'))
-                time.sleep(.5)
+    downloaded, failed = download_articles(sorted(dois), tempdir, workers=workers, rate_limit=rate_limit,
+                                           session=session, url_func=url_func)
 
     print(len(listdir_nohidden(tempdir)), "new articles downloaded.")
     logging.info(len(listdir_nohidden(tempdir)))
+    return sorted(failed)
 
 
 def move_articles(source, destination):
@@ -257,25 +278,25 @@ def move_articles(source, destination):
         shutil.rmtree(source)
 
 
-def compare_article_pubdate(doi, days=22, directory=None):
+def compare_article_pubdate(doi, days=VOR_OVERDUE_DAYS, directory=None):
     """
     Check if an article's publication date was more than 3 weeks ago.
     :param doi: doi of the article
-    :param days: how long ago to compare the publication date (default 22 days)
+    :param days: how long ago to compare the publication date (default VOR_OVERDUE_DAYS)
     :param directory: directory the article file is located in (defaults to get_corpus_dir())
     :return: boolean for whether the pubdate was older than the days value
+    Deprecated: `ProofStore.too_old` finds the overdue proofs from their stored publication dates.
     """
+    warnings.warn("compare_article_pubdate is deprecated; use ProofStore.too_old",
+                  DeprecationWarning, stacklevel=2)
     if directory is None:
         directory = get_corpus_dir()
-    article = Article(doi, directory=directory)
     try:
-        pubdate = article.pubdate
-        today = datetime.datetime.now()
-        three_wks_ago = datetime.timedelta(days)
-        compare_date = today - three_wks_ago
-        return pubdate < compare_date
+        pubdate = Article(doi, directory=directory, front_only=True).pubdate
     except ValueError:
         print("Pubdate error in {}".format(doi))
+        return None
+    return pubdate < datetime.datetime.now() - datetime.timedelta(days)
 
 
 def download_xml(doi, tempdir=newarticledir):
@@ -287,13 +308,23 @@ def download_xml(doi, tempdir=newarticledir):
 
 
 def download_updated_xml(article_file,
-                         tempdir=newarticledir):
+                         tempdir=newarticledir,
+                         cache=None,
+                         session=None,
+                         url_func=doi_to_url,
+                         rate_limiter=None):
     """
     For an article file, compare local XML to remote XML
     If they're different, download new version of article
+    Uses a conditional request with the validators stored in `cache`, so an unchanged remote
+    article isn't downloaded at all. When it did change, the body of that one response is
+    what's written to tempdir.
     :param article_file: the filename for a single article
     :param tempdir: directory where files are downloaded to
-    :param vor_check: whether checking to see if uncorrected proof is updated
+    :param cache: ValidatorCache to read and store HTTP validators, defaults to a new one that's saved on return
+    :param session: requests session to reuse, defaults to a new pooled session
+    :param url_func: function transforming a DOI to its XML URL, defaults to `doi_to_url`
+    :param rate_limiter: RateLimiter shared between threads, defaults to None (no limit)
     :return: boolean for whether update was available & downloaded
     """
     article = Article.from_filename(article_file)
@@ -301,23 +332,42 @@ def download_updated_xml(article_file,
         os.mkdir(tempdir)
     except FileExistsError:
         pass
-    articleXML_remote = article.get_remote_xml()
-    if not article_file.endswith('.xml'):
-        article_file += '.xml'
-    try:
-        articleXML_local = article.xml
-    except OSError:
+    if not os.path.isfile(article.filename):
         article.directory = newarticledir
-        articleXML_local = article.xml
-
-    if articleXML_remote == articleXML_local:
+    save_cache = cache is None
+    if save_cache:
+        cache = ValidatorCache()
+    if session is None:
+        session = make_session()
+    url = url_func(article.doi)
+    local_hash = file_hash(article.filename)
+
+    entry = cache.get(article.doi)
+    remote_xml, entry = revalidate(url, entry, session=session, rate_limiter=rate_limiter)
+    if remote_xml is None and local_hash not in (entry.get('sha1'), entry.get('matches')):
+        # remote article unchanged, but the local file isn't a copy of it
+        remote_xml, entry = revalidate(url, {}, session=session, rate_limiter=rate_limiter)
+
+    if remote_xml is None or entry.get('sha1') == local_hash or entry.get('matches') == local_hash:
+        updated = False
+    elif et.tostring(et.parse(BytesIO(remote_xml)), method='xml', encoding='unicode') == article.xml:
+        # same XML, serialized differently
+        entry['matches'] = local_hash
         updated = False
     else:
-        article_new = download_xml(article.doi, tempdir=tempdir)
+        write_atomically([remote_xml], doi_to_path(article.doi, directory=tempdir))
         updated = True
+    cache.set(article.doi, entry)
+    if save_cache:
+        cache.save()
     return updated
 
 
+def _warn_deprecated_step(name):
+    warnings.warn("{} is deprecated; the steps of an update are run by download_check_and_move"
+                  .format(name), DeprecationWarning, stacklevel=3)
+
+
 def check_for_amended_articles(directory=newarticledir, article_list=None):
     """
     For articles in the temporary download directory, check if article_type is an amendment
@@ -327,7 +377,9 @@ def check_for_amended_articles(directory=newarticledir, article_list=None):
     :param article: the filename for a single article
     :param directory: directory where the article file is, default is newarticledir
     :return: list of filenames to existing local files for articles issued an amendment
+    Deprecated: `download_check_and_move` finds amended articles as they're downloaded.
     """
+    _warn_deprecated_step('check_for_amended_articles')
     amended_doi_list = []
     if article_list is None:
         article_list = listdir_nohidden(directory)
@@ -352,17 +404,24 @@ def download_amended_articles(directory=None, tempdir=newarticledir, amended_art
     :param directory: directory where the article file is, default is newarticledir
     :param tempdir: where new articles are downloaded to-
     :return: list of DOIs for articles downloaded with new XML versions
+    Deprecated: `download_check_and_move` revalidates amended articles as they're found.
     """
+    _warn_deprecated_step('download_amended_articles')
     if directory is None:
         directory = get_corpus_dir()
     if amended_article_list is None:
         amended_article_list = check_for_amended_articles(directory)
     amended_updated_article_list = []
     print("Checking amended articles...")
-    for article in tqdm(amended_article_list, disable=None):
-        updated = download_updated_xml(article)
-        if updated:
-            amended_updated_article_list.append(article)
+    cache = ValidatorCache()
+    session = make_session()
+    try:
+        for article in tqdm(amended_article_list, disable=None):
+            updated = download_updated_xml(article, cache=cache, session=session)
+            if updated:
+                amended_updated_article_list.append(article)
+    finally:
+        cache.save()
     print(len(amended_updated_article_list), 'amended articles downloaded with new xml.')
     return amended_updated_article_list
 
@@ -403,7 +462,9 @@ def check_for_uncorrected_proofs(directory=newarticledir, proof_filepath=uncorre
     :param proof_filepath: List of DOIs
     :param directory: Directory containing the article files
     :return: set of all DOIs that are uncorrected proofs, including from main article directory
+    Deprecated: `download_check_and_move` finds uncorrected proofs as they're downloaded.
     """
+    _warn_deprecated_step('check_for_uncorrected_proofs')
 
     # Read in uncorrected proofs from uncorrected_proofs_text_list txt file
     # If uncorrected_proofs txt file doesn't exist, build that set from scratch from main article directory
@@ -432,11 +493,13 @@ def check_for_uncorrected_proofs(directory=newarticledir, proof_filepath=uncorre
     return uncorrected_proofs
 
 
-def check_for_vor_updates(uncorrected_list=None):
+def check_for_vor_updates(uncorrected_list=None, client=None):
     """
     For existing uncorrected proofs list,
     check whether a vor is available to download
+    DOIs are queried in batches as large as the URL length allows, concurrently; see `SolrClient.iter_id_docs`.
     :param uncorrected_list: DOIs of uncorrected articles, default None
+    :param client: SolrClient to query with, defaults to a new one
     :return: List of articles from uncorrected_list for which Solr says there is a new VOR waiting
     """
 
@@ -446,24 +509,12 @@ def check_for_vor_updates(uncorrected_list=None):
     # Make it check a single article
     if isinstance(uncorrected_list, str):
         uncorrected_list = [uncorrected_list]
+    if client is None:
+        client = SolrClient()
 
-    # Create article list chunks for Solr query no longer than 10 DOIs at a time
-    list_chunks = [uncorrected_list[x:x+10] for x in range(0, len(uncorrected_list), 10)]
-    vor_updates_available = []
-    for chunk in list_chunks:
-        article_solr_string = ' OR '.join(chunk)
-
-        # Get up to 10 article records from Solr
-        # Filtered for publication_stage = vor-update-to-corrected-proof
-        VOR_check_url_base = [BASE_URL_API,
-                              '?q=id:(',
-                              article_solr_string,
-                              ')&fq=publication_stage:vor-update-to-uncorrected-proof&',
-                              'fl=publication_stage,+id&wt=json&indent=true']
-        VOR_check_url = ''.join(VOR_check_url_base)
-        vor_check = requests.get(VOR_check_url).json()['response']['docs']
-        vor_chunk_results = [x['id'] for x in vor_check]
-        vor_updates_available.extend(vor_chunk_results)
+    # Filtered for publication_stage = vor-update-to-corrected-proof
+    params = {'fq': 'publication_stage:vor-update-to-uncorrected-proof', 'fl': 'publication_stage,id'}
+    vor_updates_available = [doc['id'] for doc in client.iter_id_docs(sorted(uncorrected_list), params)]
 
     if vor_updates_available:
         print(len(vor_updates_available), "new VOR updates indexed in Solr.")
@@ -485,16 +536,23 @@ def download_vor_updates(directory=None, tempdir=newarticledir,
     :param tempdir: Directory where updated VORs to be downloaded to
     :param vor_updates_available: Partial DOI/filenames of uncorrected articles, default None
     :return: List of articles from uncorrected_list for which new version successfully downloaded
+    Deprecated: `download_check_and_move` checks the uncorrected proofs that are due for a VOR update.
     """
+    _warn_deprecated_step('download_vor_updates')
     if directory is None:
         directory = get_corpus_dir()
     if vor_updates_available is None:
         vor_updates_available = check_for_vor_updates()
     vor_updated_article_list = []
-    for doi in tqdm(vor_updates_available, disable=None):
-        updated = download_updated_xml(doi_to_path(doi), tempdir=tempdir)
-        if updated:
-            vor_updated_article_list.append(doi)
+    cache = ValidatorCache()
+    session = make_session()
+    try:
+        for doi in tqdm(vor_updates_available, disable=None):
+            updated = download_updated_xml(doi_to_path(doi), tempdir=tempdir, cache=cache, session=session)
+            if updated:
+                vor_updated_article_list.append(doi)
+    finally:
+        cache.save()
 
     old_uncorrected_proofs = get_uncorrected_proofs()
     new_uncorrected_proofs_list = list(old_uncorrected_proofs - set(vor_updated_article_list))
@@ -522,54 +580,250 @@ def download_vor_updates(directory=None, tempdir=newarticledir,
     return vor_updated_article_list
 
 
-def remote_proofs_direct_check(tempdir=newarticledir, article_list=None):
+def remote_proofs_direct_check(tempdir=newarticledir, article_list=None, workers=DEFAULT_WORKERS,
+                               rate_limit=DEFAULT_RATE_LIMIT, session=None, url_func=doi_to_url):
     """
     Takes list of of DOIs of uncorrected proofs and compared to raw XML of the article online
     If article status is now 'vor-update-to-uncorrected-proof', download new copy
+    Only the start of each remote file is requested to read its status (see `remote_proof_status`),
+    and articles are checked concurrently.
     This will not be necessary once Solr is indexing VOR article information correctly.
     https://developer.plos.org/jira/browse/DPRO-3418
     :param tempdir: temporary directory for downloading articles
     :param article-list: list of uncorrected proofs to check for updates.
+    :param workers: number of threads, defaults to DEFAULT_WORKERS
+    :param rate_limit: maximum requests per second across all threads, defaults to DEFAULT_RATE_LIMIT
+    :param session: requests session to reuse, defaults to a new pooled session
+    :param url_func: function transforming a DOI to its XML URL, defaults to `doi_to_url`
     :return: list of all articles with updated vor
+    Deprecated: `download_check_and_move` checks the uncorrected proofs that are due for a VOR update.
     """
+    _warn_deprecated_step('remote_proofs_direct_check')
     try:
         os.mkdir(tempdir)
     except FileExistsError:
         pass
-    proofs_download_list = []
     if article_list is None:
         article_list = list(get_uncorrected_proofs())
+    if session is None:
+        session = make_session(pool_size=workers)
+    rate_limiter = RateLimiter(rate_limit)
+
+    def check(doi):
+        return _download_vor_update(doi, tempdir, session, rate_limiter, url_func)
+
     print("Checking directly for additional VOR updates...")
-    for doi in tqdm(article_list, disable=None):
-        f = doi_to_path(doi)
-        updated = download_updated_xml(f)
-        if updated:
-            proofs_download_list.append(doi)
+    proofs_download_list = []
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(check, doi): doi for doi in article_list}
+        for future in tqdm(as_completed(futures), total=len(futures), disable=None):
+            try:
+                if future.result():
+                    proofs_download_list.append(futures[future])
+            except (requests.RequestException, OSError) as e:
+                print('Error checking {}: {}'.format(futures[future], e))
     if proofs_download_list:
         print(len(proofs_download_list),
               "VOR articles directly downloaded.")
     else:
         print("No other new VOR articles found.")
-    return proofs_download_list
-
-
-def download_check_and_move(article_list, proof_filepath, tempdir, destination):
-    """
-    For a list of new articles to get, first download them from journal pages to the temporary directory
-    Next, check these articles for uncorrected proofs and article_type amendments
-    Act on available VOR updates & amended articles
-    Then, move to corpus directory where the rest of the articles are
+    return sorted(proofs_download_list)
+
+
+def _download_vor_update(doi, tempdir, session, rate_limiter, url_func, indexed=False):
+    """Download the version of record of an uncorrected proof, if it has one.
+
+    Unless Solr already has the VOR indexed, only the start of the remote file is read to check
+    (see `remote_proof_status`).
+    :return: boolean for whether the VOR was downloaded
+    """
+    url = url_func(doi)
+    if not indexed and remote_proof_status(url, session=session, rate_limiter=rate_limiter) != 'vor_update':
+        return False
+    download_file(url, doi_to_path(doi, directory=tempdir), session=session, rate_limiter=rate_limiter)
+    return True
+
+
+def download_check_and_move(article_list, proof_filepath, tempdir, destination, workers=DEFAULT_WORKERS,
+                            rate_limit=DEFAULT_RATE_LIMIT, session=None, url_func=doi_to_url, cache=None,
+                            proof_store=None, max_checks=DEFAULT_MAX_CHECKS, solr_client=None):
+    """
+    For a list of new articles to get, download them from journal pages to the temporary directory,
+    check them for uncorrected proofs and article_type amendments, act on available VOR updates &
+    amended articles, then move them to the corpus directory where the rest of the articles are.
+    The steps run as a pipeline of concurrent stages connected by bounded queues:
+        * download: new articles are downloaded to tempdir
+        * classify: each new article is checked as soon as it lands; the articles an amendment
+          amends are sent on to revalidation right away
+        * revalidate: amended articles are checked for new XML with conditional requests
+          (see `download_updated_xml`), and the existing uncorrected proofs that are due for a
+          check (see `ProofStore.due`) are checked for a VOR update, while the downloads are running.
+          Solr is asked about all of them first, in a few batched queries (see `check_for_vor_updates`);
+          the VORs it has indexed are downloaded right away, and for the other proofs only the
+          start of their remote file is read (see `remote_proof_status`)
     :param article_list: List of new articles to download
-    :param proof_filepath: List of uncorrected proofs to check for vor updates
+    :param proof_filepath: Text list of uncorrected proofs, kept up to date with the proof store
     :param tempdir: Directory where articles to be downloaded to
     :param destination: Directory where new articles are to be moved to
+    :param workers: number of download threads, and of revalidation threads, defaults to DEFAULT_WORKERS
+    :param rate_limit: maximum requests per second across all threads, defaults to DEFAULT_RATE_LIMIT
+    :param session: requests session to reuse, defaults to a new pooled session
+    :param url_func: function transforming a DOI to its XML URL, defaults to `doi_to_url`
+    :param cache: ValidatorCache to read and store HTTP validators, defaults to a new one that's saved on return
+    :param proof_store: ProofStore of the uncorrected proofs, defaults to the one in `uncorrected_proofs_state`.
+    If it doesn't exist yet, it's started from the text list.
+    :param max_checks: maximum number of uncorrected proofs to check, defaults to DEFAULT_MAX_CHECKS
+    :param solr_client: SolrClient for the first pass of VOR checks, defaults to a new one
+    :return: dictionary of lists of DOIs: 'downloaded', 'failed', 'amended' (amended articles
+    downloaded with new XML), 'checked_proofs', 'vor_updates', and the remaining 'uncorrected_proofs'
     """
-    repo_download(article_list, tempdir)
-    amended_articles = check_for_amended_articles(directory=tempdir)
-    download_amended_articles(amended_article_list=amended_articles)
-    download_vor_updates()
-    check_for_uncorrected_proofs(directory=tempdir)
+    try:
+        os.mkdir(tempdir)
+    except FileExistsError:
+        pass
+    if session is None:
+        session = make_session(pool_size=2 * workers)
+    rate_limiter = RateLimiter(rate_limit)
+    save_cache = cache is None
+    if save_cache:
+        cache = ValidatorCache()
+    if proof_store is None:
+        proof_store = ProofStore()
+    if not proof_store.loaded:
+        for doi in get_uncorrected_proofs(directory=destination, proof_filepath=proof_filepath):
+            proof_store.add(doi, pubdate=_local_pubdate(doi, destination))
+    now = datetime.datetime.now()
+    due_proofs = proof_store.due(now, max_checks=max_checks)
+    due = set(due_proofs)
+    article_list = sorted(set(article_list))
+    # articles that are already downloaded or revalidated in this update
+    seen = set(article_list)
+    # due proofs that were amended, and due proofs checked without finding a VOR
+    amended_proofs, unchanged_proofs = set(), set()
+    seen_lock = threading.Lock()
+    downloaded, amended, checked_proofs, vor_updates = [], [], [], []
+    new_proofs = {}
+    # proofs whose VOR Solr has indexed
+    indexed_vors = set()
+    progress = tqdm(total=len(article_list), disable=None)
+
+    def download(doi):
+        try:
+            download_file(url_func(doi), doi_to_path(doi, directory=tempdir), session=session,
+                          rate_limiter=rate_limiter)
+        finally:
+            progress.update()
+        downloaded.append(doi)
+        classifier.put(doi)
+
+    def classify(doi):
+        proof, pubdate, amendment, related_dois = Article(doi, directory=tempdir, front_only=True).extract(
+            ['proof', 'pubdate', 'amendment', 'related_dois'])
+        if proof == 'uncorrected_proof':
+            new_proofs[doi] = pubdate
+        if amendment:
+            for amended_doi in related_dois:
+                with seen_lock:
+                    if amended_doi in seen:
+                        continue
+                    seen.add(amended_doi)
+                    if amended_doi in due:
+                        amended_proofs.add(amended_doi)
+                        # revalidated once its proof check is done, unless it has a VOR
+                        if amended_doi not in unchanged_proofs:
+                            continue
+                # amended articles not in the corpus yet are downloaded as new articles in a later update
+                if Article(amended_doi, directory=destination).local:
+                    revalidator.put(amended_doi)
+
+    def revalidate_amended(doi):
+        if download_updated_xml(doi_to_path(doi, directory=destination), tempdir=tempdir,
+                                cache=cache, session=session, url_func=url_func,
+                                rate_limiter=rate_limiter):
+            amended.append(doi)
+
+    def check_for_update(doi):
+        # proofs that aren't due, or were already checked, are revalidated like any amended article
+        if doi not in due or doi in unchanged_proofs:
+            return revalidate_amended(doi)
+        updated = _download_vor_update(doi, tempdir, session, rate_limiter, url_func,
+                                       indexed=doi in indexed_vors)
+        proof_store.checked(doi, now)
+        checked_proofs.append(doi)
+        if updated:
+            vor_updates.append(doi)
+            return
+        with seen_lock:
+            unchanged_proofs.add(doi)
+            amended_proof = doi in amended_proofs
+        # still a proof, but its XML may have changed with the amendment
+        if amended_proof and Article(doi, directory=destination).local:
+            revalidate_amended(doi)
+
+    def feed_proofs():
+        if due_proofs:
+            try:
+                indexed_vors.update(check_for_vor_updates(due_proofs, client=solr_client))
+            except requests.RequestException as e:
+                print('Error checking Solr for VOR updates, checking every proof directly: {}'.format(e))
+        for doi in due_proofs:
+            revalidator.put(doi)
+
+    print("Downloading {} new articles, checking {} of {} uncorrected proofs for VOR updates..."
+          .format(len(article_list), len(due_proofs), len(proof_store)))
+    revalidator = Stage(check_for_update, workers=workers)
+    classifier = Stage(classify)
+    downloader = Stage(download, workers=workers)
+    # the existing uncorrected proofs are checked while the new articles are downloading
+    proof_feeder = threading.Thread(target=feed_proofs, daemon=True)
+    proof_feeder.start()
+    try:
+        for doi in article_list:
+            downloader.put(doi)
+        downloader.join()
+        progress.close()
+        classifier.join()
+        proof_feeder.join()
+        revalidator.join()
+    finally:
+        if save_cache:
+            cache.save()
+
+    for stage, action in ((downloader, 'downloading'), (classifier, 'checking'), (revalidator, 'updating')):
+        for doi, error in sorted(stage.errors.items()):
+            print('Error {} {}: {}'.format(action, doi, error))
+    print(len(downloaded), "new articles downloaded.")
+    print(len(amended), 'amended articles downloaded with new xml.')
+
+    for doi in vor_updates:
+        proof_store.remove(doi)
+    for doi, pubdate in new_proofs.items():
+        proof_store.add(doi, pubdate=pubdate, now=now)
+    too_old_proofs = proof_store.too_old(now=now)
+    if too_old_proofs:
+        print("Proofs older than {} days: {}".format(VOR_OVERDUE_DAYS, too_old_proofs))
+    proof_store.save()
+    uncorrected_proofs = proof_store.dois
+    with open(proof_filepath, 'w') as f:
+        for item in uncorrected_proofs:
+            f.write("%s\n" % item)
+    print("{} uncorrected proofs updated to version of record.\n".format(len(vor_updates)) +
+          "{} new uncorrected proofs found. {} total in set.".format(len(new_proofs), len(uncorrected_proofs)))
+
     move_articles(tempdir, destination)
+    return {'downloaded': sorted(downloaded),
+            'failed': sorted(downloader.errors),
+            'amended': sorted(amended),
+            'checked_proofs': sorted(checked_proofs),
+            'vor_updates': sorted(vor_updates),
+            'uncorrected_proofs': sorted(uncorrected_proofs),
+            }
+
+
+def _local_pubdate(doi, directory):
+    """Publication date of an article in a directory, or None if it isn't there."""
+    article = Article(doi, directory=directory, front_only=True)
+    return article.pubdate if article.local else None
 
 
 def create_local_plos_corpus(directory=None, rm_metadata=True):
@@ -0,0 +1,148 @@
+"""
+Persistent state of the uncorrected proofs in the corpus, and when to check them for a VOR update.
+
+Most uncorrected proofs get their version of record (VOR) within days, but some wait for
+months, so checking every proof on every update wastes requests on the old ones. Each proof
+is stored with when it was first seen, when it was last checked, its publication date and
+how many times it's been checked, and is checked again after an interval that doubles with
+every check (see `recheck_interval`). Each update checks a bounded number of the proofs
+that are due.
+"""
+
+import datetime
+import json
+
+from .. import uncorrected_proofs_state
+from .download import write_atomically
+
+DATE_FORMAT = '%Y-%m-%dT%H:%M:%S'
+# wait before the second check of a proof; doubled after each check
+MIN_RECHECK_INTERVAL = datetime.timedelta(hours=12)
+MAX_RECHECK_INTERVAL = datetime.timedelta(days=32)
+# maximum number of proofs checked in one update
+DEFAULT_MAX_CHECKS = 500
+# days after publication by which a proof usually has its VOR
+VOR_OVERDUE_DAYS = 22
+
+
+def _format_date(date):
+    return date.strftime(DATE_FORMAT) if date else None
+
+
+def _parse_date(string):
+    return datetime.datetime.strptime(string, DATE_FORMAT) if string else None
+
+
+def recheck_interval(checks):
+    """How long to wait after the last check of a proof that has been checked `checks` times."""
+    if checks == 0:
+        return datetime.timedelta(0)
+    interval = MIN_RECHECK_INTERVAL
+    for _ in range(checks - 1):
+        interval *= 2
+        if interval >= MAX_RECHECK_INTERVAL:
+            return MAX_RECHECK_INTERVAL
+    return interval
+
+
+class ProofStore:
+    """JSON file of the uncorrected proofs, keyed by DOI, with their check history.
+
+    Each entry has the 'first_seen' and 'last_checked' dates of the proof, its 'pubdate',
+    and the number of 'checks' made for a VOR update.
+    """
+
+    def __init__(self, path=uncorrected_proofs_state):
+        """
+        :param path: location of the store file, defaults to `uncorrected_proofs_state`
+        """
+        self.path = path
+        self.entries = {}
+        self.loaded = self.load()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, doi):
+        return doi in self.entries
+
+    @property
+    def dois(self):
+        """Sorted list of the DOIs of the uncorrected proofs."""
+        return sorted(self.entries)
+
+    def load(self):
+        """Read the store file, if there is a valid one."""
+        try:
+            with open(self.path, encoding='utf8') as f:
+                self.entries = json.load(f)
+        except (OSError, ValueError):
+            self.entries = {}
+            return False
+        return True
+
+    def save(self):
+        """Write the store file atomically."""
+        content = json.dumps(self.entries, indent=0, sort_keys=True).encode('utf8')
+        write_atomically([content], self.path)
+
+    def add(self, doi, pubdate=None, now=None):
+        """Add an uncorrected proof. Its history is kept if it's already in the store.
+
+        :param doi: DOI of the article
+        :param pubdate: datetime of the article's publication, if known
+        :param now: datetime it was found, defaults to now
+        """
+        if doi in self.entries:
+            return
+        if now is None:
+            now = datetime.datetime.now()
+        self.entries[doi] = {'first_seen': _format_date(now),
+                             'last_checked': None,
+                             'pubdate': _format_date(pubdate),
+                             'checks': 0,
+                             }
+
+    def remove(self, doi):
+        """Remove a proof, e.g. once its VOR is downloaded."""
+        self.entries.pop(doi, None)
+
+    def checked(self, doi, now=None):
+        """Record a check of a proof for a VOR update."""
+        if now is None:
+            now = datetime.datetime.now()
+        entry = self.entries[doi]
+        entry['last_checked'] = _format_date(now)
+        entry['checks'] += 1
+
+    def next_check(self, doi):
+        """Datetime a proof is due to be checked again; None if it's never been checked."""
+        entry = self.entries[doi]
+        last_checked = _parse_date(entry['last_checked'])
+        if last_checked is None:
+            return None
+        return last_checked + recheck_interval(entry['checks'])
+
+    def due(self, now=None, max_checks=DEFAULT_MAX_CHECKS):
+        """The proofs to check in this update.
+
+        :param now: datetime of the update, defaults to now
+        :param max_checks: maximum number of proofs, defaults to DEFAULT_MAX_CHECKS
+        :return: list of DOIs, proofs never checked first, then the longest overdue
+        """
+        if now is None:
+            now = datetime.datetime.now()
+        due = [(self.next_check(doi) or datetime.datetime.min, doi) for doi in self.entries]
+        due = sorted((next_check, doi) for next_check, doi in due if next_check <= now)
+        return [doi for _, doi in due[:max_checks]]
+
+    def too_old(self, days=VOR_OVERDUE_DAYS, now=None):
+        """Proofs published more than `days` days ago, so their VOR is overdue.
+
+        :return: sorted list of DOIs
+        """
+        if now is None:
+            now = datetime.datetime.now()
+        cutoff = now - datetime.timedelta(days)
+        return sorted(doi for doi, entry in self.entries.items()
+                      if entry['pubdate'] and _parse_date(entry['pubdate']) < cutoff)
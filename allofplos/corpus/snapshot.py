@@ -0,0 +1,114 @@
+"""
+A local snapshot of the DOIs of every article indexed by Solr.
+
+Listing every DOI from Solr means downloading up to 500,000 terms, so the list is kept in
+a gzipped JSON file, sorted, along with when it was last updated. Each refresh only asks
+Solr for the articles published since then, and the full list is fetched again
+periodically to reconcile the snapshot with the index (e.g., to drop withdrawn DOIs).
+Because both the snapshot and the corpus DOIs are sorted, the DOIs missing from the corpus
+are found by merging the two lists (see `sorted_difference`).
+"""
+
+import datetime
+import gzip
+import heapq
+import json
+
+from .. import solr_dois_snapshot
+from .download import write_atomically
+from .solr import publication_date_params, SolrClient
+
+SNAPSHOT_VERSION = 1
+DATE_FORMAT = '%Y-%m-%dT%H:%M:%S'
+# how often the full DOI list is fetched again
+RECONCILE_EVERY = datetime.timedelta(days=7)
+# delta queries start this long before the last update, for articles indexed late
+DELTA_OVERLAP = datetime.timedelta(days=2)
+
+
+def sorted_union(*lists):
+    """Merge sorted lists into one sorted list without duplicates."""
+    merged = []
+    for item in heapq.merge(*lists):
+        if not merged or merged[-1] != item:
+            merged.append(item)
+    return merged
+
+
+def sorted_difference(a, b):
+    """Items of sorted list `a` that aren't in sorted list `b`, in order."""
+    difference = []
+    j, len_b = 0, len(b)
+    for item in a:
+        while j < len_b and b[j] < item:
+            j += 1
+        if j == len_b or b[j] != item:
+            difference.append(item)
+    return difference
+
+
+class DoiSnapshot:
+    """Sorted list of the DOIs indexed by Solr, stored locally and refreshed with delta queries."""
+
+    def __init__(self, path=solr_dois_snapshot):
+        """
+        :param path: location of the snapshot file, defaults to `solr_dois_snapshot`
+        """
+        self.path = path
+        self.dois = []
+        self.updated = None
+        self.reconciled = None
+        self.load()
+
+    def __len__(self):
+        return len(self.dois)
+
+    def load(self):
+        """Read the snapshot file, if there is a valid one."""
+        try:
+            with gzip.open(self.path, 'rt', encoding='utf8') as f:
+                data = json.load(f)
+        except (OSError, ValueError, EOFError):
+            return False
+        if data.get('version') != SNAPSHOT_VERSION:
+            return False
+        self.dois = data['dois']
+        self.updated = datetime.datetime.strptime(data['updated'], DATE_FORMAT)
+        self.reconciled = datetime.datetime.strptime(data['reconciled'], DATE_FORMAT)
+        return True
+
+    def save(self):
+        """Write the snapshot file atomically."""
+        data = {'version': SNAPSHOT_VERSION,
+                'updated': self.updated.strftime(DATE_FORMAT),
+                'reconciled': self.reconciled.strftime(DATE_FORMAT),
+                'dois': self.dois,
+                }
+        content = json.dumps(data, separators=(',', ':')).encode('utf8')
+        write_atomically([gzip.compress(content)], self.path)
+
+    def refresh(self, client=None, reconcile_every=RECONCILE_EVERY, now=None):
+        """Bring the snapshot up to date with Solr, and save it.
+
+        Adds the articles published since the last update, or fetches the full list of
+        DOIs if there's no snapshot yet or the last full fetch was `reconcile_every` ago.
+        :param client: SolrClient to query with, defaults to a new one
+        :param reconcile_every: timedelta between full fetches, defaults to RECONCILE_EVERY
+        :param now: datetime of the refresh, defaults to now
+        :return: list of DOIs added to the snapshot
+        """
+        if client is None:
+            client = SolrClient()
+        if now is None:
+            now = datetime.datetime.now()
+        old_dois = self.dois
+        if self.reconciled is None or now - self.reconciled >= reconcile_every:
+            self.dois = sorted(set(client.all_dois()))
+            self.reconciled = now
+        else:
+            params = publication_date_params(self.updated - DELTA_OVERLAP, now)
+            new_dois = sorted(doc['id'] for doc in client.iter_docs(params))
+            self.dois = sorted_union(self.dois, new_dois)
+        self.updated = now
+        self.save()
+        return sorted_difference(self.dois, old_dois)
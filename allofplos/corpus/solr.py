@@ -0,0 +1,199 @@
+"""
+Client for the PLOS Solr search API (http://api.plos.org/solr/search-fields/).
+
+Result pages are fetched concurrently over one pooled `requests.Session`, with the same
+retries and rate limit as article downloads (see `allofplos.corpus.download`). The number of
+results is requested first, so every page offset is known up front and the pages can be
+requested in parallel. For deep paging, where Solr gets slower the further in a page
+starts, results can be paged through with a cursor mark instead, one page after another.
+Queries for a list of DOIs are split into as few `id:(... OR ...)` batches as the URL
+length limit allows, and the batches are requested concurrently.
+"""
+
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from urllib.parse import quote_plus
+
+from ..transformations import BASE_URL_API
+from .download import make_session, RateLimiter, DEFAULT_RATE_LIMIT, DEFAULT_WORKERS
+
+DEFAULT_ROWS = 1000
+# maximum length of the URL-encoded query of a batch of DOIs, well under common URL length limits
+MAX_QUERY_LENGTH = 6000
+TERMS_URL = 'http://api.plos.org/terms'
+# article DOIs, excluding sub-DOIs and image DOIs
+DOI_TERMS_REGEX = (r'10\.1371\/(journal\.p[a-zA-Z]{3}\.[\d]{7}$|annotation\/'
+                   r'[a-zA-Z0-9]{8}-[a-zA-Z0-9]{4}-[a-zA-Z0-9]{4}-[a-zA-Z0-9]{4}-[a-zA-Z0-9]{12}$)')
+
+
+def publication_date_params(start_date, end_date, item='id'):
+    """Solr query parameters for the articles published in a date range, sorted by DOI.
+
+    :param start_date: datetime object of earliest date in the queried range
+    :param end_date: datetime object of latest date in the queried range
+    :param item: field to return for each article, in addition to its DOI ('id')
+    :return: dictionary of query parameters
+    """
+    return {'q': '*:*',
+            'fq': ['doc_type:full -doi:image',
+                   'publication_date:[{}T00:00:00Z TO {}T23:59:59Z]'.format(start_date.strftime("%Y-%m-%d"),
+                                                                          end_date.strftime("%Y-%m-%d")),
+                   ],
+            'fl': 'id' if item == 'id' else 'id,' + item,
+            'wt': 'json',
+            'sort': 'id asc',
+            }
+
+
+def id_batches(ids, max_length=MAX_QUERY_LENGTH):
+    """Split a list of DOIs into batches whose `id:(... OR ...)` query fits in `max_length`.
+
+    :param ids: list of DOIs
+    :param max_length: maximum length of the URL-encoded query, defaults to MAX_QUERY_LENGTH
+    :return: list of lists of DOIs
+    """
+    batches = []
+    batch, length = [], len(quote_plus('id:()'))
+    for id_ in ids:
+        term_length = len(quote_plus(' OR "{}"'.format(id_)))
+        if batch and length + term_length > max_length:
+            batches.append(batch)
+            batch, length = [], len(quote_plus('id:()'))
+        batch.append(id_)
+        length += term_length
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+def id_query(ids):
+    """Solr query for the documents of a list of DOIs."""
+    return 'id:({})'.format(' OR '.join('"{}"'.format(id_) for id_ in ids))
+
+
+class SolrClient:
+    """Solr search API client that fetches pages of results concurrently.
+
+    Usage:
+        client = SolrClient()
+        for offset, docs in client.iter_pages(params):
+            ...
+    """
+
+    def __init__(self, url=BASE_URL_API, workers=DEFAULT_WORKERS, rate_limit=DEFAULT_RATE_LIMIT,
+                 session=None, timeout=60, terms_url=TERMS_URL):
+        """
+        :param url: URL of the search API, defaults to `BASE_URL_API`
+        :param workers: maximum number of pages requested at once, defaults to DEFAULT_WORKERS
+        :param rate_limit: maximum requests per second, defaults to DEFAULT_RATE_LIMIT
+        :param session: requests session, defaults to a new one from `make_session()`
+        :param timeout: seconds to wait for the server, defaults to 60
+        :param terms_url: URL of the terms API, defaults to `TERMS_URL`
+        """
+        self.url = url
+        self.terms_url = terms_url
+        self.workers = workers
+        self.rate_limiter = RateLimiter(rate_limit)
+        self.session = session if session is not None else make_session(pool_size=workers)
+        self.timeout = timeout
+
+    def query(self, params, url=None):
+        """Make one search request.
+
+        :param params: dictionary of query parameters
+        :param url: URL to request, defaults to the search API
+        :return: decoded JSON response
+        """
+        self.rate_limiter.wait()
+        response = self.session.get(url or self.url, params=params, timeout=self.timeout)
+        response.raise_for_status()
+        return response.json()
+
+    def all_dois(self, limit=500000):
+        """Every article DOI in the index, from the terms API.
+
+        :param limit: maximum number of DOIs, defaults to 500,000
+        :return: list of DOIs
+        """
+        params = {'terms.fl': 'id', 'terms.limit': limit, 'terms.regex': DOI_TERMS_REGEX, 'wt': 'json'}
+        # terms alternate with their counts
+        return [term for term in self.query(params, url=self.terms_url)['terms']['id'] if isinstance(term, str)]
+
+    def count(self, params):
+        """Number of results of a query."""
+        return self.query(dict(params, rows=0))['response']['numFound']
+
+    def iter_pages(self, params, rows=DEFAULT_ROWS, start=0, cursor=False):
+        """Generate the pages of results of a query, as they arrive.
+
+        Pages requested concurrently may arrive out of order; use the offsets to order them.
+        :param params: dictionary of query parameters, without 'start' and 'rows'
+        :param rows: number of results per page, defaults to DEFAULT_ROWS
+        :param start: offset of the first result, defaults to 0
+        :param cursor: page through the results one at a time with a cursor mark, for deep paging.
+        The query must be sorted by a unique field, like 'id'.
+        :return: generator of tuples of the offset of a page and its list of result documents
+        """
+        if cursor:
+            if start:
+                raise ValueError("Cursor paging always starts at the first result")
+            return self._iter_cursor_pages(params, rows)
+        return self._iter_offset_pages(params, rows, start)
+
+    def _iter_offset_pages(self, params, rows, start):
+        offsets = iter(range(start, self.count(params), rows))
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            pending = {}
+            try:
+                while True:
+                    # keep a bounded number of pages in flight
+                    for offset in offsets:
+                        future = executor.submit(self.query, dict(params, start=offset, rows=rows))
+                        pending[future] = offset
+                        if len(pending) >= 2 * self.workers:
+                            break
+                    if not pending:
+                        return
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        yield pending.pop(future), future.result()['response']['docs']
+            finally:
+                for future in pending:
+                    future.cancel()
+
+    def _iter_cursor_pages(self, params, rows):
+        offset = 0
+        cursor_mark = '*'
+        while True:
+            results = self.query(dict(params, rows=rows, cursorMark=cursor_mark))
+            docs = results['response']['docs']
+            if docs:
+                yield offset, docs
+            offset += len(docs)
+            if results['nextCursorMark'] == cursor_mark:
+                return
+            cursor_mark = results['nextCursorMark']
+
+    def iter_id_docs(self, ids, params=None, max_length=MAX_QUERY_LENGTH):
+        """Generate the documents of a list of DOIs, querying batches of them concurrently.
+
+        :param ids: list of DOIs
+        :param params: dictionary of other query parameters (e.g., 'fq' and 'fl'), defaults to None
+        :param max_length: maximum length of the URL-encoded query of a batch, defaults to MAX_QUERY_LENGTH
+        :return: generator of result documents, in the order of their batches
+        """
+        params = dict(params or {}, wt='json')
+        batches = id_batches(ids, max_length=max_length)
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            results = executor.map(lambda batch: self.query(dict(params, q=id_query(batch), rows=len(batch))),
+                                   batches)
+            for result in results:
+                yield from result['response']['docs']
+
+    def iter_docs(self, params, **kwargs):
+        """Generate the result documents of a query, as their pages arrive.
+
+        :param params: dictionary of query parameters
+        :param kwargs: keyword arguments of `iter_pages()`
+        """
+        for _, docs in self.iter_pages(params, **kwargs):
+            yield from docs
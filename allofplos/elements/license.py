@@ -1,6 +1,8 @@
 import lxml.etree as et
 import re
 
+from ..plos_xpath import XPATHS
+
 # Creative Commons links
 xlink_href = '{http://www.w3.org/1999/xlink}href'
 cc_by_4_link = 'https://creativecommons.org/licenses/by/4.0/'
@@ -42,20 +44,22 @@ class License():
         copy_year = ''
         copy_holder = ''
         permissions = self.element
-        if permissions.xpath('./copyright-year'):
-            copy_year = int(permissions.xpath('./copyright-year')[0].text.strip())
-        if permissions.xpath('./copyright-holder'):
+        copyright_years = XPATHS['copyright_year'](permissions)
+        if copyright_years:
+            copy_year = int(copyright_years[0].text.strip())
+        copyright_holders = XPATHS['copyright_holder'](permissions)
+        if copyright_holders:
             try:
-                copy_holder = ', '.join([x.text.strip() for x in permissions.xpath('./copyright-holder')])
+                copy_holder = ', '.join([x.text.strip() for x in copyright_holders])
             except AttributeError:
                 print('error getting copyright holder for {}'.format(self.doi))
 
-        license = permissions.xpath('./license')[0]
+        license = XPATHS['license'](permissions)[0]
+        license_links = XPATHS['license_link'](license)
         if license.attrib.get(xlink_href):
             cc_link = license.attrib[xlink_href]
-        elif license.xpath('.//ext-link'):
-            link = license.xpath('.//ext-link')[0]
-            cc_link = link.attrib[xlink_href]
+        elif license_links:
+            cc_link = license_links[0].attrib[xlink_href]
         if cc_link:
             if cc_link == cc_by_4_link or any(x in cc_link for x in ["Attribution", "4.0"]):
                 lic = 'CC-BY 4.0'
@@ -71,7 +75,7 @@ class License():
             elif cc_link == 'http://www.plos.org/oa/':
                 lic = 'CC-BY 3.0 IGO'
             else:
-                print('not 4.0', self.doi, link.attrib[xlink_href])
+                print('not 4.0', self.doi, cc_link)
                 lic = ''
         else:
             lic = self.parse_license(license)
@@ -0,0 +1,188 @@
+"""
+Persistent cache of `Article` property values, shared between processes and sessions.
+
+Values are stored in a SQLite file, keyed by DOI and a hash of the article's XML, so an
+article is parsed only if its file has changed since the values were stored. Usage:
+    cache = FieldCache()
+    article = Article(doi, field_cache=cache)
+    article.title  # from the cache if stored for this version of the file, otherwise parsed and stored
+    cache.close()
+Or for every article in a corpus: `Corpus(field_cache=cache)`.
+"""
+
+import os
+import pickle
+import sqlite3
+import weakref
+
+from . import field_cache_path
+from .corpus.download import file_hash
+from .packed import open_packed
+from .utils import memoized_property
+
+# values written before the changes are committed
+COMMIT_EVERY = 500
+
+
+def _close_connection(connection, pid):
+    """Commit and close a connection of a collected or exiting `FieldCache`."""
+    if os.getpid() == pid:
+        connection.commit()
+        connection.close()
+
+
+class FieldCache:
+    """SQLite file of article property values, keyed by DOI and file hash.
+
+    A file's hash is stored along with its size and modification time, so unchanged files
+    are recognized without reading them. If a file has changed, its stored values are
+    deleted. Each process opens its own connection, so a `FieldCache` can be passed to
+    `Corpus.map()` workers.
+    """
+
+    def __init__(self, path=field_cache_path):
+        """
+        :param path: SQLite file to store values in, defaults to `field_cache_path`
+        """
+        self.path = path
+        self._connection = None
+        self._pid = None
+        self._finalizer = None
+        self.pending = 0
+
+    def __getstate__(self):
+        return {'path': self.path}
+
+    def __setstate__(self, state):
+        self.__init__(state['path'])
+
+    @property
+    def connection(self):
+        """SQLite connection of the current process, created on first use."""
+        if self._connection is None or self._pid != os.getpid():
+            self._connection = sqlite3.connect(self.path, timeout=60)
+            self._pid = os.getpid()
+            # values not committed yet are committed when the cache is collected or at exit
+            if self._finalizer is not None:
+                self._finalizer.detach()
+            self._finalizer = weakref.finalize(self, _close_connection, self._connection, self._pid)
+            self._connection.execute('PRAGMA journal_mode=WAL')
+            self._connection.execute('PRAGMA synchronous=NORMAL')
+            self._connection.execute('CREATE TABLE IF NOT EXISTS files '
+                                     '(doi TEXT PRIMARY KEY, size INTEGER, mtime INTEGER, hash TEXT)')
+            self._connection.execute('CREATE TABLE IF NOT EXISTS fields '
+                                     '(doi TEXT, field TEXT, value BLOB, PRIMARY KEY (doi, field))')
+            self._connection.commit()
+        return self._connection
+
+    def validate(self, article):
+        """Make sure the stored values of an article are for its current XML file.
+
+        Deletes them if the file has changed since they were stored.
+        :param article: Article object
+        :return: True if the article's file exists, False otherwise
+        """
+        if article.packed:
+            container = open_packed(article.directory)
+            if article.doi not in container:
+                return False
+            entry = container.entries[container.doi_files[article.doi]]
+            # length and CRC of the stored XML identify its content without reading it
+            size, mtime, hash_ = entry[3], 0, 'crc32:{}'.format(entry[5])
+        else:
+            try:
+                stat = os.stat(article.filename)
+            except FileNotFoundError:
+                return False
+            size, mtime, hash_ = stat.st_size, stat.st_mtime_ns, None
+        row = self.connection.execute('SELECT size, mtime, hash FROM files WHERE doi = ?',
+                                      (article.doi,)).fetchone()
+        if row is not None and row[:2] == (size, mtime):
+            return True
+        if hash_ is None:
+            hash_ = file_hash(article.filename)
+        if row is None or row[2] != hash_:
+            self.connection.execute('DELETE FROM fields WHERE doi = ?', (article.doi,))
+        self.connection.execute('INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?)',
+                                (article.doi, size, mtime, hash_))
+        self._written()
+        return True
+
+    def load(self, doi):
+        """Stored values of an article, by property name. Call `validate()` first.
+
+        :param doi: DOI of the article
+        :return: dictionary of property names mapped to values
+        """
+        rows = self.connection.execute('SELECT field, value FROM fields WHERE doi = ?', (doi,))
+        return {field: pickle.loads(value) for field, value in rows}
+
+    def store(self, doi, field, value):
+        """Store the value of an article's property."""
+        self.connection.execute('INSERT OR REPLACE INTO fields VALUES (?, ?, ?)',
+                                (doi, field, pickle.dumps(value, pickle.HIGHEST_PROTOCOL)))
+        self._written()
+
+    def _written(self):
+        self.pending += 1
+        if self.pending >= COMMIT_EVERY:
+            self.commit()
+
+    def commit(self):
+        """Commit the values stored so far, making them visible to other processes."""
+        if self._connection is not None and self._pid == os.getpid():
+            self._connection.commit()
+        self.pending = 0
+
+    def close(self):
+        """Commit and close the connection of the current process."""
+        self.commit()
+        if self._connection is not None and self._pid == os.getpid():
+            self._connection.close()
+        if self._finalizer is not None:
+            self._finalizer.detach()
+            self._finalizer = None
+        self._connection = None
+
+    def fields(self, article):
+        """The memoized-value dictionary for an article (see `Article.reset_memoized_attrs()`)."""
+        return CachedFields(self, article)
+
+
+class CachedFields(dict):
+    """Memoized property values of an article, backed by a `FieldCache`.
+
+    The stored values of the article are loaded the first time a property is looked up,
+    and new values of memoized properties are stored as they're computed.
+    """
+
+    def __init__(self, field_cache, article):
+        super().__init__()
+        self.field_cache = field_cache
+        self.article = article
+        self.loaded = False
+        self.valid = False
+
+    def load(self):
+        self.loaded = True
+        self.valid = self.field_cache.validate(self.article)
+        if self.valid:
+            stored = self.field_cache.load(self.article.doi)
+            stored.update(self)
+            super().update(stored)
+
+    def __missing__(self, key):
+        if not self.loaded:
+            self.load()
+            if key in self:
+                return self[key]
+        raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        # only property values: `Article.extract()` may add other attributes to the dictionary
+        if isinstance(getattr(type(self.article), key, None), memoized_property):
+            if not self.loaded:
+                self.load()
+            if self.valid:
+                self.field_cache.store(self.article.doi, key, value)
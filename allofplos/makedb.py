@@ -7,20 +7,17 @@ Make a SQLite DB out of articles XML files
 
 import argparse
 import datetime
+import functools
 import os
-import random
-
-from tqdm import tqdm
-import sqlite3
 
 from peewee import Model, CharField, ForeignKeyField, TextField, \
-    DateTimeField, BooleanField, IntegerField, IntegrityError
+    DateTimeField, BooleanField, IntegerField, IntegrityError, JOIN, Proxy
 from playhouse.sqlite_ext import SqliteExtDatabase
 
-from .corpus import Corpus
+from .corpus import Corpus, CorpusIndex
+from .corpus.download import file_hash
 from .transformations import filename_to_doi, convert_country
 from . import starterdir
-from .article import Article
 
 journal_title_dict = {
     'PLOS ONE': 'PLOS ONE',
@@ -42,26 +39,8 @@ journal_title_dict = {
 }
 
 
-parser = argparse.ArgumentParser()
-parser.add_argument('--db', action='store', help=
-                    'Name the db', default='ploscorpus.db')
-parser.add_argument('--random', action='store', type=int, help=
-                    'Number of articles in a random subset. '
-                    'By default will use all articles')
-parser.add_argument('--starterdb', action='store_true', help=
-                    'Make the starter database', dest='starter')
-args = parser.parse_args()
-
-# TODO: Put a warning that the DB will be deleted
-if os.path.isfile(args.db):
-    os.remove(args.db)
-
-if args.starter:
-    if os.path.isfile('starter.db'):
-        os.remove('starter.db')
-    db = SqliteExtDatabase('starter.db')
-else:
-    db = SqliteExtDatabase(args.db)
+# database the models are bound to; set to a SqliteExtDatabase by `build_database()`
+db = Proxy()
 
 class BaseModel(Model):
     class Meta:
@@ -112,112 +91,357 @@ class CoAuthorPLOSArticle(BaseModel):
     corr_author = ForeignKeyField(CorrespondingAuthor)
     article = ForeignKeyField(PLOSArticle)
 
-db.connect()
-db.create_tables([Journal, PLOSArticle, ArticleType, CoAuthorPLOSArticle,
-                  CorrespondingAuthor, JATSType, Affiliations, Country,
-                  SubjectsPLOSArticle, Subjects])
-
-
-corpus_dir = starterdir if args.starter else None
-allfiles = Corpus(corpus_dir).files
-files = random.sample(allfiles, args.random) if args.random else allfiles
-
-for file_ in tqdm(files):
-    doi = filename_to_doi(file_)
-    article = Article(doi)
-    journal_name = journal_title_dict[article.journal.upper()]
-    with db.atomic() as atomic:
-        try:
-            journal = Journal.create(journal = journal_name)
-        except IntegrityError:
-            db.rollback()
-            journal = Journal.get(Journal.journal == journal_name)
-    with db.atomic() as atomic:
-        try:
-            article_type = ArticleType.create(article_type = article.plostype)
-        except IntegrityError:
-            db.rollback()
-            article_type = ArticleType.get(ArticleType.article_type == article.plostype)
-    with db.atomic() as atomic:
-        try:
-            j_type = JATSType.create(jats_type = article.type_)
-        except IntegrityError:
-            db.rollback()
-            j_type = JATSType.get(JATSType.jats_type == article.type_)
-    p_art = PLOSArticle.create(
-        DOI = doi,
-        journal = journal,
-        abstract=article.abstract.replace('\n', '').replace('\t', ''),
-        title = article.title.replace('\n', '').replace('\t', ''),
-        plostype = article_type,
-        created_date = article.pubdate,
-        word_count=article.word_count,
-        JATS_type = j_type)
-    # Get subject information
+class ArticleFile(BaseModel):
+    """The XML file an article was loaded from, for incremental updates."""
+    article = ForeignKeyField(PLOSArticle, unique=True)
+    filename = TextField()
+    size = IntegerField()
+    mtime = IntegerField()
+    sha1 = CharField(null=True)
+
+MODELS = [Journal, PLOSArticle, ArticleType, CoAuthorPLOSArticle,
+          CorrespondingAuthor, JATSType, Affiliations, Country,
+          SubjectsPLOSArticle, Subjects, ArticleFile]
+
+
+def get_article_data(article, sha1=False):
+    """Extract the values that go into the database from an article.
+
+    :param article: Article object
+    :param sha1: whether to hash the article's XML file, defaults to False
+    :return: dictionary of the article's row values, plus its `subjects` (sorted list of
+    taxonomy terms), `corr_authors` (list of corresponding author tuples of email,
+    top-level domain, given names, surname, group name, affiliation and country), and
+    `sha1` of its XML file (None if not hashed)
+    """
+    record = article.extract(['doi', 'journal', 'abstract', 'title', 'plostype', 'pubdate',
+                              'word_count', 'type_', 'taxonomy'])
     taxonomy_set = set()
-    taxonomy = article.taxonomy
-    for values in taxonomy.values():
+    for values in record.taxonomy.values():
         for value in values:
             for taxon in value:
                 taxonomy_set.add(taxon)
-    for taxon in taxonomy_set:
-        with db.atomic() as atomic:
-            try:
-                subject = Subjects.create(subjects = taxon)
-            except (sqlite3.IntegrityError, IntegrityError):
-                db.rollback()
-                subject = Subjects.get(Subjects.subjects == taxon)
-        SubjectsPLOSArticle.create(
-                subject = subject,
-                article = p_art
-            )
-    if article.authors:
-        iterable_authors = article.authors
-    else:
-        iterable_authors = []
-    for auths in iterable_authors:
+    corr_authors = []
+    for auths in article.authors or []:
         if auths['email']:
-            with db.atomic() as atomic:
-                if auths['affiliations']:
-                    author_aff = auths['affiliations'][0]
-                else:
-                    author_aff = 'N/A'
-                try:
-                    aff = Affiliations.create(affiliations = author_aff)
-                except (sqlite3.IntegrityError, IntegrityError):
-                    db.rollback()
-                    aff = Affiliations.get(Affiliations.affiliations ==
-                                           author_aff)
-            with db.atomic() as atomic:
-                try:
-                    if auths['affiliations'][0] == '':
-                        country_from_aff = 'N/A'
-                    else:
-                        country_from_aff = auths['affiliations'][0].\
-                                           split(',')[-1].strip()
-                except IndexError:
+            if auths['affiliations']:
+                author_aff = auths['affiliations'][0]
+            else:
+                author_aff = 'N/A'
+            try:
+                if auths['affiliations'][0] == '':
                     country_from_aff = 'N/A'
-                country_from_aff = convert_country(country_from_aff)
-                try:
-                    country = Country.create(country = country_from_aff)
-                except IntegrityError:
-                    db.rollback()
-                    country = Country.get(Country.country == country_from_aff)
+                else:
+                    country_from_aff = auths['affiliations'][0].split(',')[-1].strip()
+            except IndexError:
+                country_from_aff = 'N/A'
+            email = auths['email'][0]
+            corr_authors.append((email, email.split('.')[-1], auths['given_names'],
+                                 auths['surname'], auths['group_name'], author_aff,
+                                 convert_country(country_from_aff)))
+    return {'doi': record.doi,
+            'journal': journal_title_dict[record.journal.upper()],
+            'abstract': record.abstract.replace('\n', '').replace('\t', ''),
+            'title': record.title.replace('\n', '').replace('\t', ''),
+            'plostype': record.plostype,
+            'created_date': record.pubdate,
+            'word_count': record.word_count,
+            'jats_type': record.type_,
+            'subjects': sorted(taxonomy_set),
+            'corr_authors': corr_authors,
+            'sha1': file_hash(article.filename) if sha1 and not article.packed else None,
+            }
 
-            try:
-                co_author = CorrespondingAuthor.create(
-                    corr_author_email = auths['email'][0],
-                    tld = auths['email'][0].split('.')[-1],
-                    given_name = auths['given_names'],
-                    surname = auths['surname'],
-                    group_name = auths['group_name'],
-                    affiliation = aff,
-                    country = country
-                    )
-            except IntegrityError:
-                co_author = CorrespondingAuthor.\
-                            get(CorrespondingAuthor.corr_author_email == auths['email'][0])
-            coauthplosart = CoAuthorPLOSArticle.create(
-                    corr_author = co_author,
-                    article = p_art
-                )
+
+def set_build_pragmas(db):
+    """Speed up bulk loading: write-ahead log, no fsync, and a 256 MB page cache.
+
+    Only safe while building a database from scratch: a crash can corrupt it.
+    """
+    db.execute_sql('PRAGMA journal_mode=WAL')
+    db.execute_sql('PRAGMA synchronous=OFF')
+    db.execute_sql('PRAGMA cache_size=-262144')
+    db.execute_sql('PRAGMA temp_store=MEMORY')
+
+
+def reset_build_pragmas(db):
+    """Back to the default rollback journal, so the database is a single self-contained file."""
+    db.execute_sql('PRAGMA synchronous=FULL')
+    db.execute_sql('PRAGMA journal_mode=DELETE')
+
+
+class BulkLoader:
+    """Insert articles into the database in large batches.
+
+    The lookup tables (journals, article types, subjects, etc.) are kept in dictionaries
+    mapping each value to its row ID, so finding or creating a foreign key never needs a
+    query. IDs are assigned here, and rows are written with `insert_many` in one
+    transaction per batch.
+    """
+
+    # lookup table models and the field holding their unique value
+    lookup_fields = ((Journal, 'journal'),
+                     (ArticleType, 'article_type'),
+                     (JATSType, 'jats_type'),
+                     (Subjects, 'subjects'),
+                     (Affiliations, 'affiliations'),
+                     (Country, 'country'),
+                     (CorrespondingAuthor, 'corr_author_email'))
+    # highest number of values in one INSERT statement (SQLite's default variable limit)
+    max_variables = 999
+
+    def __init__(self, batch_size=1000):
+        """
+        Row IDs continue from those already in the database.
+        :param batch_size: number of articles inserted per transaction, defaults to 1000
+        """
+        self.batch_size = batch_size
+        self.ids = {}
+        self.next_id = {}
+        for model, field in self.lookup_fields + ((PLOSArticle, 'DOI'),):
+            values = model.select(model.id, getattr(model, field)).tuples()
+            self.ids[model] = {value: id_ for id_, value in values}
+            self.next_id[model] = max(self.ids[model].values(), default=0) + 1
+        self.rows = {model: [] for model in self.insert_order}
+        self.articles = 0
+
+    @property
+    def insert_order(self):
+        return [model for model, field in self.lookup_fields] + \
+            [PLOSArticle, SubjectsPLOSArticle, CoAuthorPLOSArticle, ArticleFile]
+
+    def get_id(self, model, value, **row):
+        """The ID of a value in a lookup table, adding a row for it if it's new."""
+        ids = self.ids[model]
+        id_ = ids.get(value)
+        if id_ is None:
+            id_ = ids[value] = self.next_id[model]
+            self.next_id[model] += 1
+            row['id'] = id_
+            row[dict(self.lookup_fields)[model]] = value
+            self.rows[model].append(row)
+        return id_
+
+    def add(self, data, article_id=None, source=None):
+        """Queue an article's rows for insertion, flushing when the batch is full.
+
+        :param data: dictionary from `get_article_data()`
+        :param article_id: ID of the article row, defaults to the next free ID
+        :param source: dictionary of the `filename`, `size`, `mtime` and `sha1` of the
+        article's XML file, stored for incremental updates; defaults to None
+        """
+        if data['doi'] in self.ids[PLOSArticle]:
+            raise IntegrityError('Article already in database: {}'.format(data['doi']))
+        if article_id is None:
+            article_id = self.next_id[PLOSArticle]
+            self.next_id[PLOSArticle] += 1
+        self.ids[PLOSArticle][data['doi']] = article_id
+        self.rows[PLOSArticle].append({
+            'id': article_id,
+            'DOI': data['doi'],
+            'journal': self.get_id(Journal, data['journal']),
+            'abstract': data['abstract'],
+            'title': data['title'],
+            'plostype': self.get_id(ArticleType, data['plostype']),
+            'created_date': data['created_date'],
+            'word_count': data['word_count'],
+            'JATS_type': self.get_id(JATSType, data['jats_type']),
+            })
+        for taxon in data['subjects']:
+            self.rows[SubjectsPLOSArticle].append({'subject': self.get_id(Subjects, taxon),
+                                                   'article': article_id})
+        for email, tld, given_name, surname, group_name, aff, country in data['corr_authors']:
+            co_author = self.get_id(CorrespondingAuthor, email,
+                                    tld=tld,
+                                    given_name=given_name,
+                                    surname=surname,
+                                    group_name=group_name,
+                                    affiliation=self.get_id(Affiliations, aff),
+                                    country=self.get_id(Country, country))
+            self.rows[CoAuthorPLOSArticle].append({'corr_author': co_author, 'article': article_id})
+        if source is not None:
+            self.rows[ArticleFile].append(dict(source, article=article_id))
+        self.articles += 1
+        if self.articles >= self.batch_size:
+            self.flush()
+
+    def delete(self, dois):
+        """Delete articles, and the rows linking them to subjects, authors, and files.
+
+        :param dois: DOIs of articles in the database
+        :return: dictionary of the deleted DOIs mapped to their former article IDs
+        """
+        deleted = {doi: self.ids[PLOSArticle].pop(doi) for doi in dois}
+        article_ids = list(deleted.values())
+        with db.atomic():
+            for i in range(0, len(article_ids), 500):
+                chunk = article_ids[i:i+500]
+                for model in (SubjectsPLOSArticle, CoAuthorPLOSArticle, ArticleFile):
+                    model.delete().where(model.article.in_(chunk)).execute()
+                PLOSArticle.delete().where(PLOSArticle.id.in_(chunk)).execute()
+        return deleted
+
+    def flush(self):
+        """Insert all queued rows in a single transaction."""
+        with db.atomic():
+            for model in self.insert_order:
+                rows = self.rows[model]
+                if not rows:
+                    continue
+                # every row of a table has the same fields
+                rows_per_insert = max(1, self.max_variables // len(rows[0]))
+                for i in range(0, len(rows), rows_per_insert):
+                    model.insert_many(rows[i:i+rows_per_insert]).execute()
+                self.rows[model] = []
+        self.articles = 0
+
+
+def get_source(index, filename, sha1=None):
+    """Row values for `ArticleFile`, from the corpus index entry of an article file.
+
+    The SHA-1 of new articles is filled in from `get_article_data()` when they're loaded
+    incrementally. Full builds don't hash files; they're hashed the first time they change.
+    """
+    row = index.get(filename)
+    return {'filename': row['filename'], 'size': row['size'], 'mtime': row['mtime'], 'sha1': sha1}
+
+
+def find_changed_articles(corpus):
+    """Compare the corpus directory to the article files the database was loaded from.
+
+    An article has changed if its file's size or mtime differ and its SHA-1 differs (or
+    wasn't recorded). Articles loaded before file information was kept count as changed.
+    :param corpus: Corpus the database was built from
+    :return: tuple of lists of new, changed, and removed DOIs, and dict of the sources of
+    new and changed articles for `BulkLoader.add()`
+    """
+    index = corpus.index
+    if not isinstance(index, CorpusIndex):
+        raise TypeError("Incremental updates need a corpus directory, not {}".format(corpus.directory))
+    index.refresh(full=True)
+    loaded = {doi: (article_id, size, mtime, sha1) for doi, article_id, size, mtime, sha1 in
+              PLOSArticle.select(PLOSArticle.DOI, PLOSArticle.id, ArticleFile.size,
+                                 ArticleFile.mtime, ArticleFile.sha1)
+              .join(ArticleFile, JOIN.LEFT_OUTER).tuples()}
+    new = []
+    changed = []
+    sources = {}
+    for row in index.rows():
+        doi = row['doi']
+        if doi not in loaded:
+            new.append(doi)
+            sources[doi] = get_source(index, row['filename'])
+            continue
+        article_id, size, mtime, sha1 = loaded[doi]
+        if (size, mtime) == (row['size'], row['mtime']):
+            continue
+        new_sha1 = file_hash(os.path.join(corpus.directory, row['filename']))
+        if sha1 is None or sha1 != new_sha1:
+            changed.append(doi)
+        sources[doi] = get_source(index, row['filename'], sha1=new_sha1)
+    removed = [doi for doi in loaded if doi not in index]
+    # files touched without changing; only their size & mtime are updated
+    with db.atomic():
+        for doi in set(sources) - set(new) - set(changed):
+            ArticleFile.update(**sources[doi]).where(ArticleFile.article == loaded[doi][0]).execute()
+    return new, changed, removed, {doi: sources[doi] for doi in new + changed}
+
+
+def build_database(corpus, db_path, sample=None, workers=1, batch_size=1000,
+                   incremental=False, progress=None):
+    """Build a SQLite database of the articles in a corpus.
+
+    Any existing database at `db_path` is replaced, unless `incremental` is True.
+    :param corpus: Corpus, or directory of article XML files
+    :param db_path: path of the SQLite database file
+    :param sample: number of articles in a random subset, defaults to None (all articles)
+    :param workers: number of processes reading articles, defaults to 1
+    :param batch_size: number of articles inserted per transaction, defaults to 1000
+    :param incremental: only load articles that are new or changed since the database was
+    built, and delete removed ones, defaults to False. See `find_changed_articles()`.
+    :param progress: function called with the number of articles loaded so far and the total
+    after each article, defaults to None (shows a progress bar)
+    :return: dictionary of the number of 'new', 'changed', and 'removed' articles
+    """
+    if not isinstance(corpus, Corpus):
+        corpus = Corpus(corpus)
+    if incremental and sample:
+        raise ValueError("A random sample can't be loaded incrementally")
+    if not incremental:
+        for path in (db_path, db_path + '-wal', db_path + '-shm'):
+            if os.path.isfile(path):
+                os.remove(path)
+    db.initialize(SqliteExtDatabase(db_path))
+    db.connect()
+    try:
+        db.create_tables(MODELS, safe=True)
+        loader = BulkLoader(batch_size=batch_size)
+        if incremental:
+            new, changed, removed, sources = find_changed_articles(corpus)
+            loader.delete(removed)
+            # changed articles are loaded again with the same IDs
+            article_ids = loader.delete(changed)
+            dois = sorted(new + changed)
+        else:
+            files = corpus.files
+            if sample:
+                files = corpus.random.sample(files, sample)
+            dois = [filename_to_doi(file_) for file_ in files]
+            new, changed, removed = dois, [], []
+            article_ids = {}
+            index = corpus.index
+            sources = {doi: get_source(index, file_) for doi, file_ in zip(dois, files)} \
+                if isinstance(index, CorpusIndex) else {}
+            # no other connection is using the database while it's built from scratch
+            set_build_pragmas(db)
+
+        # articles are read in worker processes; at most 2 * workers chunks are in flight, so
+        # memory use doesn't grow with the size of the corpus
+        # the file hash is only needed to compare files in later incremental updates
+        func = functools.partial(get_article_data, sha1=True) if incremental else get_article_data
+        results = corpus.map(func, processes=workers, dois=dois,
+                             chunksize=100, ordered=True, progress=progress is None)
+        for i, data in enumerate(results, 1):
+            source = sources.get(data['doi'])
+            if source is not None:
+                source['sha1'] = data['sha1']
+            loader.add(data, article_id=article_ids.get(data['doi']), source=source)
+            if progress is not None:
+                progress(i, len(dois))
+        loader.flush()
+        reset_build_pragmas(db)
+    finally:
+        db.close()
+    return {'new': len(new), 'changed': len(changed), 'removed': len(removed)}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--db', action='store', help=
+                        'Name the db', default='ploscorpus.db')
+    parser.add_argument('--random', action='store', type=int, help=
+                        'Number of articles in a random subset. '
+                        'By default will use all articles')
+    parser.add_argument('--starterdb', action='store_true', help=
+                        'Make the starter database', dest='starter')
+    parser.add_argument('--workers', action='store', type=int, default=1, help=
+                        'Number of processes reading articles. '
+                        'The database is always written by a single process')
+    parser.add_argument('--incremental', action='store_true', help=
+                        'Update an existing db with only the articles added, changed, '
+                        'or removed since it was built, instead of rebuilding it')
+    args = parser.parse_args()
+    if args.incremental and args.random:
+        parser.error('--random can\'t be used with --incremental')
+
+    # TODO: Put a warning that the DB will be deleted
+    db_path = 'starter.db' if args.starter else args.db
+    corpus = Corpus(starterdir if args.starter else None)
+    counts = build_database(corpus, db_path, sample=args.random, workers=args.workers,
+                            incremental=args.incremental)
+    if args.incremental:
+        print("{new} new, {changed} changed, and {removed} removed articles.".format(**counts))
+
+
+if __name__ == '__main__':
+    main()
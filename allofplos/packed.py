@@ -0,0 +1,378 @@
+"""
+A packed corpus: all article XML files in one append-only container file.
+
+Loose XML files in one huge directory are slow to list, back up, and sync, so a corpus
+can instead be stored as a single `.plospack` file. Each article is compressed
+separately (with zstd if the `zstandard` package is installed, otherwise zlib), and
+a DOI->offset index kept in `<file>.idx` gives random access to any article through
+a memory map of the container.
+
+Container layout: the `PACK_MAGIC` header, followed by one record per article:
+    codec (1 byte), filename length (2), stored length (4), XML length (4), XML CRC-32 (4),
+    the article filename (UTF-8, as in a corpus directory), then the compressed XML.
+Updating an article appends a new record; the index points to the latest one. The
+index can always be rebuilt by scanning the records, so an index that is missing or
+behind the container (e.g. after a crash) is brought up to date when it's opened.
+
+Usage:
+`pack_directory(corpus_dir, 'allofplos.plospack')`
+`corpus = Corpus('allofplos.plospack')` or `article = Article(doi, directory='allofplos.plospack')`
+"""
+
+import json
+import mmap
+import os
+import struct
+import tempfile
+import zipfile
+import zlib
+
+from tqdm import tqdm
+
+from .transformations import doi_to_path, filename_to_doi
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+PACKED_EXTENSION = '.plospack'
+INDEX_SUFFIX = '.idx'
+PACK_MAGIC = b'PLOSPAK1'
+RECORD_HEADER = struct.Struct('<BHIII')
+
+CODEC_NONE = 0
+CODEC_ZLIB = 1
+CODEC_ZSTD = 2
+# record of an article that was removed from the container
+CODEC_REMOVED = 255
+
+# how often an update is written to the index file, in records
+INDEX_SAVE_INTERVAL = 10000
+
+# readers shared between Article objects, by container path
+_open_packs = {}
+
+
+def is_packed(path):
+    """Whether a corpus location is a packed container file rather than a directory."""
+    return path.endswith(PACKED_EXTENSION) and os.path.isfile(path)
+
+
+def get_packed_path(directory):
+    """Container path that corresponds to a corpus directory, e.g. `allofplos_xml.plospack`."""
+    if directory.endswith(PACKED_EXTENSION):
+        return directory
+    return os.path.normpath(directory) + PACKED_EXTENSION
+
+
+def default_codec():
+    return CODEC_ZSTD if zstandard is not None else CODEC_ZLIB
+
+
+def compress(data, codec):
+    if codec == CODEC_NONE:
+        return data
+    if codec == CODEC_ZLIB:
+        return zlib.compress(data, 6)
+    if codec == CODEC_ZSTD:
+        if zstandard is None:
+            raise ImportError("zstd compression requires the zstandard package. "
+                              "Install it with `pip install allofplos[packed]`.")
+        return zstandard.ZstdCompressor(level=9).compress(data)
+    raise ValueError("Unknown codec: {}".format(codec))
+
+
+def decompress(data, codec, size):
+    if codec == CODEC_NONE:
+        return bytes(data)
+    if codec == CODEC_ZLIB:
+        return zlib.decompress(data)
+    if codec == CODEC_ZSTD:
+        if zstandard is None:
+            raise ImportError("This packed corpus uses zstd compression, which requires the "
+                              "zstandard package. Install it with `pip install allofplos[packed]`.")
+        return zstandard.ZstdDecompressor().decompress(data, max_output_size=size)
+    raise ValueError("Unknown codec: {}".format(codec))
+
+
+class PackedCorpus:
+    """Reader and writer of a packed corpus container.
+
+    Has the same `files`, `dois`, `doi_files` and `file_set` attributes as `CorpusIndex`,
+    so a `Corpus` can use it as its index.
+    """
+
+    def __init__(self, path):
+        """Open a container, creating it if it doesn't exist.
+
+        :param path: path of the `.plospack` file
+        """
+        self.path = path
+        self.index_path = path + INDEX_SUFFIX
+        if not os.path.isfile(path):
+            with open(path, 'wb') as f:
+                f.write(PACK_MAGIC)
+        # filename -> (DOI, offset of compressed data, stored length, XML length, codec, CRC-32)
+        self.entries = {}
+        self.doi_files = {}
+        self.indexed_size = len(PACK_MAGIC)
+        self._mmap = None
+        self._mmap_size = 0
+        self._writer = None
+        self._unsaved = 0
+        # container size when it was last scanned for new records
+        self._scanned_size = None
+        self._load_index()
+        self._set_lookups()
+        self.refresh()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, doi):
+        return doi in self.doi_files
+
+    def __iter__(self):
+        return iter(self.dois)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _set_lookups(self):
+        self.files = sorted(self.entries)
+        self.dois = [self.entries[f][0] for f in self.files]
+        self.file_set = frozenset(self.files)
+
+    def _set_entry(self, filename, entry):
+        if entry is None:
+            old_entry = self.entries.pop(filename, None)
+            if old_entry is not None:
+                del self.doi_files[old_entry[0]]
+        else:
+            self.entries[filename] = entry
+            self.doi_files[entry[0]] = filename
+
+    def _load_index(self):
+        try:
+            with open(self.index_path, encoding='utf8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        if data.get('size', 0) > os.path.getsize(self.path):
+            # the container was replaced or truncated; rebuild from scratch
+            return
+        self.entries = {filename: tuple(entry) for filename, entry in data['entries'].items()}
+        self.doi_files = {entry[0]: filename for filename, entry in self.entries.items()}
+        self.indexed_size = data['size']
+
+    def save_index(self):
+        """Write the index file atomically. Silently skipped if it can't be written."""
+        data = {'size': self.indexed_size, 'entries': self.entries}
+        try:
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(self.index_path)),
+                                            suffix=INDEX_SUFFIX)
+        except OSError:
+            return False
+        try:
+            with os.fdopen(fd, 'w', encoding='utf8') as f:
+                json.dump(data, f, separators=(',', ':'))
+            os.replace(tmp_path, self.index_path)
+        except OSError:
+            os.remove(tmp_path)
+            return False
+        self._unsaved = 0
+        return True
+
+    def refresh(self):
+        """Index any records appended to the container since the index was last saved.
+
+        :return: whether the index changed
+        """
+        if self._writer is not None:
+            self._writer.flush()
+        size = os.path.getsize(self.path)
+        if size in (self.indexed_size, self._scanned_size):
+            return False
+        self._scanned_size = size
+        with open(self.path, 'rb') as f:
+            if self.indexed_size == len(PACK_MAGIC) and f.read(len(PACK_MAGIC)) != PACK_MAGIC:
+                raise ValueError("Not a packed corpus file: {}".format(self.path))
+            f.seek(self.indexed_size)
+            offset = self.indexed_size
+            while offset + RECORD_HEADER.size <= size:
+                codec, name_length, stored, length, crc = RECORD_HEADER.unpack(f.read(RECORD_HEADER.size))
+                data_offset = offset + RECORD_HEADER.size + name_length
+                if data_offset + stored > size:
+                    # incomplete record at the end, from an interrupted write
+                    break
+                filename = f.read(name_length).decode('utf8')
+                if codec == CODEC_REMOVED:
+                    self._set_entry(filename, None)
+                else:
+                    doi = filename_to_doi(filename)
+                    self._set_entry(filename, (doi, data_offset, stored, length, codec, crc))
+                f.seek(stored, os.SEEK_CUR)
+                offset = data_offset + stored
+        if offset == self.indexed_size:
+            return False
+        self.indexed_size = offset
+        self._set_lookups()
+        self.save_index()
+        return True
+
+    def _get_mmap(self):
+        if self._mmap is None or self._mmap_size < self.indexed_size:
+            if self._mmap is not None:
+                self._mmap.close()
+            with open(self.path, 'rb') as f:
+                self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self._mmap_size = len(self._mmap)
+        return self._mmap
+
+    def read(self, doi):
+        """The XML of an article, as bytes.
+
+        :param doi: DOI of an article in the container
+        :raises KeyError: if the article isn't in the container
+        """
+        doi, offset, stored, length, codec, crc = self.entries[self.doi_files[doi]]
+        if self._writer is not None:
+            self._writer.flush()
+        data = self._get_mmap()[offset:offset + stored]
+        return decompress(data, codec, length)
+
+    def matches(self, doi, length, crc):
+        """Whether the stored XML of an article has this length and CRC-32."""
+        entry = self.entries.get(self.doi_files.get(doi))
+        return entry is not None and entry[3] == length and entry[5] == crc
+
+    def _append(self, filename, data, codec, length, crc):
+        if self._writer is None:
+            self._writer = open(self.path, 'r+b')
+            # drop any incomplete record left by an interrupted write
+            self._writer.truncate(self.indexed_size)
+            self._writer.seek(self.indexed_size)
+        name_bytes = filename.encode('utf8')
+        self._writer.write(RECORD_HEADER.pack(codec, len(name_bytes), len(data), length, crc))
+        self._writer.write(name_bytes)
+        self._writer.write(data)
+        data_offset = self.indexed_size + RECORD_HEADER.size + len(name_bytes)
+        self.indexed_size = data_offset + len(data)
+        self._unsaved += 1
+        return data_offset
+
+    def add(self, doi, xml, codec=None):
+        """Add or replace an article.
+
+        :param doi: DOI of the article
+        :param xml: article XML as bytes
+        :param codec: compression codec, defaults to zstd if available, else zlib
+        """
+        if codec is None:
+            codec = default_codec()
+        data = compress(xml, codec)
+        crc = zlib.crc32(xml)
+        filename = self.doi_files.get(doi) or os.path.basename(doi_to_path(doi, directory=''))
+        data_offset = self._append(filename, data, codec, len(xml), crc)
+        self._set_entry(filename, (doi, data_offset, len(data), len(xml), codec, crc))
+        if self._unsaved >= INDEX_SAVE_INTERVAL:
+            self.flush()
+
+    def add_file(self, path, codec=None):
+        """Add or replace an article from its XML file."""
+        with open(path, 'rb') as f:
+            self.add(filename_to_doi(path), f.read(), codec=codec)
+
+    def remove(self, doi):
+        """Remove an article, by appending a record that marks it as removed."""
+        filename = self.doi_files.get(doi)
+        if filename is not None:
+            self._append(filename, b'', CODEC_REMOVED, 0, 0)
+            self._set_entry(filename, None)
+
+    def flush(self):
+        """Write appended records to disk and save the index."""
+        if self._writer is not None:
+            self._writer.flush()
+            os.fsync(self._writer.fileno())
+        if self._unsaved:
+            self._set_lookups()
+            self.save_index()
+
+    def close(self):
+        self.flush()
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+        if _open_packs.get(self.path) is self:
+            del _open_packs[self.path]
+
+
+def open_packed(path):
+    """Shared reader for a packed corpus, refreshed if the container has grown.
+
+    :param path: path of the `.plospack` file
+    :return: PackedCorpus
+    """
+    pack = _open_packs.get(path)
+    if pack is None:
+        pack = _open_packs[path] = PackedCorpus(path)
+    else:
+        pack.refresh()
+    return pack
+
+
+def pack_directory(directory, path=None, codec=None, extension='.xml'):
+    """Pack the article XML files of a corpus directory into a container.
+
+    Articles already in the container with the same content are skipped.
+    :param directory: corpus directory of article XML files
+    :param path: path of the container, defaults to `get_packed_path(directory)`
+    :param codec: compression codec, defaults to zstd if available, else zlib
+    :param extension: extension of article files, defaults to '.xml'
+    :return: path of the container
+    """
+    if path is None:
+        path = get_packed_path(directory)
+    with PackedCorpus(path) as pack:
+        for name in sorted(os.listdir(directory)):
+            if not name.endswith(extension) or 'DS_Store' in name:
+                continue
+            with open(os.path.join(directory, name), 'rb') as f:
+                xml = f.read()
+            doi = filename_to_doi(name)
+            if not pack.matches(doi, len(xml), zlib.crc32(xml)):
+                pack.add(doi, xml, codec=codec)
+    return path
+
+
+def pack_zip(zip_path, path, codec=None):
+    """Pack the article XML files of a corpus zip file straight into a container.
+
+    Members already in the container with the same size and CRC are skipped, without
+    being decompressed.
+    :param zip_path: path to the zip file
+    :param path: path of the container
+    :param codec: compression codec, defaults to zstd if available, else zlib
+    :return: tuple of the number of articles added and skipped
+    """
+    added = skipped = 0
+    with zipfile.ZipFile(zip_path) as zip_ref, PackedCorpus(path) as pack:
+        infos = sorted(zip_ref.infolist(), key=lambda info: info.header_offset)
+        for info in tqdm(infos, disable=None):
+            if info.is_dir() or not info.filename.endswith('.xml'):
+                continue
+            doi = filename_to_doi(info.filename)
+            if pack.matches(doi, info.file_size, info.CRC):
+                skipped += 1
+                continue
+            pack.add(doi, zip_ref.read(info), codec=codec)
+            added += 1
+    return added, skipped
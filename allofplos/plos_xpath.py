@@ -0,0 +1,77 @@
+"""
+Precompiled XPath expressions for the PLOS article XML elements used by `Article` and `allofplos.elements`.
+
+`lxml` compiles an XPath string every time `element.xpath(string)` is called, so the paths
+looked up for every article are compiled once here as `lxml.etree.XPath` objects.
+"""
+
+import functools
+
+import lxml.etree as et
+
+ARTICLE_META = '/article/front/article-meta'
+
+xpath_paths = {
+    # root element and front matter
+    'article': '/article',
+    'journal_meta': '/article/front/journal-meta',
+    'article_meta': ARTICLE_META,
+    'title': ARTICLE_META + '/title-group/article-title',
+    'abstract': ARTICLE_META + '/abstract[count(@*)=0]',
+    'article_categories': ARTICLE_META + '/article-categories',
+    'pub_dates': ARTICLE_META + '/pub-date',
+    'history': ARTICLE_META + '/history',
+    'custom_meta': ARTICLE_META + '/custom-meta-group/custom-meta',
+    'proof': ARTICLE_META + '/custom-meta-group/custom-meta/meta-value',
+    'related_articles': ARTICLE_META + '/related-article',
+    'author_notes': ARTICLE_META + '/author-notes',
+    'contribs': ARTICLE_META + '/contrib-group/contrib',
+    'counts': ARTICLE_META + '/counts',
+    'permissions': ARTICLE_META + '/permissions',
+    'volume': ARTICLE_META + '/volume',
+    'issue': ARTICLE_META + '/issue',
+    'elocation': ARTICLE_META + '/elocation-id',
+    # body and back
+    'body': '/article/body',
+    'back': './back',
+    'figures': './/fig',
+    'tables': './/table-wrap',
+    # relative to a <custom-meta> element
+    'meta_name': './meta-name',
+    'meta_value': './meta-value',
+    # relative to a <journal-meta> element
+    'journal_title': './journal-title-group/journal-title',
+    'journal_title_old': './journal-title',
+    # relative to a <permissions> element
+    'copyright_year': './copyright-year',
+    'copyright_holder': './copyright-holder',
+    'license': './license',
+    # relative to a <license> element
+    'license_link': './/ext-link',
+}
+
+XPATHS = {name: et.XPath(path) for name, path in xpath_paths.items()}
+
+
+@functools.lru_cache(maxsize=256)
+def compile_xpath(path):
+    """Compile an XPath string, keeping the most recently used ones.
+
+    :param path: XPath location string
+    :return: compiled XPath, callable on an element
+    :rtype: {lxml.etree.XPath}
+    """
+    return et.XPath(path)
+
+
+def get_xpath(name_or_path):
+    """Get a compiled XPath by its name in `xpath_paths`, or compile an XPath string.
+
+    :param name_or_path: key of `xpath_paths`, or XPath location string
+    :return: compiled XPath, callable on an element
+    :rtype: {lxml.etree.XPath}
+    """
+    try:
+        return XPATHS[name_or_path]
+    except KeyError:
+        return compile_xpath(name_or_path)
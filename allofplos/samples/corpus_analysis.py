@@ -22,7 +22,10 @@ from ..transformations import (filename_to_doi, doi_to_url)
 from ..corpus.plos_corpus import (listdir_nohidden, uncorrected_proofs_text_list,
                                   download_updated_xml, get_all_solr_dois,
                                   download_check_and_move)
-from ..article import Article
+from ..article import Article, ArticleRef
+from ..corpus import Corpus
+from ..corpus.download import make_session, ValidatorCache
+from .metadata_store import MetadataTable, METADATA_COLUMNS, FILE_COLUMNS
 
 counter = collections.Counter
 pmcdir = "pmc_articles"
@@ -263,12 +266,18 @@ def revisiondate_sanity_check(article_list=None, tempdir=newarticledir, director
     except FileExistsError:
         pass
     articles_different_list = []
-    for article_file in tqdm(article_list):
-        updated = download_updated_xml(article_file=article_file)
-        if updated:
-            articles_different_list.append(article_file)
-        if list_provided:
-            article_list.remove(article_file)  # helps save time if need to restart process
+    # validators of each remote article, so unchanged ones aren't downloaded again
+    cache = ValidatorCache()
+    session = make_session()
+    try:
+        for article_file in tqdm(list(article_list)):
+            updated = download_updated_xml(article_file=article_file, cache=cache, session=session)
+            if updated:
+                articles_different_list.append(article_file)
+            if list_provided:
+                article_list.remove(article_file)  # helps save time if need to restart process
+    finally:
+        cache.save()
     print(len(article_list), "article checked for updates.")
     print(len(articles_different_list), "articles have updates.")
     return articles_different_list
@@ -345,27 +354,32 @@ def get_article_metadata(article_file, size='small'):
     """
     For an individual article in the PLOS corpus, create a tuple of a set of metadata fields sbout that corpus.
     Make it small, medium, or large depending on number of fields desired.
-    :param article_file: individual local PLOS XML article
+    :param article_file: individual local PLOS XML article, or its Article object
     :param size: small, medium or large, aka how many fields to return for each article
     :return: tuple of metadata fields tuple, wrong_date_strings dict
     """
-    article = Article.from_filename(article_file)
-    doi = article.doi
-    filename = os.path.basename(article.filename).rstrip('.xml')
-    title = article.title
-    journal = article.journal
-    jats_article_type = article.type_
-    plos_article_type = article.plostype
-    dtd_version = article.dtd
-    dates = article.get_dates()
+    if isinstance(article_file, (Article, ArticleRef)):
+        article = article_file
+    else:
+        article = Article.from_filename(article_file)
+    record = article.extract(['doi', 'filename', 'title', 'journal', 'type_', 'plostype', 'dtd',
+                              'dates', 'counts', 'word_count', 'related_dois', 'abstract'])
+    doi = record.doi
+    filename = os.path.basename(record.filename).rstrip('.xml')
+    title = record.title
+    journal = record.journal
+    jats_article_type = record.type_
+    plos_article_type = record.plostype
+    dtd_version = record.dtd
+    dates = record.dates
     (pubdate, collection, received, accepted, revdate) = ('', '', '', '', '')
-    pubdate = article.pubdate
-    revdate = article.revdate
-    counts = article.counts
+    pubdate = dates['epub']
+    revdate = dates['updated']
+    counts = record.counts
     (fig_count, table_count, page_count) = ('', '', '')
-    body_word_count = article.word_count
-    related_articles = article.related_dois
-    abstract = article.abstract
+    body_word_count = record.word_count
+    related_articles = record.related_dois
+    abstract = record.abstract
     try:
         collection = dates['collection']
     except KeyError:
@@ -400,7 +414,7 @@ def get_article_metadata(article_file, size='small'):
         return False
 
 
-def get_corpus_metadata(article_list=None, directory=None):
+def get_corpus_metadata(article_list=None, directory=None, processes=1):
     """
     Run get_article_metadata() on a list of files, by default every file in directory 
     Includes a progress bar
@@ -408,12 +422,17 @@ def get_corpus_metadata(article_list=None, directory=None):
     TODO: this does not return a tuple, other parts of the code expect it to return a tuple, and its docs expect a tuple
 
     :param article_list: list of articles to run it on
+    :param processes: number of worker processes; if more than 1, runs in parallel via `Corpus.map()`
     :return: list of tuples for each article; list of dicts for wrong date orders
     """
     if directory is None:
         directory = get_corpus_dir()
     if article_list is None:
         article_list = listdir_nohidden(directory)
+    if processes != 1:
+        dois = [filename_to_doi(article_file) for article_file in article_list]
+        return list(Corpus(directory).map(get_article_metadata, processes=processes,
+                                          dois=dois, ordered=True))
     corpus_metadata = []
     for article_file in tqdm(article_list):
         metadata = get_article_metadata(article_file)
@@ -470,6 +489,96 @@ def read_corpus_metadata_from_csv(csv_file='allofplos_metadata.csv'):
     return corpus_metadata
 
 
+def corpus_metadata_to_npz(corpus_metadata=None,
+                           article_list=None,
+                           npz_file='allofplos_metadata.npz',
+                           directory=None,
+                           processes=1
+                           ):
+    """
+    Store the list of tuples from get_article_metadata in a typed, columnar .npz file
+    Dates are stored as datetime64 and counts as integers, unlike in the csv. See `metadata_store`.
+    :param corpus_metadata: the list of tuples, defaults to None
+    :param article_list: list of article files to get metadata for if corpus_metadata is None
+    :param npz_file: string, path of the file to write, defaults to 'allofplos_metadata.npz'
+    :param directory: directory of articles, defaults to get_corpus_dir()
+    :param processes: number of worker processes for getting the metadata, defaults to 1
+    :return: MetadataTable of the stored metadata
+    """
+    if directory is None:
+        directory = get_corpus_dir()
+    if corpus_metadata is None:
+        corpus_metadata = get_corpus_metadata(article_list, directory=directory, processes=processes)
+    table = MetadataTable.from_rows(corpus_metadata)
+    table.save(npz_file)
+    return table
+
+
+def read_corpus_metadata_from_npz(npz_file='allofplos_metadata.npz', mmap=True):
+    """
+    reads in the columnar metadata written by corpus_metadata_to_npz
+    :param npz_file: .npz file of data, defaults to 'allofplos_metadata.npz'
+    :param mmap: whether to memory-map the columns instead of reading them into memory
+    :return: MetadataTable of article metadata, keyed by DOI
+    """
+    return MetadataTable.load(npz_file, mmap=mmap)
+
+
+def update_corpus_metadata_npz(npz_file='allofplos_metadata.npz', directory=None, processes=1):
+    """
+    Incrementally update the columnar metadata of the articles in a corpus directory
+    Each row stores the size and mtime of the article file its metadata was read from.
+    Only new files and files whose size or mtime changed (e.g. VOR updates and amended
+    articles) are re-read; rows for files no longer in the directory are removed.
+    The .npz file is replaced atomically, so readers never see a partial file.
+    :param npz_file: .npz file of data, defaults to 'allofplos_metadata.npz'
+    :param directory: directory of articles, defaults to get_corpus_dir()
+    :param processes: number of worker processes for getting the metadata, defaults to 1
+    :return: updated MetadataTable
+    """
+    if directory is None:
+        directory = get_corpus_dir()
+    corpus = Corpus(directory)
+    index = corpus.index
+    # files changed in place don't change the directory mtime, so re-stat every file
+    index.refresh(full=True)
+    columns = METADATA_COLUMNS + FILE_COLUMNS
+    try:
+        table = read_corpus_metadata_from_npz(npz_file)
+        if set(table.columns) != set(columns):
+            print('{} was not made incrementally; rebuilding it.'.format(npz_file))
+            table = MetadataTable.from_rows([], columns=columns)
+    except FileNotFoundError:
+        table = MetadataTable.from_rows([], columns=columns)
+
+    # Step 1: compare the file stats stored in the table with the files in the directory
+    stored_stats = {doi: (table['size'][i], table['mtime'][i]) for doi, i in table.doi_index.items()}
+    kept_rows = []
+    changed_rows = []
+    for row in index.rows():
+        if stored_stats.get(row['doi']) == (row['size'], row['mtime']):
+            kept_rows.append(table.doi_index[row['doi']])
+        else:
+            changed_rows.append(row)
+    removed = len(table) - len(kept_rows) - len([row for row in changed_rows
+                                                  if row['doi'] in table.doi_index])
+    print('{} new or changed articles, {} removed articles, {} unchanged.'
+          .format(len(changed_rows), removed, len(kept_rows)))
+
+    # Step 2: get metadata for only new & changed articles
+    article_list = [os.path.join(directory, row['filename']) for row in changed_rows]
+    new_metadata = get_corpus_metadata(article_list, directory=directory, processes=processes)
+    new_metadata = [metadata + (row['size'], row['mtime'])
+                    for metadata, row in zip(new_metadata, changed_rows) if metadata]
+
+    # Step 3: combine with unchanged rows, sort by DOI, and write
+    table = table.take(kept_rows).concat(MetadataTable.from_rows(new_metadata, columns=columns))
+    dois = table['doi'].tolist()
+    table = table.take(sorted(range(len(dois)), key=dois.__getitem__))
+    table.save(npz_file)
+    return table
+
+
 def update_corpus_metadata_csv(csv_file='allofplos_metadata.csv', comparison_dois=None, directory=None):
     """
     Incrementally update the metadata of PLOS articles in the csv file
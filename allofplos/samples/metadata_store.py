@@ -0,0 +1,298 @@
+"""
+Columnar, typed storage for the corpus metadata from `get_article_metadata()`.
+
+The metadata is stored as an uncompressed NumPy `.npz` file with one array per column:
+    * dates as `datetime64[D]` (missing dates are `NaT`)
+    * counts as `int64` (missing counts are -1)
+    * text as UTF-8 bytes (`<column>.data`) plus `int64` row offsets (`<column>.offsets`)
+Because the arrays are stored uncompressed, they can be memory-mapped straight from the
+`.npz` file instead of being read into memory, so opening metadata for the whole corpus
+is nearly instant. The file is still a regular `.npz` that `numpy.load()` can read.
+
+Requires NumPy (`pip install allofplos[metadata]`).
+"""
+
+import datetime
+import os
+import struct
+import tempfile
+import zipfile
+
+TEXT_COLUMNS = ('doi', 'filename', 'title', 'journal', 'jats_article_type', 'plos_article_type',
+                'dtd_version', 'related_article', 'abstract')
+DATE_COLUMNS = ('pubdate', 'revdate', 'received', 'accepted', 'collection')
+COUNT_COLUMNS = ('fig_count', 'table_count', 'page_count', 'body_word_count')
+# size and mtime (in ns) of the article file the metadata was read from
+FILE_COLUMNS = ('size', 'mtime')
+
+# same columns, in the same order, as the metadata csv
+METADATA_COLUMNS = ('doi', 'filename', 'title', 'journal', 'jats_article_type', 'plos_article_type',
+                    'dtd_version', 'pubdate', 'revdate', 'received', 'accepted', 'collection',
+                    'fig_count', 'table_count', 'page_count', 'body_word_count', 'related_article',
+                    'abstract')
+
+MISSING_COUNT = -1
+RELATED_ARTICLE_SEPARATOR = ' '
+
+
+def _import_numpy():
+    try:
+        import numpy
+    except ImportError:
+        raise ImportError("The columnar metadata store requires NumPy. "
+                          "Install it with `pip install allofplos[metadata]`.")
+    return numpy
+
+
+def _text_arrays(values):
+    """Encode a list of strings as (offsets, data) arrays."""
+    np = _import_numpy()
+    encoded = [value.encode('utf8') for value in values]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(value) for value in encoded], out=offsets[1:])
+    data = np.frombuffer(b''.join(encoded), dtype=np.uint8)
+    return offsets, data
+
+
+def _date_value(value):
+    if isinstance(value, datetime.datetime):
+        return value.date()
+    if isinstance(value, datetime.date):
+        return value
+    if value in ('', None):
+        return None
+    return datetime.datetime.strptime(value[:10], '%Y-%m-%d').date()
+
+
+def _count_value(value):
+    if value in ('', None):
+        return MISSING_COUNT
+    return int(value)
+
+
+def _text_value(value):
+    if value is None:
+        return ''
+    if isinstance(value, (list, tuple)):
+        return RELATED_ARTICLE_SEPARATOR.join(value)
+    return str(value)
+
+
+def metadata_to_arrays(corpus_metadata, columns=METADATA_COLUMNS):
+    """Convert rows of article metadata into a dictionary of typed NumPy arrays.
+
+    :param corpus_metadata: list of metadata tuples, as from `get_corpus_metadata()`
+    :param columns: names of the columns in each tuple, defaults to METADATA_COLUMNS
+    :return: dictionary mapping array names to arrays, as stored in the .npz file
+    """
+    np = _import_numpy()
+    values = dict(zip(columns, zip(*corpus_metadata))) if corpus_metadata else \
+        {column: () for column in columns}
+    arrays = {}
+    for column in columns:
+        if column in DATE_COLUMNS:
+            arrays[column] = np.array([_date_value(v) or 'NaT' for v in values[column]],
+                                      dtype='datetime64[D]')
+        elif column in COUNT_COLUMNS + FILE_COLUMNS:
+            arrays[column] = np.array([_count_value(v) for v in values[column]], dtype=np.int64)
+        else:
+            offsets, data = _text_arrays([_text_value(v) for v in values[column]])
+            arrays[column + '.offsets'] = offsets
+            arrays[column + '.data'] = data
+    return arrays
+
+
+def write_npz(arrays, npz_file):
+    """Write arrays to an uncompressed .npz file, atomically replacing any existing file.
+
+    :param arrays: dictionary of array names to arrays
+    :param npz_file: path of the .npz file
+    """
+    np = _import_numpy()
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(npz_file)), suffix='.npz')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            np.savez(f, **arrays)
+        os.replace(tmp_path, npz_file)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+
+def load_npz(npz_file, mmap=True):
+    """Load all arrays of an .npz file, memory-mapping the uncompressed ones.
+
+    `numpy.load()` can't memory-map arrays inside an .npz archive, so this finds where each
+    stored (uncompressed) member's data starts in the zip file and maps it directly.
+    :param npz_file: path of the .npz file
+    :param mmap: whether to memory-map the arrays (read-only), defaults to True
+    :return: dictionary of array names to arrays
+    """
+    np = _import_numpy()
+    arrays = {}
+    with zipfile.ZipFile(npz_file) as zf, open(npz_file, 'rb') as f:
+        for info in zf.infolist():
+            name = info.filename[:-len('.npy')]
+            if not mmap or info.compress_type != zipfile.ZIP_STORED:
+                with zf.open(info) as member:
+                    arrays[name] = np.lib.format.read_array(member)
+                continue
+            # skip the zip local file header to get to the .npy data
+            f.seek(info.header_offset + 26)
+            name_length, extra_length = struct.unpack('<HH', f.read(4))
+            f.seek(info.header_offset + 30 + name_length + extra_length)
+            version = np.lib.format.read_magic(f)
+            if version == (1, 0):
+                shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+            else:
+                shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(f)
+            if not shape or 0 in shape:
+                arrays[name] = np.zeros(shape, dtype=dtype)
+            else:
+                arrays[name] = np.memmap(npz_file, dtype=dtype, mode='r', offset=f.tell(),
+                                         shape=shape, order='F' if fortran_order else 'C')
+    return arrays
+
+
+class TextColumn:
+    """Read-only sequence of strings stored as UTF-8 bytes plus row offsets."""
+
+    def __init__(self, offsets, data):
+        self.offsets = offsets
+        self.data = data
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError('TextColumn index out of range')
+        start, end = self.offsets[i], self.offsets[i+1]
+        return self.data[start:end].tobytes().decode('utf8')
+
+    def __iter__(self):
+        return (self[i] for i in range(len(self)))
+
+    def tolist(self):
+        return list(self)
+
+
+class MetadataTable:
+    """Columnar table of corpus metadata, keyed by DOI.
+
+    Date and count columns are NumPy arrays; text columns are `TextColumn`s.
+    Usage:
+    `table = read_corpus_metadata_from_npz()`
+    `table['pubdate']` (datetime64 array), `table.row('10.1371/journal.pone.0185809')`
+    """
+
+    def __init__(self, arrays):
+        self.arrays = arrays
+        self._doi_index = None
+
+    @classmethod
+    def from_rows(cls, corpus_metadata, columns=METADATA_COLUMNS):
+        """Create a table from metadata tuples (e.g. from `get_corpus_metadata()`)."""
+        return cls(metadata_to_arrays(corpus_metadata, columns))
+
+    @classmethod
+    def load(cls, npz_file, mmap=True):
+        """Load a table from an .npz file. See `load_npz()`."""
+        return cls(load_npz(npz_file, mmap=mmap))
+
+    def save(self, npz_file):
+        """Save the table to an .npz file. See `write_npz()`."""
+        write_npz(self.arrays, npz_file)
+
+    @property
+    def columns(self):
+        """Column names, in metadata csv order where applicable."""
+        names = []
+        for name in self.arrays:
+            column = name.rsplit('.', 1)[0] if name.endswith(('.offsets', '.data')) else name
+            if column not in names:
+                names.append(column)
+        order = {column: i for i, column in enumerate(METADATA_COLUMNS)}
+        return sorted(names, key=lambda column: order.get(column, len(order)))
+
+    def __len__(self):
+        return len(self['doi'])
+
+    def __getitem__(self, column):
+        if column in self.arrays:
+            return self.arrays[column]
+        try:
+            return TextColumn(self.arrays[column + '.offsets'], self.arrays[column + '.data'])
+        except KeyError:
+            raise KeyError(column)
+
+    def __contains__(self, doi):
+        return doi in self.doi_index
+
+    @property
+    def doi_index(self):
+        """Dictionary mapping each DOI to its row number."""
+        if self._doi_index is None:
+            self._doi_index = {doi: i for i, doi in enumerate(self['doi'])}
+        return self._doi_index
+
+    def row(self, doi):
+        """All column values of one article as a tuple, in `self.columns` order.
+
+        Dates are `datetime.date` (None if missing) and counts are int (None if missing).
+        """
+        i = self.doi_index[doi]
+        values = []
+        for column in self.columns:
+            value = self[column][i]
+            if column in DATE_COLUMNS:
+                value = value.item()
+            elif column in COUNT_COLUMNS + FILE_COLUMNS:
+                value = None if value == MISSING_COUNT else int(value)
+            values.append(value)
+        return tuple(values)
+
+    def rows(self):
+        """List of tuples of every article's metadata, in `self.columns` order."""
+        return [self.row(doi) for doi in self['doi']]
+
+    def take(self, indices):
+        """New table with only the rows at `indices`, in that order.
+
+        :param indices: sequence of row numbers
+        :return: MetadataTable held in memory
+        """
+        np = _import_numpy()
+        indices = np.asarray(indices, dtype=np.int64)
+        arrays = {}
+        for column in self.columns:
+            if column in self.arrays:
+                arrays[column] = np.asarray(self.arrays[column])[indices]
+            else:
+                offsets = self.arrays[column + '.offsets']
+                data = self.arrays[column + '.data']
+                values = [data[offsets[i]:offsets[i+1]].tobytes() for i in indices]
+                new_offsets = np.zeros(len(values) + 1, dtype=np.int64)
+                np.cumsum([len(value) for value in values], out=new_offsets[1:])
+                arrays[column + '.offsets'] = new_offsets
+                arrays[column + '.data'] = np.frombuffer(b''.join(values), dtype=np.uint8)
+        return MetadataTable(arrays)
+
+    def concat(self, other):
+        """New table with the rows of `other` appended. Both tables need the same columns."""
+        np = _import_numpy()
+        if set(self.arrays) != set(other.arrays):
+            raise ValueError('Tables have different columns: {} and {}'
+                             .format(self.columns, other.columns))
+        arrays = {}
+        for name in self.arrays:
+            if name.endswith('.offsets'):
+                offsets = self.arrays[name]
+                arrays[name] = np.concatenate([offsets, np.asarray(other.arrays[name][1:]) + offsets[-1]])
+            else:
+                arrays[name] = np.concatenate([self.arrays[name], other.arrays[name]])
+        return MetadataTable(arrays)
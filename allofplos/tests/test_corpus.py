@@ -1,11 +1,20 @@
 from . import TESTDATADIR
 from .. import Corpus, starterdir
 from ..article import Article
-from ..corpus import listdir_nohidden
+from ..corpus import listdir_nohidden, CorpusIndex
+from ..corpus.gdrive import extract_zip, unzip_articles
+from ..corpus.index import get_index_path
+from .. import packed
+from ..packed import PackedCorpus, pack_directory
 
+import datetime
+import lxml.etree as et
 import random
 import pytest
 import os
+import shutil
+import sys
+import zipfile
 
 @pytest.fixture
 def corpus():
@@ -81,3 +90,208 @@ def test_files(corpus):
     annote_file = 'plos.correction.3155a3e9-5fbe-435c-a07a-e9a4846ec0b6.xml'
     assert annote_file in corpus.files
     assert 'journal.pcbi.0030158.xml' not in corpus.files
+
+
+def test_corpus_index(tmpdir):
+    directory = str(tmpdir.mkdir('corpus'))
+    for fname in ['journal.pbio.2001413.xml', 'journal.pbio.2002354.xml']:
+        shutil.copy(os.path.join(TESTDATADIR, fname), directory)
+    corpus = Corpus(directory)
+    assert len(corpus) == 2
+    assert os.path.isfile(get_index_path(directory))
+    assert '10.1371/journal.pbio.2001413' in corpus
+    # a new corpus object loads the stored index
+    index = CorpusIndex(directory)
+    assert index.dois == corpus.dois
+    assert index.get('journal.pbio.2001413.xml')['journal'] == 'PLOS Biology'
+    assert index.pubdate('10.1371/journal.pbio.2001413') == datetime.datetime(2017, 3, 21)
+    # adding and removing files is picked up incrementally
+    shutil.copy(os.path.join(TESTDATADIR, 'journal.pone.0185809.xml'), directory)
+    os.remove(os.path.join(directory, 'journal.pbio.2002354.xml'))
+    assert corpus.dois == ['10.1371/journal.pbio.2001413', '10.1371/journal.pone.0185809']
+    assert corpus[1].doi == '10.1371/journal.pone.0185809'
+
+
+def test_corpus_index_relative_path(tmpdir, monkeypatch):
+    directory = tmpdir.mkdir('corpus')
+    shutil.copy(os.path.join(TESTDATADIR, 'journal.pbio.2001413.xml'), str(directory))
+    monkeypatch.chdir(str(directory))
+    assert Corpus('.').dois == ['10.1371/journal.pbio.2001413']
+    # the index is stored next to the directory, not inside it
+    assert get_index_path('.') == str(tmpdir.join('corpus.index.json'))
+    assert os.listdir('.') == ['journal.pbio.2001413.xml']
+
+
+def get_title(article):
+    return article.title
+
+
+def test_corpus_map(corpus):
+    titles = {doi: title for doi, title in zip(corpus.dois, corpus.map(get_title, processes=1, ordered=True))}
+    assert set(corpus.map(get_title, processes=2, chunksize=2)) == set(titles.values())
+    assert list(corpus.map(get_title, processes=2, chunksize=1, ordered=True)) == list(titles.values())
+    assert sum(stats['articles'] for stats in corpus.map_stats.values()) == len(corpus)
+    assert sorted(corpus.reduce(get_title, lambda x, y: x + [y], [], processes=2)) == sorted(titles.values())
+    assert corpus.reduce(get_title, lambda count, title: count + 1, 0, processes=1) == len(corpus)
+    # None can be the starting value
+    assert corpus.reduce(get_title, lambda last, title: title, None, processes=1, dois=[]) is None
+
+
+def test_corpus_metadata_npz(tmpdir):
+    np = pytest.importorskip('numpy')
+    from ..samples.corpus_analysis import (get_corpus_metadata, corpus_metadata_to_npz,
+                                           read_corpus_metadata_from_npz)
+    corpus_metadata = get_corpus_metadata(directory=TESTDATADIR)
+    npz_file = str(tmpdir.join('metadata.npz'))
+    corpus_metadata_to_npz(corpus_metadata, npz_file=npz_file)
+    table = read_corpus_metadata_from_npz(npz_file)
+    assert len(table) == 5
+    assert isinstance(table['pubdate'], np.memmap)
+    assert table['pubdate'].dtype == np.dtype('datetime64[D]')
+    assert table['body_word_count'].dtype == np.int64
+    row = table.row('10.1371/annotation/3155a3e9-5fbe-435c-a07a-e9a4846ec0b6')
+    assert row[table.columns.index('pubdate')] == datetime.date(2012, 6, 29)
+    assert row[table.columns.index('page_count')] is None
+    assert row[table.columns.index('related_article')] == '10.1371/journal.pone.0035142'
+    assert table.columns[:3] == ['doi', 'filename', 'title']
+    assert table['title'].tolist() == [metadata[2] for metadata in corpus_metadata]
+
+
+def test_update_corpus_metadata_npz(tmpdir):
+    pytest.importorskip('numpy')
+    from ..samples.corpus_analysis import update_corpus_metadata_npz
+    directory = str(tmpdir.mkdir('corpus'))
+    npz_file = str(tmpdir.join('metadata.npz'))
+    for fname in ['journal.pbio.2001413.xml', 'journal.pbio.2002354.xml']:
+        shutil.copy(os.path.join(TESTDATADIR, fname), directory)
+    table = update_corpus_metadata_npz(npz_file, directory=directory)
+    assert table['doi'].tolist() == ['10.1371/journal.pbio.2001413', '10.1371/journal.pbio.2002354']
+    # change one file in place, add one, and remove one
+    changed_file = os.path.join(directory, 'journal.pbio.2001413.xml')
+    with open(changed_file) as f:
+        xml = f.read()
+    with open(changed_file, 'w') as f:
+        f.write(xml.replace('Liquid-handling Lego robots', 'Updated Lego robots'))
+    shutil.copy(os.path.join(TESTDATADIR, 'journal.pone.0185809.xml'), directory)
+    os.remove(os.path.join(directory, 'journal.pbio.2002354.xml'))
+    table = update_corpus_metadata_npz(npz_file, directory=directory)
+    assert table['doi'].tolist() == ['10.1371/journal.pbio.2001413', '10.1371/journal.pone.0185809']
+    assert table['title'][0].startswith('Updated Lego robots')
+    assert table['size'][0] == os.path.getsize(changed_file)
+
+
+@pytest.mark.parametrize('processes', [1, 2])
+def test_unzip_articles(tmpdir, processes):
+    zip_path = str(tmpdir.join('corpus.zip'))
+    with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zf:
+        for fname in listdir_nohidden(TESTDATADIR, include_dir=False):
+            zf.write(os.path.join(TESTDATADIR, fname), fname)
+    directory = str(tmpdir.join('corpus'))
+    assert extract_zip(zip_path, directory, processes=processes, chunksize=2) == (5, 0)
+    for fname in os.listdir(directory):
+        with open(os.path.join(directory, fname), 'rb') as f, \
+             open(os.path.join(TESTDATADIR, fname), 'rb') as original:
+            assert f.read() == original.read()
+    # only the file that no longer matches is extracted again
+    with open(os.path.join(directory, 'journal.pbio.2001413.xml'), 'r+b') as f:
+        f.write(b'X')
+    assert extract_zip(zip_path, directory, processes=processes, chunksize=2) == (1, 4)
+    unzip_articles(zip_path, extract_directory=directory, processes=processes)
+    assert not os.path.exists(zip_path)
+    assert len(os.listdir(directory)) == 5
+
+
+def test_packed_corpus(tmpdir, corpus):
+    pack_path = pack_directory(TESTDATADIR, str(tmpdir.join('testdata.plospack')))
+    packed_corpus = Corpus(pack_path)
+    assert len(packed_corpus) == 5
+    assert packed_corpus.dois == corpus.dois
+    assert packed_corpus.files == corpus.files
+    for doi in corpus.dois:
+        article = packed_corpus[doi]
+        assert article.local
+        assert article.title == corpus[doi].title
+        assert Article(doi, directory=pack_path, front_only=True).pubdate == corpus[doi].pubdate
+        assert et.tostring(article.tree) == et.tostring(corpus[doi].tree)
+    article = Article.from_filename(packed_corpus.filepaths[0])
+    assert article.directory == pack_path
+    assert article in packed_corpus
+    assert list(packed_corpus.map(get_title, processes=2, ordered=True, progress=False)) == \
+        [Article(doi, directory=TESTDATADIR).title for doi in corpus.dois]
+
+    # packing again adds nothing
+    size = os.path.getsize(pack_path)
+    pack_directory(TESTDATADIR, pack_path)
+    assert os.path.getsize(pack_path) == size
+
+    # updates and removals are appended, and picked up by readers
+    doi = '10.1371/journal.pbio.2001413'
+    with PackedCorpus(pack_path) as pack:
+        xml = pack.read(doi).replace(b'Liquid-handling Lego robots', b'Updated Lego robots')
+        pack.add(doi, xml, codec=packed.CODEC_NONE)
+        pack.remove('10.1371/journal.pbio.2002354')
+    assert Article(doi, directory=pack_path).title.startswith('Updated Lego robots')
+    assert len(packed_corpus) == 4
+    assert not Article('10.1371/journal.pbio.2002354', directory=pack_path).local
+
+    # the index is rebuilt from the records if it's missing, ignoring an incomplete last record
+    os.remove(pack_path + packed.INDEX_SUFFIX)
+    with open(pack_path, 'ab') as f:
+        f.write(packed.RECORD_HEADER.pack(packed.CODEC_ZLIB, 10, 1000, 2000, 0) + b'journal.pb')
+    with PackedCorpus(pack_path) as pack:
+        assert pack.dois == packed_corpus.dois
+        assert pack.read(doi) == xml
+        pack.add_file(os.path.join(TESTDATADIR, 'journal.pbio.2002354.xml'))
+    assert len(PackedCorpus(pack_path)) == 5
+
+
+def test_unzip_articles_packed(tmpdir, corpus):
+    zip_path = str(tmpdir.join('corpus.zip'))
+    with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zf:
+        for fname in listdir_nohidden(TESTDATADIR, include_dir=False):
+            zf.write(os.path.join(TESTDATADIR, fname), fname)
+    directory = str(tmpdir.join('corpus'))
+    unzip_articles(zip_path, extract_directory=directory, delete_file=False, packed=True)
+    assert not os.path.exists(directory)
+    pack_path = directory + packed.PACKED_EXTENSION
+    assert Corpus(pack_path).dois == corpus.dois
+    assert packed.pack_zip(zip_path, pack_path) == (0, 5)
+
+
+def test_iter_records(corpus):
+    records = list(corpus.iter_records())
+    assert [record.doi for record in records] == corpus.dois
+    for record in records:
+        assert record == Article(record.doi, directory=TESTDATADIR).extract()
+    dois = corpus.dois[:2]
+    titles = [record.title for record in corpus.iter_records(['title'], dois=dois)]
+    assert titles == [Article(doi, directory=TESTDATADIR).title for doi in dois]
+
+
+def test_release_tree(yes_article):
+    root = yes_article.tree.getroot()
+    title = yes_article.title
+    yes_article.release_tree()
+    assert len(root) == 0
+    assert yes_article._cache == {}
+    # parsed again if needed
+    assert yes_article.title == title
+
+
+def test_article_ref(corpus):
+    refs = list(corpus.article_generator)
+    assert [ref.doi for ref in refs] == corpus.dois
+    ref = refs[0]
+    assert not hasattr(ref, '__dict__')
+    assert sys.getsizeof(ref) < 100
+    assert ref._article is None
+    # article attributes are read from the Article, created on first use
+    article = Article(ref.doi, directory=TESTDATADIR)
+    assert ref.title == article.title
+    assert ref == article and article == ref
+    assert ref in corpus
+    ref.release()
+    assert ref._article is None
+    # indexing returns Articles, whatever the key
+    assert all(isinstance(article, Article) for article in corpus[:2])
+    assert isinstance(corpus[0], Article) and isinstance(corpus[corpus.dois[0]], Article)
@@ -0,0 +1,482 @@
+from . import TESTDATADIR
+from ..corpus import (Corpus, download_check_and_move, download_updated_xml, remote_proofs_direct_check,
+                      repo_download)
+from ..corpus.proofs import ProofStore
+from ..corpus.gdrive import (download_file_from_google_drive, get_manifest_path, read_manifest,
+                             verify_download)
+from ..corpus.download import (RateLimiter, ValidatorCache, download_articles, make_session,
+                               remote_proof_status)
+from ..transformations import doi_to_path
+from .test_solr import SolrServer, make_client
+
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+import hashlib
+import lxml.etree as et
+import os
+import shutil
+import threading
+import time
+import zipfile
+from urllib.parse import urlparse
+import pytest
+
+
+class ArticleServer(ThreadingMixIn, HTTPServer):
+    """Local stand-in for the journal site, serving the test article files."""
+    daemon_threads = True
+
+    def __init__(self, directory, latency=0):
+        super().__init__(('127.0.0.1', 0), ArticleRequestHandler)
+        self.directory = directory
+        self.latency = latency
+        self.failures = {}
+        self.requests = []
+        self.not_modified = 0
+        self.ranges = []
+        # for each response in turn, how many bytes of the body to send before dropping the connection
+        self.drops = []
+        self.connections = set()
+        self.active = 0
+        self.max_active = 0
+        self.lock = threading.Lock()
+
+    @property
+    def url(self):
+        return 'http://127.0.0.1:{}'.format(self.server_address[1])
+
+    def url_func(self, doi):
+        return '{}/{}'.format(self.url, os.path.basename(doi_to_path(doi, directory='')))
+
+
+class ArticleRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def send_body(self, status, body, headers=None):
+        self.send_response(status)
+        for header, value in (headers or {}).items():
+            self.send_header(header, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        drop_after = self.server.drops.pop(0) if self.server.drops else None
+        if drop_after is not None and len(body) > drop_after:
+            # connection drops partway through the body
+            self.wfile.write(body[:drop_after])
+            self.close_connection = True
+            return
+        self.wfile.write(body)
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.active += 1
+            server.max_active = max(server.max_active, server.active)
+        try:
+            self.respond()
+        finally:
+            with server.lock:
+                server.active -= 1
+
+    def respond(self):
+        server = self.server
+        filename = urlparse(self.path).path.lstrip('/')
+        with server.lock:
+            server.requests.append(filename)
+            server.connections.add(self.client_address)
+            failing = server.failures.get(filename, 0)
+            if failing:
+                server.failures[filename] = failing - 1
+        time.sleep(server.latency)
+        if failing:
+            return self.send_body(503, b'busy')
+        path = os.path.join(server.directory, filename)
+        if not os.path.isfile(path):
+            return self.send_body(404, b'not found')
+        with open(path, 'rb') as f:
+            body = f.read()
+        etag = '"{}"'.format(hashlib.sha1(body).hexdigest())
+        if self.headers.get('If-None-Match') == etag:
+            with server.lock:
+                server.not_modified += 1
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            return self.end_headers()
+        headers = {'ETag': etag,
+                   'Last-Modified': formatdate(os.path.getmtime(path), usegmt=True),
+                   'Accept-Ranges': 'bytes',
+                   }
+        byte_range = self.headers.get('Range')
+        if byte_range and self.headers.get('If-Range') in (None, etag):
+            start, end = byte_range.split('=')[1].split('-')
+            start, end = int(start), min(int(end or len(body) - 1), len(body) - 1)
+            if start >= len(body):
+                return self.send_body(416, b'', {'Content-Range': 'bytes */{}'.format(len(body))})
+            headers['Content-Range'] = 'bytes {}-{}/{}'.format(start, end, len(body))
+            with server.lock:
+                server.ranges.append(start)
+            return self.send_body(206, body[start:end + 1], headers)
+        self.send_body(200, body, headers)
+
+
+@pytest.fixture
+def article_server():
+    server = ArticleServer(TESTDATADIR)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def solr_server():
+    server = SolrServer([])
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_repo_download(article_server, tmpdir):
+    dois = Corpus(TESTDATADIR).dois
+    failed = repo_download(dois, str(tmpdir), rate_limit=None, url_func=article_server.url_func)
+    assert failed == []
+    for doi in dois:
+        with open(doi_to_path(doi, directory=TESTDATADIR), 'rb') as f:
+            original = f.read()
+        with open(doi_to_path(doi, directory=str(tmpdir)), 'rb') as f:
+            assert f.read() == original
+    # nothing left to download the second time
+    repo_download(dois, str(tmpdir), rate_limit=None, url_func=article_server.url_func)
+    assert len(article_server.requests) == len(dois)
+
+
+def test_download_retries(article_server, tmpdir):
+    doi = '10.1371/journal.pbio.2002354'
+    article_server.failures['journal.pbio.2002354.xml'] = 2
+    downloaded, failed = download_articles([doi, '10.1371/journal.pbio.9999999'], str(tmpdir),
+                                           rate_limit=None, session=make_session(backoff_factor=0),
+                                           url_func=article_server.url_func)
+    assert downloaded == [doi]
+    assert list(failed) == ['10.1371/journal.pbio.9999999']
+    assert article_server.requests.count('journal.pbio.2002354.xml') == 3
+    assert os.listdir(str(tmpdir)) == ['journal.pbio.2002354.xml']
+
+
+def test_download_throughput(article_server, tmpdir):
+    """Articles are downloaded concurrently, over pooled connections."""
+    article_server.latency = 0.05
+    # the stand-in server returns the same article for every DOI of a test file
+    dois = ['10.1371/journal.pbio.2001413'] * 40
+    downloaded, failed = download_articles(dois, str(tmpdir), workers=8, rate_limit=None,
+                                           url_func=article_server.url_func)
+    assert len(downloaded) == len(dois)
+    assert article_server.max_active == 8
+    # connections are kept alive and reused instead of opened per article
+    assert len(article_server.connections) <= 8
+
+
+def test_rate_limiter():
+    limiter = RateLimiter(rate=50)
+    start = time.monotonic()
+    for _ in range(11):
+        limiter.wait()
+    assert time.monotonic() - start >= 0.2
+
+
+def test_download_updated_xml(article_server, tmpdir):
+    """Unchanged articles are revalidated with a 304 instead of being downloaded again."""
+    corpus_dir = tmpdir.mkdir('corpus')
+    tempdir = str(tmpdir.join('new'))
+    filename = 'journal.pbio.2002354.xml'
+    article_file = str(corpus_dir.join(filename))
+    # local copy serialized differently from the remote file, but the same XML
+    tree = et.parse(os.path.join(TESTDATADIR, filename))
+    with open(article_file, 'w', encoding='utf8') as f:
+        f.write(et.tostring(tree, method='xml', encoding='unicode'))
+    cache = ValidatorCache(str(tmpdir.join('validators.json')))
+
+    def check():
+        return download_updated_xml(article_file, tempdir=tempdir, cache=cache,
+                                    url_func=article_server.url_func)
+
+    assert check() is False
+    assert check() is False
+    assert article_server.not_modified == 1
+    assert not os.listdir(tempdir)
+
+    # a changed remote article is written to tempdir from the one response
+    remote_dir = tmpdir.mkdir('remote')
+    with open(os.path.join(TESTDATADIR, filename), 'rb') as f:
+        remote_xml = f.read().replace(b'<article-title>', b'<article-title>Updated: ', 1)
+    remote_dir.join(filename).write_binary(remote_xml)
+    article_server.directory = str(remote_dir)
+    assert check() is True
+    assert len(article_server.requests) == 3
+    assert tmpdir.join('new', filename).read_binary() == remote_xml
+
+    cache.save()
+    assert ValidatorCache(cache.path).get('10.1371/journal.pbio.2002354') == cache.get('10.1371/journal.pbio.2002354')
+    # once the new version is moved into the corpus, it revalidates as unchanged
+    shutil.copy(str(tmpdir.join('new', filename)), article_file)
+    assert check() is False
+    assert article_server.not_modified == 2
+
+
+def test_download_check_and_move(article_server, solr_server, tmpdir):
+    """New articles, amended articles, and VOR updates of uncorrected proofs all land in the corpus."""
+    corpus_dir = str(tmpdir.join('corpus'))
+    remote_dir = str(tmpdir.join('remote'))
+    shutil.copytree(TESTDATADIR, remote_dir)
+    os.mkdir(corpus_dir)
+    for doi in ['10.1371/journal.pbio.2002354', '10.1371/journal.pbio.2002399', '10.1371/journal.pone.0185809']:
+        shutil.copy(doi_to_path(doi, directory=TESTDATADIR), corpus_dir)
+    proof_filepath = str(tmpdir.join('uncorrected_proofs_list.txt'))
+    with open(proof_filepath, 'w') as f:
+        f.write('10.1371/journal.pbio.2002399\n')
+
+    def edit_remote(doi, old, new):
+        path = doi_to_path(doi, directory=remote_dir)
+        with open(path, 'rb') as f:
+            xml = f.read()
+        assert old in xml
+        with open(path, 'wb') as f:
+            f.write(xml.replace(old, new, 1))
+    # the new amendment now amends a corpus article, which has new XML
+    amendment_doi = '10.1371/annotation/3155a3e9-5fbe-435c-a07a-e9a4846ec0b6'
+    edit_remote(amendment_doi, b'info:doi/10.1371/journal.pone.0035142', b'info:doi/10.1371/journal.pone.0185809')
+    edit_remote('10.1371/journal.pone.0185809', b'<article-title>', b'<article-title>Updated: ')
+    # and the uncorrected proof has its version of record
+    edit_remote('10.1371/journal.pbio.2002399', b'<meta-value>uncorrected-proof',
+                b'<meta-value>vor-update-to-uncorrected-proof')
+    article_server.directory = remote_dir
+
+    result = download_check_and_move(['10.1371/journal.pbio.2001413', amendment_doi], proof_filepath,
+                                     str(tmpdir.join('new')), corpus_dir, workers=2, rate_limit=None,
+                                     url_func=article_server.url_func,
+                                     cache=ValidatorCache(str(tmpdir.join('validators.json'))),
+                                     proof_store=ProofStore(str(tmpdir.join('proofs.json'))),
+                                     solr_client=make_client(solr_server))
+    assert result == {'downloaded': ['10.1371/annotation/3155a3e9-5fbe-435c-a07a-e9a4846ec0b6',
+                                     '10.1371/journal.pbio.2001413'],
+                      'failed': [],
+                      'amended': ['10.1371/journal.pone.0185809'],
+                      'checked_proofs': ['10.1371/journal.pbio.2002399'],
+                      'vor_updates': ['10.1371/journal.pbio.2002399'],
+                      'uncorrected_proofs': [],
+                      }
+    with open(proof_filepath) as f:
+        assert f.read() == ''
+    assert len(ProofStore(str(tmpdir.join('proofs.json')))) == 0
+    for filename in os.listdir(remote_dir):
+        with open(os.path.join(remote_dir, filename), 'rb') as f:
+            assert tmpdir.join('corpus', filename).read_binary() == f.read()
+    # articles that weren't amended or proofs are left alone
+    assert 'journal.pbio.2002354.xml' not in article_server.requests
+    # Solr doesn't have the VOR indexed, so the proof's status is read from the start of the
+    # remote file, then its VOR is downloaded
+    assert '10.1371/journal.pbio.2002399' in solr_server.requests[0]['q']
+    assert article_server.ranges == [0]
+    assert article_server.requests.count('journal.pbio.2002399.xml') == 2
+
+
+def test_download_check_and_move_failures(article_server, solr_server, tmpdir):
+    """A failed download doesn't stop the update, and proofs without a VOR stay in the list."""
+    corpus_dir = str(tmpdir.mkdir('corpus'))
+    shutil.copy(doi_to_path('10.1371/journal.pbio.2002399', directory=TESTDATADIR), corpus_dir)
+    proof_filepath = str(tmpdir.join('uncorrected_proofs_list.txt'))
+    with open(proof_filepath, 'w') as f:
+        f.write('10.1371/journal.pbio.2002399\n')
+    missing_doi = '10.1371/journal.pone.9999999'
+
+    result = download_check_and_move(['10.1371/journal.pbio.2001413', missing_doi], proof_filepath,
+                                     str(tmpdir.join('new')), corpus_dir, workers=2, rate_limit=None,
+                                     url_func=article_server.url_func,
+                                     cache=ValidatorCache(str(tmpdir.join('validators.json'))),
+                                     proof_store=ProofStore(str(tmpdir.join('proofs.json'))),
+                                     solr_client=make_client(solr_server))
+    assert result == {'downloaded': ['10.1371/journal.pbio.2001413'],
+                      'failed': [missing_doi],
+                      'amended': [],
+                      'checked_proofs': ['10.1371/journal.pbio.2002399'],
+                      'vor_updates': [],
+                      'uncorrected_proofs': ['10.1371/journal.pbio.2002399'],
+                      }
+    with open(proof_filepath) as f:
+        assert f.read() == '10.1371/journal.pbio.2002399\n'
+    assert ProofStore(str(tmpdir.join('proofs.json'))).dois == ['10.1371/journal.pbio.2002399']
+    assert sorted(os.listdir(corpus_dir)) == ['journal.pbio.2001413.xml', 'journal.pbio.2002399.xml']
+    # the proof is only read up to its custom metadata
+    assert article_server.requests.count('journal.pbio.2002399.xml') == 1
+
+
+def amend_proof(article_server, tmpdir, proof_doi):
+    """Set up a corpus with an uncorrected proof, and a new amendment of it that changed its XML."""
+    corpus_dir = str(tmpdir.mkdir('corpus'))
+    remote_dir = str(tmpdir.join('remote'))
+    shutil.copytree(TESTDATADIR, remote_dir)
+    shutil.copy(doi_to_path(proof_doi, directory=TESTDATADIR), corpus_dir)
+    amendment_doi = '10.1371/annotation/3155a3e9-5fbe-435c-a07a-e9a4846ec0b6'
+    for doi, old, new in [(amendment_doi, b'info:doi/10.1371/journal.pone.0035142', b'info:doi/' + proof_doi.encode()),
+                          (proof_doi, b'<article-title>', b'<article-title>Updated: ')]:
+        path = doi_to_path(doi, directory=remote_dir)
+        with open(path, 'rb') as f:
+            xml = f.read()
+        with open(path, 'wb') as f:
+            f.write(xml.replace(old, new, 1))
+    article_server.directory = remote_dir
+    return corpus_dir, amendment_doi
+
+
+def test_download_check_and_move_amended_proof(article_server, solr_server, tmpdir):
+    """An amended proof that isn't due is revalidated as an amended article, not counted as a check."""
+    proof_doi = '10.1371/journal.pbio.2002399'
+    corpus_dir, amendment_doi = amend_proof(article_server, tmpdir, proof_doi)
+    proof_store = ProofStore(str(tmpdir.join('proofs.json')))
+    proof_store.add(proof_doi)
+    proof_store.checked(proof_doi)
+    proof_store.save()
+
+    result = download_check_and_move([amendment_doi], str(tmpdir.join('uncorrected_proofs_list.txt')),
+                                     str(tmpdir.join('new')), corpus_dir, workers=2, rate_limit=None,
+                                     url_func=article_server.url_func,
+                                     cache=ValidatorCache(str(tmpdir.join('validators.json'))),
+                                     proof_store=proof_store, solr_client=make_client(solr_server))
+    assert result['amended'] == [proof_doi]
+    assert result['checked_proofs'] == result['vor_updates'] == []
+    assert result['uncorrected_proofs'] == [proof_doi]
+    assert ProofStore(proof_store.path).entries[proof_doi]['checks'] == 1
+    assert article_server.ranges == []
+
+
+# with Solr slow to answer, the amendment is found before the proof is checked
+@pytest.mark.parametrize('solr_latency', [0, 0.5])
+def test_download_check_and_move_amended_due_proof(article_server, solr_server, tmpdir, solr_latency):
+    """An amended proof that is due gets both its proof check and the revalidation of its XML."""
+    proof_doi = '10.1371/journal.pbio.2002399'
+    corpus_dir, amendment_doi = amend_proof(article_server, tmpdir, proof_doi)
+    solr_server.latency = solr_latency
+    proof_store = ProofStore(str(tmpdir.join('proofs.json')))
+    proof_store.add(proof_doi)
+
+    result = download_check_and_move([amendment_doi], str(tmpdir.join('uncorrected_proofs_list.txt')),
+                                     str(tmpdir.join('new')), corpus_dir, workers=2, rate_limit=None,
+                                     url_func=article_server.url_func,
+                                     cache=ValidatorCache(str(tmpdir.join('validators.json'))),
+                                     proof_store=proof_store, solr_client=make_client(solr_server))
+    assert result['checked_proofs'] == result['amended'] == [proof_doi]
+    assert result['vor_updates'] == []
+    assert result['uncorrected_proofs'] == [proof_doi]
+    assert b'<article-title>Updated: ' in tmpdir.join('corpus', 'journal.pbio.2002399.xml').read_binary()
+
+
+@pytest.mark.parametrize('solr_down', [False, True])
+def test_download_check_and_move_indexed_vor(article_server, solr_server, tmpdir, solr_down):
+    """VORs indexed in Solr are downloaded without reading their status first, unless Solr is down."""
+    corpus_dir = str(tmpdir.mkdir('corpus'))
+    remote_dir = tmpdir.mkdir('remote')
+    proof_doi = '10.1371/journal.pbio.2002399'
+    shutil.copy(doi_to_path(proof_doi, directory=TESTDATADIR), corpus_dir)
+    with open(doi_to_path(proof_doi, directory=TESTDATADIR), 'rb') as f:
+        remote_xml = f.read().replace(b'<meta-value>uncorrected-proof',
+                                      b'<meta-value>vor-update-to-uncorrected-proof')
+    remote_dir.join('journal.pbio.2002399.xml').write_binary(remote_xml)
+    article_server.directory = str(remote_dir)
+    solr_server.docs = [{'id': proof_doi, 'publication_stage': 'vor-update-to-uncorrected-proof'}]
+    if solr_down:
+        solr_server.failures = 100
+    proof_store = ProofStore(str(tmpdir.join('proofs.json')))
+    proof_store.add(proof_doi)
+
+    result = download_check_and_move([], str(tmpdir.join('uncorrected_proofs_list.txt')),
+                                     str(tmpdir.join('new')), corpus_dir, workers=2, rate_limit=None,
+                                     url_func=article_server.url_func,
+                                     cache=ValidatorCache(str(tmpdir.join('validators.json'))),
+                                     proof_store=proof_store, solr_client=make_client(solr_server))
+    assert result['vor_updates'] == [proof_doi]
+    assert result['uncorrected_proofs'] == []
+    assert tmpdir.join('corpus', 'journal.pbio.2002399.xml').read_binary() == remote_xml
+    assert article_server.ranges == ([0] if solr_down else [])
+    assert article_server.requests.count('journal.pbio.2002399.xml') == (2 if solr_down else 1)
+
+
+def test_remote_proof_status(article_server):
+    url = article_server.url_func('10.1371/journal.pbio.2002399')
+    assert remote_proof_status(url, chunk_size=4096) == 'uncorrected_proof'
+    # only the ranges up to the end of the custom metadata are requested
+    assert article_server.ranges == list(range(0, 16384, 4096))
+    assert remote_proof_status(article_server.url_func('10.1371/journal.pbio.2002354')) == 'vor_update'
+    assert remote_proof_status(article_server.url_func('10.1371/journal.pbio.2001413')) == ''
+
+
+def test_remote_proofs_direct_check(article_server, tmpdir):
+    remote_dir = tmpdir.mkdir('remote')
+    with open(os.path.join(TESTDATADIR, 'journal.pbio.2002399.xml'), 'rb') as f:
+        remote_xml = f.read().replace(b'<meta-value>uncorrected-proof',
+                                      b'<meta-value>vor-update-to-uncorrected-proof')
+    remote_dir.join('journal.pbio.2002399.xml').write_binary(remote_xml)
+    shutil.copy(os.path.join(TESTDATADIR, 'journal.pone.0185809.xml'), str(remote_dir))
+    article_server.directory = str(remote_dir)
+    tempdir = str(tmpdir.join('new'))
+
+    with pytest.deprecated_call():
+        updated = remote_proofs_direct_check(tempdir, ['10.1371/journal.pbio.2002399', '10.1371/journal.pone.0185809'],
+                                             rate_limit=None, url_func=article_server.url_func)
+    assert updated == ['10.1371/journal.pbio.2002399']
+    assert os.listdir(tempdir) == ['journal.pbio.2002399.xml']
+    assert tmpdir.join('new', 'journal.pbio.2002399.xml').read_binary() == remote_xml
+    # articles without a VOR update are only read up to their custom metadata
+    assert article_server.requests.count('journal.pone.0185809.xml') == 1
+
+
+def test_resumable_download(article_server, tmpdir):
+    remote_dir = tmpdir.mkdir('remote')
+    with zipfile.ZipFile(str(remote_dir.join('corpus.zip')), 'w', zipfile.ZIP_DEFLATED) as zf:
+        zf.write(os.path.join(TESTDATADIR, 'journal.pbio.2001413.xml'), 'journal.pbio.2001413.xml')
+        zf.writestr('random.bin', os.urandom(300000))
+    article_server.directory = str(remote_dir)
+    # the first request is for the confirmation token, and its body isn't read
+    article_server.drops = [None, 100000]
+    directory = str(tmpdir.mkdir('local'))
+    file_path = download_file_from_google_drive('corpus', 'corpus.zip', directory=directory,
+                                                url=article_server.url + '/corpus.zip')
+    # resumed from where the dropped connection left off
+    assert len(article_server.ranges) == 1
+    assert 0 < article_server.ranges[0] <= 100000
+    assert tmpdir.join('local', 'corpus.zip').read_binary() == remote_dir.join('corpus.zip').read_binary()
+    assert not os.path.exists(file_path + '.part')
+    assert read_manifest(file_path)['size'] == os.path.getsize(file_path)
+    assert verify_download(file_path)
+
+    # a complete download isn't fetched again
+    requests_made = len(article_server.requests)
+    download_file_from_google_drive('corpus', 'corpus.zip', directory=directory,
+                                    url=article_server.url + '/corpus.zip')
+    assert len(article_server.requests) == requests_made
+
+    # corrupted downloads fail the checksum and are downloaded again
+    with open(file_path, 'r+b') as f:
+        f.seek(200000)
+        f.write(b'corrupted')
+    assert not verify_download(file_path)
+    download_file_from_google_drive('corpus', 'corpus.zip', directory=directory,
+                                    url=article_server.url + '/corpus.zip')
+    assert verify_download(file_path)
+    assert len(article_server.requests) == requests_made + 2
+
+
+def test_verify_legacy_download(tmpdir):
+    """Zip files downloaded without a manifest are checked by opening the zip."""
+    file_path = str(tmpdir.join('corpus.zip'))
+    with zipfile.ZipFile(file_path, 'w') as zf:
+        zf.writestr('journal.pbio.2001413.xml', b'<article/>')
+    assert not os.path.exists(get_manifest_path(file_path))
+    assert verify_download(file_path)
+    with open(file_path, 'r+b') as f:
+        f.truncate(20)
+    assert not verify_download(file_path)
@@ -0,0 +1,118 @@
+from . import TESTDATADIR
+from .. import Article, Corpus
+from .. import article as article_module
+from ..field_cache import FieldCache
+from ..packed import pack_directory
+
+import gc
+import pickle
+import shutil
+import weakref
+import pytest
+
+doi = '10.1371/journal.pbio.2002354'
+
+
+@pytest.fixture
+def corpus_dir(tmpdir):
+    directory = str(tmpdir.join('corpus'))
+    shutil.copytree(TESTDATADIR, directory)
+    return directory
+
+
+def test_field_cache(corpus_dir, tmpdir):
+    cache = FieldCache(str(tmpdir.join('fields.db')))
+    article = Article(doi, directory=corpus_dir, field_cache=cache)
+    title, dates, authors = article.title, article.get_dates(), article.authors
+    cache.close()
+
+    # values come from the cache without parsing the XML
+    cache = FieldCache(cache.path)
+    article = Article(doi, directory=corpus_dir, field_cache=cache)
+    assert (article.title, article.get_dates(), article.authors) == (title, dates, authors)
+    assert article.extract(['title', 'pubdate']) == (title, dates['epub'])
+    assert article._tree is None and article._front_tree is None
+
+    # changing the file invalidates its values
+    filename = article.filename
+    with open(filename, 'rb') as f:
+        xml = f.read().replace(b'<article-title>', b'<article-title>Updated: ', 1)
+    with open(filename, 'wb') as f:
+        f.write(xml)
+    article = Article(doi, directory=corpus_dir, field_cache=cache)
+    assert article.title == 'Updated: ' + title
+    assert article.get_dates() == dates
+    cache.close()
+
+
+def test_field_cache_map(corpus_dir, tmpdir):
+    """Values computed in `Corpus.map()` workers are stored for later sessions."""
+    cache = FieldCache(str(tmpdir.join('fields.db')))
+    corpus = Corpus(corpus_dir, field_cache=cache)
+    titles = dict(zip(corpus.dois, corpus.map(title_of, processes=2, chunksize=2, ordered=True,
+                                               progress=False)))
+    cache.close()
+    cache = FieldCache(cache.path)
+    for article in Corpus(corpus_dir, field_cache=cache).article_generator:
+        assert article.title == titles[article.doi]
+        assert article._tree is None
+    cache.close()
+
+
+def test_field_cache_iter_records(corpus_dir, tmpdir, monkeypatch):
+    """`Corpus.iter_records()` reads and fills the cache, although it doesn't memoize values."""
+    parses = []
+    parse_front = article_module.parse_front
+    monkeypatch.setattr(article_module, 'parse_front',
+                        lambda source: parses.append(source) or parse_front(source))
+
+    cache = FieldCache(str(tmpdir.join('fields.db')))
+    titles = [article.title for article in Corpus(corpus_dir, field_cache=cache).article_generator]
+    cache.close()
+    parses.clear()
+    cache = FieldCache(cache.path)
+    records = list(Corpus(corpus_dir, field_cache=cache).iter_records(['title']))
+    assert [record.title for record in records] == titles
+    assert parses == []
+    cache.close()
+
+    # a cold cache is filled by the scan
+    cache = FieldCache(str(tmpdir.join('cold.db')))
+    records = list(Corpus(corpus_dir, field_cache=cache).iter_records(['title', 'pubdate']))
+    assert len(parses) == len(records)
+    cache.close()
+    parses.clear()
+    cache = FieldCache(cache.path)
+    assert list(Corpus(corpus_dir, field_cache=cache).iter_records(['title', 'pubdate'])) == records
+    assert parses == []
+    cache.close()
+
+
+def test_field_cache_packed(corpus_dir, tmpdir):
+    packed_path = pack_directory(corpus_dir, str(tmpdir.join('corpus.plospack')))
+    cache = FieldCache(str(tmpdir.join('fields.db')))
+    title = Article(doi, directory=packed_path, field_cache=cache).title
+    article = Article(doi, directory=packed_path, field_cache=cache)
+    assert article.title == title == Article(doi, directory=TESTDATADIR).title
+    assert article._tree is None
+    cache.close()
+
+
+def test_field_cache_collected(corpus_dir, tmpdir):
+    """Caches aren't kept alive until exit, and commit their values when collected."""
+    cache = pickle.loads(pickle.dumps(FieldCache(str(tmpdir.join('fields.db')))))
+    title = Article(doi, directory=corpus_dir, field_cache=cache).title
+    ref = weakref.ref(cache)
+    path = cache.path
+    del cache
+    gc.collect()
+    assert ref() is None
+    cache = FieldCache(path)
+    article = Article(doi, directory=corpus_dir, field_cache=cache)
+    assert article.title == title
+    assert article._tree is None and article._front_tree is None
+    cache.close()
+
+
+def title_of(article):
+    return article.title
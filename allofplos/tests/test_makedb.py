@@ -0,0 +1,96 @@
+from . import TESTDATADIR
+from .. import Corpus
+from ..makedb import ArticleFile, PLOSArticle, SubjectsPLOSArticle, build_database, db
+
+import os
+import shutil
+import pytest
+
+
+@pytest.fixture
+def corpus_dir(tmpdir):
+    directory = str(tmpdir.join('corpus'))
+    shutil.copytree(TESTDATADIR, directory)
+    return directory
+
+
+def article_titles():
+    """Titles in the database last built by `build_database()`, by DOI."""
+    db.connect()
+    try:
+        return {row.DOI: row.title for row in PLOSArticle.select()}
+    finally:
+        db.close()
+
+
+def article_order():
+    """DOIs in the database last built by `build_database()`, by article ID."""
+    db.connect()
+    try:
+        return [row.DOI for row in PLOSArticle.select().order_by(PLOSArticle.id)]
+    finally:
+        db.close()
+
+
+def test_build_database(corpus_dir, tmpdir):
+    db_path = str(tmpdir.join('test.db'))
+    calls = []
+    counts = build_database(Corpus(corpus_dir), db_path,
+                            progress=lambda done, total: calls.append((done, total)))
+    dois = Corpus(corpus_dir).dois
+    assert counts == {'new': len(dois), 'changed': 0, 'removed': 0}
+    assert calls == [(i, len(dois)) for i in range(1, len(dois) + 1)]
+    assert set(article_titles()) == set(dois)
+    assert db.is_closed()
+
+    # rebuilding replaces the database instead of adding to it
+    counts = build_database(corpus_dir, db_path, sample=2, progress=lambda done, total: None)
+    assert counts['new'] == 2
+    assert len(article_titles()) == 2
+
+
+def test_build_database_workers(corpus_dir, tmpdir):
+    """Articles read in several worker processes are all loaded, in the same order."""
+    no_progress = lambda done, total: None
+    build_database(corpus_dir, str(tmpdir.join('serial.db')), progress=no_progress)
+    serial = article_titles()
+    serial_order = article_order()
+    counts = build_database(corpus_dir, str(tmpdir.join('workers.db')), workers=2, batch_size=2,
+                            progress=no_progress)
+    assert counts == {'new': len(serial), 'changed': 0, 'removed': 0}
+    assert article_titles() == serial
+    assert article_order() == serial_order
+    db.connect()
+    try:
+        # full builds don't hash the article files
+        assert {row.sha1 for row in ArticleFile.select()} == {None}
+    finally:
+        db.close()
+
+
+def test_build_database_incremental(corpus_dir, tmpdir):
+    db_path = str(tmpdir.join('test.db'))
+    no_progress = lambda done, total: None
+    build_database(corpus_dir, db_path, progress=no_progress)
+    os.remove(os.path.join(corpus_dir, 'journal.pone.0185809.xml'))
+    changed_path = os.path.join(corpus_dir, 'journal.pbio.2002354.xml')
+    with open(changed_path, 'rb') as f:
+        xml = f.read().replace(b'<article-title>', b'<article-title>Updated: ', 1)
+    with open(changed_path, 'wb') as f:
+        f.write(xml)
+
+    counts = build_database(corpus_dir, db_path, incremental=True, progress=no_progress)
+    assert counts == {'new': 0, 'changed': 1, 'removed': 1}
+    titles = article_titles()
+    assert set(titles) == set(Corpus(corpus_dir).dois)
+    assert titles['10.1371/journal.pbio.2002354'].startswith('Updated: ')
+    db.connect()
+    try:
+        # subjects of the removed article are deleted with it
+        article_ids = {article.id for article in PLOSArticle.select()}
+        assert {row.article_id for row in SubjectsPLOSArticle.select()} <= article_ids
+    finally:
+        db.close()
+
+    with pytest.raises(ValueError):
+        build_database(corpus_dir, db_path, sample=2, incremental=True)
@@ -0,0 +1,64 @@
+from . import TESTDATADIR
+from ..corpus import compare_article_pubdate
+from ..corpus.proofs import ProofStore, recheck_interval, MAX_RECHECK_INTERVAL, MIN_RECHECK_INTERVAL
+
+import datetime
+import pytest
+
+START = datetime.datetime(2017, 10, 1)
+
+
+def test_recheck_interval():
+    assert recheck_interval(0) == datetime.timedelta(0)
+    assert recheck_interval(1) == MIN_RECHECK_INTERVAL
+    assert recheck_interval(3) == 4 * MIN_RECHECK_INTERVAL
+    assert recheck_interval(100) == MAX_RECHECK_INTERVAL
+
+
+def test_proof_store(tmpdir):
+    path = str(tmpdir.join('proofs.json'))
+    store = ProofStore(path)
+    assert not store.loaded
+    store.add('10.1371/journal.pone.0000001', pubdate=START - datetime.timedelta(days=30), now=START)
+    store.add('10.1371/journal.pone.0000002', pubdate=START, now=START)
+    store.save()
+
+    store = ProofStore(path)
+    assert store.loaded
+    assert store.dois == ['10.1371/journal.pone.0000001', '10.1371/journal.pone.0000002']
+    assert store.too_old(now=START) == ['10.1371/journal.pone.0000001']
+    # adding a proof again keeps its history
+    store.checked('10.1371/journal.pone.0000001', now=START)
+    store.add('10.1371/journal.pone.0000001', now=START)
+    assert store.entries['10.1371/journal.pone.0000001']['checks'] == 1
+    store.remove('10.1371/journal.pone.0000001')
+    assert '10.1371/journal.pone.0000001' not in store
+
+
+def test_proof_schedule(tmpdir):
+    store = ProofStore(str(tmpdir.join('proofs.json')))
+    for i in range(100):
+        store.add('10.1371/journal.pone.{:07d}'.format(i), now=START)
+    now = START
+    checks_per_run = []
+    # one update a day for two months
+    for day in range(60):
+        due = store.due(now, max_checks=30)
+        checks_per_run.append(len(due))
+        for doi in due:
+            store.checked(doi, now)
+        now += datetime.timedelta(days=1)
+    # every proof is checked on the first days, then less and less often
+    assert checks_per_run[:4] == [30, 30, 30, 30]
+    assert max(checks_per_run) <= 30
+    assert sum(checks_per_run[-30:]) < sum(checks_per_run[:30]) / 2
+    # with new proofs first
+    store.add('10.1371/journal.pone.9999999', now=now)
+    assert store.due(now, max_checks=1) == ['10.1371/journal.pone.9999999']
+
+
+def test_compare_article_pubdate():
+    with pytest.deprecated_call():
+        assert compare_article_pubdate('10.1371/journal.pbio.2002399', directory=TESTDATADIR) is True
+    with pytest.deprecated_call():
+        assert compare_article_pubdate('10.1371/journal.pbio.2002399', days=100000, directory=TESTDATADIR) is False
@@ -0,0 +1,238 @@
+from . import TESTDATADIR
+from ..corpus import (Corpus, check_for_vor_updates, get_dois_needed_list, iter_solr_records,
+                      search_solr_records)
+from ..corpus.download import make_session
+from ..corpus.snapshot import DoiSnapshot, sorted_difference, sorted_union
+from ..corpus.solr import SolrClient, id_batches, MAX_QUERY_LENGTH
+
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+import datetime
+import json
+import threading
+import time
+from urllib.parse import parse_qs, urlparse
+import pytest
+
+JAN_1 = datetime.datetime(2017, 1, 1)
+
+
+class SolrServer(ThreadingMixIn, HTTPServer):
+    """Local stand-in for the Solr search API, with a fixed set of result documents."""
+    daemon_threads = True
+
+    def __init__(self, docs, latency=0):
+        super().__init__(('127.0.0.1', 0), SolrRequestHandler)
+        self.docs = docs
+        self.latency = latency
+        self.failures = 0
+        self.requests = []
+        self.paths = []
+        self.request_lengths = []
+        self.active = 0
+        self.max_active = 0
+        self.lock = threading.Lock()
+
+    @property
+    def docs(self):
+        return self._docs
+
+    @docs.setter
+    def docs(self, docs):
+        self._docs = sorted(docs, key=lambda doc: doc['id'])
+
+    @property
+    def url(self):
+        return 'http://127.0.0.1:{}/search'.format(self.server_address[1])
+
+    @property
+    def terms_url(self):
+        return 'http://127.0.0.1:{}/terms'.format(self.server_address[1])
+
+
+class SolrRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def send_json(self, status, content):
+        body = json.dumps(content).encode('utf8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        server = self.server
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        params = {key: values[-1] for key, values in query.items()}
+        with server.lock:
+            server.requests.append(params)
+            server.request_lengths.append(len(url.query))
+            server.paths.append(url.path)
+            failing = server.failures
+            server.failures = max(failing - 1, 0)
+            server.active += 1
+            server.max_active = max(server.max_active, server.active)
+        try:
+            time.sleep(server.latency)
+            if failing:
+                return self.send_json(503, {})
+            docs = server.docs
+            if url.path == '/terms':
+                terms = []
+                for doc in docs:
+                    terms.extend([doc['id'], 1])
+                return self.send_json(200, {'terms': {'id': terms}})
+            if params.get('q', '').startswith('id:('):
+                ids = set(params['q'][len('id:('):-1].replace('"', '').split(' OR '))
+                docs = [doc for doc in docs if doc['id'] in ids]
+            for fq in query.get('fq', []):
+                if fq.startswith('publication_date:['):
+                    start_date, end_date = fq[len('publication_date:['):-1].split(' TO ')
+                    docs = [doc for doc in docs if start_date <= doc['publication_date'] <= end_date]
+                elif fq.startswith('publication_stage:'):
+                    docs = [doc for doc in docs if doc.get('publication_stage') == fq[len('publication_stage:'):]]
+            rows = int(params.get('rows', 10))
+            cursor_mark = params.get('cursorMark')
+            if cursor_mark is not None:
+                start = 0 if cursor_mark == '*' else int(cursor_mark)
+            else:
+                start = int(params.get('start', 0))
+            page = docs[start:start + rows]
+            content = {'response': {'numFound': len(docs), 'start': start, 'docs': page}}
+            if cursor_mark is not None:
+                content['nextCursorMark'] = str(start + len(page)) if page else cursor_mark
+            self.send_json(200, content)
+        finally:
+            with server.lock:
+                server.active -= 1
+
+
+def make_docs(count, first=0, publication_date='2017-01-01T00:00:00Z'):
+    return [{'id': '10.1371/journal.pone.{:07d}'.format(i), 'publication_date': publication_date}
+            for i in range(first, first + count)]
+
+
+@pytest.fixture
+def solr_server():
+    server = SolrServer(make_docs(2500))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def make_client(server, workers=4):
+    return SolrClient(server.url, workers=workers, rate_limit=None, session=make_session(backoff_factor=0),
+                      terms_url=server.terms_url)
+
+
+def test_search_solr_records(solr_server):
+    dois = search_solr_records(start_date=JAN_1, end_date=datetime.datetime(2017, 1, 31),
+                               client=make_client(solr_server))
+    assert dois == [doc['id'] for doc in solr_server.docs]
+    count_request, *page_requests = solr_server.requests
+    assert count_request['rows'] == '0'
+    assert sorted(int(params['start']) for params in page_requests) == [0, 1000, 2000]
+    assert count_request['fq'] == 'publication_date:[2017-01-01T00:00:00Z TO 2017-01-31T23:59:59Z]'
+    assert search_solr_records(start_date=datetime.datetime(2017, 2, 1), end_date=datetime.datetime(2017, 2, 28),
+                               client=make_client(solr_server)) == []
+
+    # paging can start partway through the results
+    dois = search_solr_records(start_date=JAN_1, start=2400, rows=50, client=make_client(solr_server))
+    assert dois == [doc['id'] for doc in solr_server.docs[2400:]]
+
+
+def test_search_solr_records_cursor(solr_server):
+    dois = search_solr_records(start_date=JAN_1, cursor=True, client=make_client(solr_server))
+    assert dois == [doc['id'] for doc in solr_server.docs]
+    assert [params['cursorMark'] for params in solr_server.requests] == ['*', '1000', '2000', '2500']
+    with pytest.raises(ValueError):
+        search_solr_records(start_date=JAN_1, start=10, cursor=True, client=make_client(solr_server))
+
+
+def test_iter_solr_records(solr_server):
+    client = make_client(solr_server)
+    dois = iter_solr_records(start_date=JAN_1, client=client, rows=100)
+    assert next(dois) in {doc['id'] for doc in solr_server.docs}
+    dois.close()
+    dois = iter_solr_records(start_date=JAN_1, client=client, rows=100)
+    assert sorted(dois) == [doc['id'] for doc in solr_server.docs]
+
+
+def test_solr_retries(solr_server):
+    solr_server.failures = 2
+    dois = search_solr_records(start_date=JAN_1, client=make_client(solr_server))
+    assert len(dois) == len(solr_server.docs)
+
+
+def test_solr_throughput(solr_server):
+    """Pages are requested concurrently, so fetching them takes a fraction of the total latency."""
+    solr_server.latency = 0.1
+    page_count = 20
+    start = time.time()
+    dois = search_solr_records(start_date=JAN_1, rows=len(solr_server.docs) // page_count,
+                               client=make_client(solr_server, workers=8))
+    elapsed = time.time() - start
+    assert len(dois) == len(solr_server.docs)
+    assert solr_server.max_active == 8
+    # one round trip for the count, then ceil(20 / 8) rounds of pages
+    assert elapsed < page_count * solr_server.latency / 2
+
+
+def test_sorted_merges():
+    assert sorted_union(['a', 'c', 'e'], ['b', 'c', 'f'], []) == ['a', 'b', 'c', 'e', 'f']
+    assert sorted_difference(['a', 'b', 'c', 'e', 'f'], ['b', 'd', 'e', 'g']) == ['a', 'c', 'f']
+    assert sorted_difference(['a', 'b'], []) == ['a', 'b']
+
+
+def test_doi_snapshot(solr_server, tmpdir):
+    client = make_client(solr_server)
+    path = str(tmpdir.join('solr_dois.json.gz'))
+    day = datetime.datetime(2017, 1, 1, 12)
+    snapshot = DoiSnapshot(path)
+    added = snapshot.refresh(client=client, now=day)
+    assert added == snapshot.dois == [doc['id'] for doc in solr_server.docs]
+    assert solr_server.paths == ['/terms']
+
+    # only articles published since the last update are requested
+    new_docs = make_docs(10, first=5000, publication_date='2017-01-03T00:00:00Z')
+    solr_server.docs = solr_server.docs[1:] + new_docs
+    snapshot = DoiSnapshot(path)
+    assert snapshot.updated == day
+    added = snapshot.refresh(client=client, now=day + datetime.timedelta(days=3))
+    assert added == [doc['id'] for doc in new_docs]
+    assert '/terms' not in solr_server.paths[1:]
+    assert len(snapshot) == 2510
+
+    # a full fetch reconciles the snapshot with the index
+    snapshot.refresh(client=client, now=day + datetime.timedelta(days=7))
+    assert solr_server.paths[-1] == '/terms'
+    assert DoiSnapshot(path).dois == [doc['id'] for doc in solr_server.docs]
+
+
+def test_get_dois_needed_list(solr_server, tmpdir):
+    corpus_dois = Corpus(TESTDATADIR).dois
+    new_docs = make_docs(5)
+    solr_server.docs = new_docs + [{'id': doi, 'publication_date': '2017-01-01T00:00:00Z'} for doi in corpus_dois]
+    snapshot = DoiSnapshot(str(tmpdir.join('solr_dois.json.gz')))
+    needed = get_dois_needed_list(directory=TESTDATADIR, client=make_client(solr_server), snapshot=snapshot)
+    assert needed == [doc['id'] for doc in new_docs]
+    assert get_dois_needed_list(['b', 'a'] + corpus_dois, directory=TESTDATADIR) == ['a', 'b']
+
+
+def test_check_for_vor_updates(solr_server):
+    for doc in solr_server.docs[::10]:
+        doc['publication_stage'] = 'vor-update-to-uncorrected-proof'
+    proofs = [doc['id'] for doc in solr_server.docs[:1000]]
+    vor_updates = check_for_vor_updates(proofs, client=make_client(solr_server))
+    assert vor_updates == proofs[::10]
+    # far fewer queries than 10 DOIs at a time, each one short enough for a URL
+    assert len(solr_server.requests) == len(id_batches(proofs)) < 1000 / 50
+    assert max(solr_server.request_lengths) < MAX_QUERY_LENGTH + 100
+    assert check_for_vor_updates(proofs[1:10], client=make_client(solr_server)) == []
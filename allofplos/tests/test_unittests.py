@@ -1,9 +1,15 @@
 import datetime
 import os
+import pickle
 import unittest
 
+import lxml.etree as et
+
 from . import TESTDIR, TESTDATADIR
 from .. import Article, Corpus, get_corpus_dir, starterdir
+from ..article import EXTRACT_FIELDS
+from ..elements.license import License
+from ..plos_xpath import get_xpath, xpath_paths
 
 from ..transformations import (doi_to_path, url_to_path, filename_to_doi, url_to_doi,
                                filename_to_url, doi_to_url)
@@ -186,6 +192,79 @@ class TestArticleClass(unittest.TestCase):
         self.assertEqual(article.word_count, 129, 'word_count does not transform correctly for {}'.format(article.doi))
         self.assertEqual(article.license, {'license': 'CC-BY 4.0', 'license_link': 'https://creativecommons.org/licenses/by/4.0/', 'copyright_holder': '', 'copyright_year': 2012}, 'license does not transform correctly for {}'.format(article.doi))
 
+    def test_front_only(self):
+        """Tests that parsing only <front> gives the same metadata as parsing the full article,
+        and that body properties upgrade to the full tree."""
+        for doi in (class_doi, example_doi, example_doi2, example_vor_doi):
+            article = Article(doi, directory=TESTDATADIR)
+            front_article = Article(doi, directory=TESTDATADIR, front_only=True)
+            for attr in ('title', 'journal', 'pubdate', 'revdate', 'type_', 'plostype', 'dtd',
+                         'taxonomy', 'license', 'abstract', 'related_dois', 'contributors'):
+                self.assertEqual(getattr(article, attr), getattr(front_article, attr),
+                                 '{} differs in front_only mode for {}'.format(attr, doi))
+            self.assertEqual(front_article.root.xpath('/article/body'), [])
+            self.assertEqual(article.word_count, front_article.word_count)
+            self.assertEqual(article.counts, front_article.counts)
+            self.assertEqual(len(front_article.root.xpath('/article/body')), 1)
+
+    def test_extract(self):
+        """Tests that `Article.extract()` gives the same values as the article attributes."""
+        for doi in (class_doi, example_doi, example_doi2, example_vor_doi, example_uncorrected_doi):
+            for front_only in (False, True):
+                record = Article(doi, directory=TESTDATADIR, front_only=front_only).extract()
+                article = Article(doi, directory=TESTDATADIR)
+                for field in EXTRACT_FIELDS:
+                    expected = article.get_dates() if field == 'dates' else getattr(article, field)
+                    self.assertEqual(getattr(record, field), expected,
+                                     '{} differs in extract() for {}'.format(field, doi))
+        article = Article(example_vor_doi, directory=TESTDATADIR)
+        record = article.extract(['revdate', 'license', 'doi'])
+        self.assertEqual(record._fields, ('revdate', 'license', 'doi'))
+        self.assertEqual(record.license, article.license)
+        self.assertEqual(pickle.loads(pickle.dumps(record)), record)
+
+    def test_license_unknown_link(self):
+        """Tests that a license link that isn't recognized gives an empty license name."""
+        permissions = et.fromstring('<permissions xmlns:xlink="http://www.w3.org/1999/xlink"><license>'
+                                    '<license-p><ext-link xlink:href="http://example.org/license">'
+                                    'license</ext-link></license-p></license></permissions>')
+        license = License(permissions, example_doi).license
+        self.assertEqual(license['license'], '')
+        self.assertEqual(license['license_link'], '')
+
+    def test_memoized_properties(self):
+        """Tests that property values are stored until the DOI changes, unless memoize is False."""
+        article = Article(example_vor_doi, directory=TESTDATADIR)
+        self.assertIs(article.dates, article.dates)
+        self.assertEqual(article.revdate, article.get_dates()['updated'])
+        self.assertIs(article.contributors, article.contributors)
+        # get_dates() returns a copy that is safe to change
+        article.get_dates(string_=True)
+        self.assertIsInstance(article.pubdate, datetime.datetime)
+        self.assertIs(article.title, article.title)
+        self.assertIn('title', article._cache)
+        article.doi = example_doi
+        self.assertEqual(article._cache, {})
+        self.assertEqual(article.title, Article(example_doi, directory=TESTDATADIR).title)
+
+        article = Article(example_vor_doi, directory=TESTDATADIR, memoize=False)
+        self.assertEqual(article.dates, article.dates)
+        self.assertIsNot(article.dates, article.dates)
+        article.extract()
+        self.assertEqual(article._cache, {})
+
+    def test_get_element_xpath(self):
+        """Tests that registered XPath names, XPath strings and tag sequences find the same elements."""
+        article = Article(example_doi, directory=TESTDATADIR)
+        by_name = article.get_element_xpath('title')
+        self.assertEqual(len(by_name), 1)
+        self.assertEqual(article.get_element_xpath(xpath_paths['title']), by_name)
+        self.assertEqual(article.get_element_xpath(('/', 'article', 'front', 'article-meta',
+                                                    'title-group', 'article-title')), by_name)
+        self.assertEqual(article.get_element_xpath(), article.get_element_xpath('proof'))
+        path = '/article/front/article-meta/article-id'
+        self.assertIs(get_xpath(path), get_xpath(path))
+
     def test_proofs(self):
         """Tests whether uncorrected proofs and VOR updates are being detected correctly."""
         os.environ['PLOS_CORPUS'] = TESTDATADIR
@@ -196,7 +275,8 @@ class TestArticleClass(unittest.TestCase):
         text_file = os.path.join(TESTDIR, 'test.txt')
         proofs1 = get_uncorrected_proofs(proof_filepath=text_file)
         self.assertEqual(proofs1, {example_uncorrected_doi}, 'wrong number uncorrected proofs found.')
-        proofs2 = check_for_uncorrected_proofs(directory=None, proof_filepath=text_file)
+        with self.assertWarns(DeprecationWarning):
+            proofs2 = check_for_uncorrected_proofs(directory=None, proof_filepath=text_file)
         self.assertEqual(proofs2, {example_uncorrected_doi}, 'wrong number uncorrected proofs found.')
         os.remove(text_file)
 
@@ -25,3 +25,29 @@ def dedent(text):
     # dedent everything but the first line
     rest = textwrap.dedent(rest)
     return '\n'.join([first, rest])
+
+
+class memoized_property:
+    """Decorator for a property that is computed once per instance and then stored.
+
+    Values are stored in the instance's `_cache` dictionary, under the property name;
+    clear it to recompute them. Nothing is stored if the instance's `memoize` attribute is
+    False, e.g. to keep memory flat when scanning many articles once each.
+    """
+
+    def __init__(self, func):
+        self.func = func
+        self.name = func.__name__
+        self.__doc__ = func.__doc__
+
+    def __get__(self, instance, owner=None):
+        if instance is None:
+            return self
+        cache = instance._cache
+        try:
+            return cache[self.name]
+        except KeyError:
+            value = self.func(instance)
+            if instance.memoize:
+                cache[self.name] = value
+            return value
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Benchmark the peak memory of scanning a synthetic corpus for article metadata.
+
+Builds corpus directories of copies of the test articles (500 and 5,000 by default), then
+for each size, in a fresh process, measures the peak memory of getting the title, pubdate,
+and word count of every article with
+    * `Corpus.article_generator`, keeping the articles (as code that collects them does)
+    * `Corpus.iter_records()`
+Peak memory is reported both as the maximum resident set size of the process, which
+includes the parsed XML trees, and as the peak of Python allocations from `tracemalloc`.
+`iter_records` should stay flat as the corpus grows.
+Usage: python benchmarks/iter_records_benchmark.py [--articles 500 5000]
+"""
+
+import argparse
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from allofplos import Corpus
+from allofplos.corpus.plos_corpus import listdir_nohidden
+from allofplos.tests import TESTDATADIR
+
+FIELDS = ('title', 'pubdate', 'word_count')
+
+
+def make_corpus(directory, articles):
+    os.makedirs(directory)
+    sources = [fname for fname in listdir_nohidden(TESTDATADIR, include_dir=False)
+               if fname.startswith('journal.')]
+    for i in range(articles):
+        with open(os.path.join(TESTDATADIR, sources[i % len(sources)]), 'rb') as f:
+            xml = f.read()
+        with open(os.path.join(directory, 'journal.pone.{:07d}.xml'.format(i)), 'wb') as f:
+            f.write(xml)
+
+
+def scan(directory, mode):
+    corpus = Corpus(directory, persist_index=False)
+    tracemalloc.start()
+    start = time.time()
+    if mode == 'article_generator':
+        articles = []
+        for article in corpus.article_generator:
+            articles.append(article)
+            (article.title, article.pubdate, article.word_count)
+    else:
+        # the records are kept, as the articles are above
+        records = list(corpus.iter_records(FIELDS))
+        assert len(records) == len(corpus)
+    elapsed = time.time() - start
+    _, python_peak = tracemalloc.get_traced_memory()
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        max_rss //= 1024
+    print(max_rss, python_peak // 1024, elapsed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--articles', type=int, nargs='+', default=[500, 5000],
+                        help='numbers of articles in the corpora')
+    parser.add_argument('--scan', nargs=2, metavar=('DIRECTORY', 'MODE'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.scan:
+        return scan(*args.scan)
+
+    tmpdir = tempfile.mkdtemp()
+    try:
+        print('{:<20}{:>10}{:>16}{:>18}{:>10}'.format('mode', 'articles', 'max RSS (MB)',
+                                                    'Python peak (MB)', 'seconds'))
+        for articles in args.articles:
+            directory = os.path.join(tmpdir, str(articles))
+            make_corpus(directory, articles)
+            for mode in ('article_generator', 'iter_records'):
+                output = subprocess.check_output([sys.executable, __file__, '--scan', directory, mode],
+                                                 universal_newlines=True)
+                max_rss, python_peak, elapsed = output.split()[-3:]
+                print('{:<20}{:>10}{:>16.1f}{:>18.1f}{:>10.1f}'.format(
+                    mode, articles, int(max_rss) / 1024, int(python_peak) / 1024, float(elapsed)))
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+if __name__ == '__main__':
+    main()
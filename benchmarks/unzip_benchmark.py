@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+Benchmark extracting a synthetic corpus zip file.
+
+Builds a zip of `--members` copies of the test articles (50,000 by default), then times
+    * the one-member-at-a-time extraction `unzip_articles` used to do
+    * `extract_zip` with worker processes
+    * `extract_zip` again over the extracted files, when every member is skipped
+Usage: python benchmarks/unzip_benchmark.py [--members 50000] [--processes 4]
+"""
+
+import argparse
+import os
+import shutil
+import tempfile
+import time
+import zipfile
+
+from allofplos.corpus.gdrive import extract_zip
+from allofplos.corpus.plos_corpus import listdir_nohidden
+from allofplos.tests import TESTDATADIR
+
+
+def make_zip(zip_path, members):
+    articles = []
+    for fname in listdir_nohidden(TESTDATADIR, include_dir=False):
+        with open(os.path.join(TESTDATADIR, fname), 'rb') as f:
+            articles.append(f.read())
+    with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zf:
+        for i in range(members):
+            zf.writestr('journal.pone.{:07d}.xml'.format(i), articles[i % len(articles)])
+
+
+def timed(label, func, members):
+    start = time.time()
+    func()
+    elapsed = time.time() - start
+    print('{:<32}{:>8.1f}s{:>10.0f} files/s'.format(label, elapsed, members / elapsed))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--members', type=int, default=50000, help='number of files in the zip')
+    parser.add_argument('--processes', type=int, default=None, help='extraction processes')
+    args = parser.parse_args()
+
+    tmpdir = tempfile.mkdtemp()
+    try:
+        zip_path = os.path.join(tmpdir, 'corpus.zip')
+        print('Writing {} members to {}...'.format(args.members, zip_path))
+        make_zip(zip_path, args.members)
+
+        serial_dir = os.path.join(tmpdir, 'serial')
+
+        def serial():
+            with zipfile.ZipFile(zip_path) as zip_ref:
+                for article in zip_ref.namelist():
+                    zip_ref.extract(article, path=serial_dir)
+        timed('serial ZipFile.extract', serial, args.members)
+
+        parallel_dir = os.path.join(tmpdir, 'parallel')
+        timed('extract_zip', lambda: extract_zip(zip_path, parallel_dir, processes=args.processes),
+              args.members)
+        timed('extract_zip (all up to date)',
+              lambda: extract_zip(zip_path, parallel_dir, processes=args.processes), args.members)
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+if __name__ == '__main__':
+    main()
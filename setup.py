@@ -15,6 +15,8 @@ with open(path.join(here, 'README.rst'), encoding='utf-8') as f:
 
 extras_require = {
     'test': ['pytest>=3.4.2'], 
+    'metadata': ['numpy>=1.9'],
+    'packed': ['zstandard>=0.9'],
 }
 extras_require['all'] = sum(extras_require.values(), [])
 